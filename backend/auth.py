@@ -1,18 +1,18 @@
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, Depends
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Optional, Tuple
+from collections import OrderedDict
 import jwt
 import os
+import time
 from datetime import datetime, timedelta
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 from google.oauth2 import id_token
 from google.auth.transport import requests
 import uuid
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection (client partagé)
+from database import db
 
 # Collection pour les utilisateurs
 users_collection = db['users']
@@ -21,6 +21,11 @@ users_collection = db['users']
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_DAYS = 30
+# Nombre de tokens vérifiés gardés en mémoire (évite un jwt.decode à chaque requête)
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get('TOKEN_CACHE_MAX_ENTRIES', '1024'))
+# Cache des fiches utilisateur (par processus) : /auth/verify et /auth/credits sans lecture Mongo
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '10'))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', '1024'))
 
 # Router
 auth_router = APIRouter(prefix="/auth", tags=["Authentication"])
@@ -48,16 +53,103 @@ def create_token(user_id: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+# Cache des utilisateurs : user_id -> (document, expiration)
+_user_cache: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+
+def cache_user(user: dict):
+    """Écriture dans le cache (après lecture ou modification de l'utilisateur)"""
+    _user_cache[str(user["_id"])] = (user, time.monotonic() + USER_CACHE_TTL_SECONDS)
+    _user_cache.move_to_end(str(user["_id"]))
+    if len(_user_cache) > USER_CACHE_MAX_ENTRIES:
+        _user_cache.popitem(last=False)
+
+def invalidate_user(user_id: str):
+    _user_cache.pop(user_id, None)
+
+async def get_user(user_id: str) -> Optional[dict]:
+    """Fiche utilisateur, depuis le cache si elle y est encore valide"""
+    cached = _user_cache.get(user_id)
+    if cached is not None:
+        user, expires_at = cached
+        if expires_at > time.monotonic():
+            return user
+        del _user_cache[user_id]
+    
+    user = await users_collection.find_one({"_id": user_id})
+    if user:
+        cache_user(user)
+    return user
+
+async def charge_credits(user_id: str, total_cost: float) -> Optional[dict]:
+    """
+    Débiter atomiquement les crédits (seulement si le solde suffit)
+    Retourne la fiche mise à jour, ou None si le solde est insuffisant
+    """
+    user = await users_collection.find_one_and_update(
+        {"_id": user_id, "credits": {"$gte": total_cost}},
+        {
+            "$inc": {"credits": -total_cost, "credits_used": total_cost},
+            "$set": {"updated_at": datetime.utcnow()}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+    if user:
+        # Écriture directe dans le cache : le solde lu juste après est exact
+        cache_user(user)
+    else:
+        invalidate_user(user_id)
+    return user
+
+# Cache LRU des tokens déjà vérifiés : token -> (user_id, expiration)
+_verified_tokens: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
 def verify_token(token: str) -> Optional[str]:
-    """Vérifier un JWT token"""
+    """Vérifier un JWT token (signature vérifiée une seule fois tant que le token est valide)"""
+    cached = _verified_tokens.get(token)
+    if cached is not None:
+        user_id, expires_at = cached
+        if expires_at > time.time():
+            _verified_tokens.move_to_end(token)
+            return user_id
+        del _verified_tokens[token]
+        return None
+
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload.get('user_id')
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
 
+    user_id = payload.get('user_id')
+    if user_id:
+        _verified_tokens[token] = (user_id, float(payload.get('exp', time.time() + 60)))
+        if len(_verified_tokens) > TOKEN_CACHE_MAX_ENTRIES:
+            _verified_tokens.popitem(last=False)
+    return user_id
+
+def user_id_from_authorization(authorization: Optional[str]) -> Optional[str]:
+    """Extraire l'utilisateur d'un header Authorization "Bearer <token>" (None si absent ou invalide)"""
+    if not authorization or not authorization.startswith('Bearer '):
+        return None
+    return verify_token(authorization.split(' ')[1])
+
+async def get_current_user_id(authorization: Optional[str] = Header(None)) -> Optional[str]:
+    """Dépendance : utilisateur authentifié, ou None"""
+    return user_id_from_authorization(authorization)
+
+async def require_user_id(authorization: Optional[str] = Header(None)) -> str:
+    """Dépendance : utilisateur authentifié, sinon 401"""
+    if not authorization or not authorization.startswith('Bearer '):
+        raise HTTPException(status_code=401, detail="Non authentifié")
+    
+    user_id = verify_token(authorization.split(' ')[1])
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token invalide")
+    
+    return user_id
+
 @auth_router.post("/google")
 async def google_auth(request: GoogleAuthRequest):
     """
@@ -111,6 +203,7 @@ async def google_auth(request: GoogleAuthRequest):
                 "updated_at": datetime.utcnow()
             }
             await users_collection.insert_one(user)
+            cache_user(user)
         else:
             # Mettre à jour le nom si nécessaire
             if user.get("name") != google_name:
@@ -124,6 +217,7 @@ async def google_auth(request: GoogleAuthRequest):
                     }
                 )
                 user["name"] = google_name
+            cache_user(user)
         
         # Créer un token JWT
         token = create_token(str(user["_id"]))
@@ -145,21 +239,12 @@ async def google_auth(request: GoogleAuthRequest):
         raise HTTPException(status_code=500, detail=f"Erreur authentification: {str(e)}")
 
 @auth_router.get("/verify")
-async def verify_auth(authorization: Optional[str] = Header(None)):
+async def verify_auth(user_id: str = Depends(require_user_id)):
     """
     Vérifier si l'utilisateur est authentifié
     """
-    if not authorization or not authorization.startswith('Bearer '):
-        raise HTTPException(status_code=401, detail="Non authentifié")
-    
-    token = authorization.split(' ')[1]
-    user_id = verify_token(token)
-    
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Token invalide")
-    
     # Récupérer l'utilisateur
-    user = await users_collection.find_one({"_id": user_id})
+    user = await get_user(user_id)
     
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
@@ -189,28 +274,19 @@ async def deduct_credits(
     units: float = 1.0,
     variant: Optional[str] = None,
     megapixels: Optional[float] = None,
-    authorization: Optional[str] = Header(None)
+    user_id: str = Depends(require_user_id)
 ):
     """
     Déduire des crédits du compte utilisateur
     """
-    if not authorization or not authorization.startswith('Bearer '):
-        raise HTTPException(status_code=401, detail="Non authentifié")
-    
-    token = authorization.split(' ')[1]
-    user_id = verify_token(token)
-    
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Token invalide")
-    
     # Récupérer l'utilisateur
-    user = await users_collection.find_one({"_id": user_id})
+    user = await get_user(user_id)
     
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
     
     # Calculer le coût
-    from credits_config import get_credits_cost, is_model_free
+    from credits_config import get_credits_cost, is_model_free, round_credits
     
     if is_model_free(model_key):
         return {"success": True, "credits_deducted": 0, "credits_remaining": user.get("credits", 0)}
@@ -219,28 +295,14 @@ async def deduct_credits(
     total_cost = cost_per_unit * units
     
     # Arrondir selon le barème
-    import math
-    total_cost = math.ceil(total_cost * 2) / 2  # Arrondir à 0.5 près
+    total_cost = round_credits(total_cost)  # Arrondir à 0.5 près
     
-    # Vérifier si l'utilisateur a assez de crédits
-    current_credits = user.get("credits", 0)
-    if current_credits < total_cost:
+    # Déduire les crédits (refusé si le solde est insuffisant)
+    user = await charge_credits(user_id, total_cost)
+    if not user:
         raise HTTPException(status_code=402, detail="Crédits insuffisants")
     
-    # Déduire les crédits
-    new_credits = current_credits - total_cost
-    new_credits_used = user.get("credits_used", 0) + total_cost
-    
-    await users_collection.update_one(
-        {"_id": user_id},
-        {
-            "$set": {
-                "credits": new_credits,
-                "credits_used": new_credits_used,
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
+    new_credits = user.get("credits", 0)
     
     return {
         "success": True,
@@ -252,54 +314,31 @@ async def deduct_credits_for_tokens(
     model_key: str,
     input_tokens: int,
     output_tokens: int,
-    authorization: Optional[str] = Header(None)
+    user_id: str = Depends(require_user_id)
 ):
     """
     Déduire des crédits du compte utilisateur pour les modèles basés sur les tokens
     """
-    if not authorization or not authorization.startswith('Bearer '):
-        raise HTTPException(status_code=401, detail="Non authentifié")
-    
-    token = authorization.split(' ')[1]
-    user_id = verify_token(token)
-    
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Token invalide")
-    
     # Récupérer l'utilisateur
-    user = await users_collection.find_one({"_id": user_id})
+    user = await get_user(user_id)
     
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
     
     # Calculer le coût basé sur les tokens
-    from credits_config import calculate_token_based_credits
+    from credits_config import calculate_token_based_credits, round_credits
     
     total_cost = calculate_token_based_credits(model_key, input_tokens, output_tokens)
     
     # Arrondir selon le barème
-    import math
-    total_cost = math.ceil(total_cost * 2) / 2  # Arrondir à 0.5 près
+    total_cost = round_credits(total_cost)  # Arrondir à 0.5 près
     
-    # Vérifier si l'utilisateur a assez de crédits
-    current_credits = user.get("credits", 0)
-    if current_credits < total_cost:
+    # Déduire les crédits (refusé si le solde est insuffisant)
+    user = await charge_credits(user_id, total_cost)
+    if not user:
         raise HTTPException(status_code=402, detail="Crédits insuffisants")
     
-    # Déduire les crédits
-    new_credits = current_credits - total_cost
-    new_credits_used = user.get("credits_used", 0) + total_cost
-    
-    await users_collection.update_one(
-        {"_id": user_id},
-        {
-            "$set": {
-                "credits": new_credits,
-                "credits_used": new_credits_used,
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
+    new_credits = user.get("credits", 0)
     
     return {
         "success": True,
@@ -309,21 +348,12 @@ async def deduct_credits_for_tokens(
     }
 
 @auth_router.get("/credits")
-async def get_credits(authorization: Optional[str] = Header(None)):
+async def get_credits(user_id: str = Depends(require_user_id)):
     """
     Récupérer le solde de crédits de l'utilisateur
     """
-    if not authorization or not authorization.startswith('Bearer '):
-        raise HTTPException(status_code=401, detail="Non authentifié")
-    
-    token = authorization.split(' ')[1]
-    user_id = verify_token(token)
-    
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Token invalide")
-    
     # Récupérer l'utilisateur
-    user = await users_collection.find_one({"_id": user_id})
+    user = await get_user(user_id)
     
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
@@ -0,0 +1,83 @@
+"""
+Migration des data URLs base64 vers le stockage de blobs
+
+Parcourt les messages des 14 outils et l'historique des utilisateurs, enregistre
+chaque image/vidéo encore stockée en data URL dans GridFS et remplace la valeur par
+l'URL du blob. Relançable sans risque : les documents déjà migrés ne correspondent
+plus à la requête et un contenu déjà stocké n'est pas dupliqué.
+
+Utilisation :
+    cd backend && python backfill_blobs.py [--dry-run] [--batch-size 100]
+"""
+
+import argparse
+import asyncio
+import logging
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv(Path(__file__).parent / '.env')
+
+import database
+from blob_store import MESSAGE_MEDIA_FIELDS, blob_store
+from db_indexes import TOOL_COLLECTIONS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("backfill_blobs")
+
+DATA_URL_PREFIX = {"$regex": "^data:"}
+
+
+async def migrate(collection, query: dict, fields, dry_run: bool, batch_size: int) -> int:
+    """Externaliser les data URLs des champs donnés ; retourne le nombre de documents modifiés"""
+    migrated = 0
+    cursor = collection.find(query, {field: 1 for field in fields}).batch_size(batch_size)
+    async for document in cursor:
+        changes = {}
+        for field in fields:
+            if field in document:
+                value = document[field] if dry_run else await blob_store.externalize(document[field])
+                if dry_run or value != document[field]:
+                    changes[field] = value
+        if not changes:
+            continue
+        if not dry_run:
+            await collection.update_one({"_id": document["_id"]}, {"$set": changes})
+        migrated += 1
+        if migrated % batch_size == 0:
+            logger.info(f"   {collection.name}: {migrated} documents migrés")
+    return migrated
+
+
+async def main(dry_run: bool, batch_size: int):
+    await database.connect()
+    db = database.db
+    blob_store.configure(db)
+
+    total = 0
+    for tool in TOOL_COLLECTIONS:
+        collection = db[f"{tool}_messages"]
+        query = {"$or": [{field: DATA_URL_PREFIX} for field in MESSAGE_MEDIA_FIELDS]}
+        count = await migrate(collection, query, MESSAGE_MEDIA_FIELDS, dry_run, batch_size)
+        if count:
+            logger.info(f"📦 {collection.name}: {count} messages {'à migrer' if dry_run else 'migrés'}")
+        total += count
+
+    # Historique : result peut être une chaîne, une liste ou un objet
+    history = db['user_history']
+    query = {"$or": [{"result": DATA_URL_PREFIX}, {"result": {"$type": "object"}}]}
+    count = await migrate(history, query, ("result",), dry_run, batch_size)
+    logger.info(f"📦 user_history: {count} entrées {'à examiner' if dry_run else 'migrées'}")
+    total += count
+
+    logger.info(f"✅ Migration terminée : {total} documents {'concernés (dry-run)' if dry_run else 'migrés'}, {blob_store.get_stats()}")
+    database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrer les data URLs base64 vers GridFS")
+    parser.add_argument("--dry-run", action="store_true", help="compter les documents sans rien modifier")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.dry_run, args.batch_size))
@@ -0,0 +1,142 @@
+"""
+Stockage des images et vidéos (GridFS, adressé par contenu)
+Les messages et l'historique gardent une URL courte (/api/blobs/<sha256>) au lieu
+d'une data URL base64 de plusieurs Mo ; les octets sont servis en streaming
+"""
+
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import re
+from typing import Any, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+from http_cache import PUBLIC_IMMUTABLE, etag_matches, not_modified
+
+logger = logging.getLogger(__name__)
+
+BLOB_BUCKET = os.environ.get('BLOB_BUCKET', 'blobs')
+
+# data:<type>[;paramètres];base64,<données>
+DATA_URL = re.compile(r"^data:(?P<type>[\w.+-]+/[\w.+-]+)?(?:;[^,;]+)*;base64,")
+BLOB_HASH = re.compile(r"^[0-9a-f]{64}$")
+# Champs des messages pouvant contenir des data URLs
+MESSAGE_MEDIA_FIELDS = ("image_urls", "video_urls")
+
+# Router
+blob_router = APIRouter(prefix="/blobs", tags=["Blobs"])
+
+
+def blob_url(blob_hash: str) -> str:
+    backend_url = os.environ.get('BACKEND_URL', 'http://localhost:8001')
+    return f"{backend_url}/api/blobs/{blob_hash}"
+
+
+class BlobStore:
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+        self._bucket = None
+        self._files = None
+        self._stats = {"stored": 0, "deduplicated": 0, "bytes_stored": 0}
+
+    def configure(self, database):
+        self._bucket = AsyncIOMotorGridFSBucket(database, bucket_name=self.bucket_name)
+        self._files = database[f"{self.bucket_name}.files"]
+
+    async def _find(self, blob_hash: str) -> Optional[dict]:
+        return await self._files.find_one({"filename": blob_hash}, sort=[("uploadDate", 1)])
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        """Enregistrer des octets (une seule fois par contenu) et retourner leur empreinte"""
+        blob_hash = hashlib.sha256(data).hexdigest()
+        if await self._files.find_one({"filename": blob_hash}, {"_id": 1}):
+            self._stats["deduplicated"] += 1
+            return blob_hash
+        # Deux envois simultanés du même contenu créent deux copies identiques : sans conséquence
+        await self._bucket.upload_from_stream(
+            blob_hash, data, metadata={"content_type": content_type}
+        )
+        self._stats["stored"] += 1
+        self._stats["bytes_stored"] += len(data)
+        return blob_hash
+
+    async def externalize(self, value: Any) -> Any:
+        """Remplacer les data URLs base64 (y compris imbriquées) par des URLs de blobs"""
+        if isinstance(value, str):
+            match = DATA_URL.match(value)
+            if not match:
+                return value
+            try:
+                data = base64.b64decode(value[match.end():], validate=True)
+            except (binascii.Error, ValueError) as e:
+                logger.warning(f"⚠️ Data URL invalide conservée telle quelle: {e}")
+                return value
+            blob_hash = await self.put(data, match.group("type") or "application/octet-stream")
+            return blob_url(blob_hash)
+        if isinstance(value, list):
+            return [await self.externalize(item) for item in value]
+        if isinstance(value, dict):
+            return {key: await self.externalize(item) for key, item in value.items()}
+        return value
+
+    async def externalize_message(self, message: dict) -> dict:
+        """Document de message prêt à insérer : médias en URLs de blobs"""
+        for field in MESSAGE_MEDIA_FIELDS:
+            if message.get(field):
+                message[field] = await self.externalize(message[field])
+        return message
+
+    async def open(self, blob_hash: str):
+        """Retourner (flux de lecture, type de contenu), ou None si le blob n'existe pas"""
+        document = await self._find(blob_hash)
+        if document is None:
+            return None
+        stream = await self._bucket.open_download_stream(document["_id"])
+        return stream, (document.get("metadata") or {}).get("content_type", "application/octet-stream")
+
+    def get_stats(self) -> dict:
+        return dict(self._stats)
+
+
+blob_store = BlobStore(BLOB_BUCKET)
+
+
+@blob_router.api_route("/{blob_hash}", methods=["GET", "HEAD"])
+async def serve_blob(blob_hash: str, request: Request):
+    """Servir un blob en streaming (contenu immuable : cache long et ETag fort)"""
+    if not BLOB_HASH.match(blob_hash):
+        raise HTTPException(status_code=404, detail="Fichier non trouvé")
+
+    etag = f'"{blob_hash}"'
+    if etag_matches(request, etag):
+        return not_modified(etag, PUBLIC_IMMUTABLE)
+
+    opened = await blob_store.open(blob_hash)
+    if opened is None:
+        raise HTTPException(status_code=404, detail="Fichier non trouvé")
+    stream, content_type = opened
+    headers = {
+        "ETag": etag,
+        "Cache-Control": PUBLIC_IMMUTABLE,
+        "Content-Length": str(stream.length),
+    }
+    if request.method == "HEAD":
+        stream.close()
+        return Response(status_code=200, headers=headers, media_type=content_type)
+
+    async def chunks():
+        try:
+            while True:
+                chunk = await stream.readchunk()
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            stream.close()
+
+    return StreamingResponse(chunks(), headers=headers, media_type=content_type)
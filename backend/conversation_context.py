@@ -0,0 +1,74 @@
+"""
+Contexte glissant des conversations
+Garde en mémoire les N derniers messages de chaque session, tenus à jour à chaque
+ajout ; la base n'est relue (N derniers messages seulement) qu'en cas d'absence du cache
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHAT_CONTEXT_MESSAGES = int(os.environ.get('CHAT_CONTEXT_MESSAGES', '10'))
+CHAT_CONTEXT_MAX_SESSIONS = int(os.environ.get('CHAT_CONTEXT_MAX_SESSIONS', '2000'))
+# Un autre processus (worker de jobs) peut ajouter des messages : le tampon est reconstruit au-delà
+CHAT_CONTEXT_TTL_SECONDS = int(os.environ.get('CHAT_CONTEXT_TTL_SECONDS', '300'))
+
+
+def format_message(role: str, content: str) -> str:
+    return f"Utilisateur: {content}" if role == 'user' else f"Assistant: {content}"
+
+
+class ConversationContext:
+    """Tampons des derniers messages formatés, par session (LRU borné)"""
+
+    def __init__(self, messages_collection, max_messages: int, max_sessions: int, ttl_seconds: int):
+        self.messages = messages_collection
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._buffers: "OrderedDict[str, Tuple[Deque[str], float]]" = OrderedDict()
+        self._stats = {"hits": 0, "rebuilds": 0}
+
+    def _cached(self, session_id: str):
+        entry = self._buffers.get(session_id)
+        if entry is None:
+            return None
+        buffer, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._buffers[session_id]
+            return None
+        self._buffers.move_to_end(session_id)
+        return buffer
+
+    def append(self, session_id: str, role: str, content: str):
+        """À appeler après l'insertion d'un message (sans effet si la session n'est pas en cache)"""
+        buffer = self._cached(session_id)
+        if buffer is not None:
+            buffer.append(format_message(role, content))
+
+    async def get(self, session_id: str) -> List[str]:
+        """Derniers messages de la session, du plus ancien au plus récent"""
+        buffer = self._cached(session_id)
+        if buffer is not None:
+            self._stats["hits"] += 1
+            return list(buffer)
+
+        # Absent du cache : seulement les N derniers messages (index session_id + timestamp)
+        self._stats["rebuilds"] += 1
+        recent = await self.messages.find(
+            {"session_id": session_id},
+            {"_id": 0, "role": 1, "content": 1}
+        ).sort("timestamp", -1).limit(self.max_messages).to_list(self.max_messages)
+        buffer = deque((format_message(msg['role'], msg['content']) for msg in reversed(recent)), maxlen=self.max_messages)
+
+        self._buffers[session_id] = (buffer, time.monotonic() + self.ttl_seconds)
+        while len(self._buffers) > self.max_sessions:
+            self._buffers.popitem(last=False)
+        return list(buffer)
+
+    def get_stats(self) -> dict:
+        return {**self._stats, "sessions": len(self._buffers)}
@@ -3,6 +3,10 @@ Configuration du système de crédits
 Barème de consommation des crédits IA
 """
 
+import bisect
+import math
+from typing import Dict
+
 CREDITS_CONFIG = {
     "meta": {
         "description": "Barème de consommation des crédits IA — 500 crédits gratuits par utilisateur = 13€ d'utilisation. Les crédits sont déduits selon le coût réel des API.",
@@ -138,6 +142,95 @@ CREDITS_CONFIG = {
     ]
 }
 
+# ==================== BARÈME COMPILÉ ====================
+# Le barème ci-dessus est compilé une seule fois en tables indexées :
+# dict par clé et variante, bisect sur les paliers de mégapixels, tarifs au token génériques
+
+USD_TO_EUR = 0.95  # Taux de conversion approximatif
+
+_TOKEN_UNITS = {"1M": 1_000_000, "1K": 1_000}
+
+
+class CompiledModel:
+    """Tarif d'un modèle prêt à l'emploi"""
+
+    def __init__(self, config: dict):
+        self.key = config["key"]
+        self.unit = config.get("unit")
+        self.unmetered = bool(config.get("unmetered", False))
+        self.token_based = bool(config.get("token_based", False))
+        self.credits_per_unit = config.get("credits_per_unit", 0)
+
+        # Variantes : dict par nom, la première sert de valeur par défaut
+        self.variants = {v["variant"]: v["credits_per_unit"] for v in config.get("variants", [])}
+        self.default_variant_price = config["variants"][0]["credits_per_unit"] if config.get("variants") else None
+
+        # Paliers : bornes triées pour bisect (le dernier palier couvre tout ce qui dépasse)
+        tiers = sorted(config.get("tiers", []), key=lambda tier: tier["max_megapixels"])
+        self.tier_bounds = [tier["max_megapixels"] for tier in tiers]
+        self.tier_prices = [tier["credits_per_unit"] for tier in tiers]
+
+        # Tarifs au token : tranches (seuil d'input, (prix USD, unité) d'input, (prix USD, unité) d'output)
+        self.token_bands = _compile_token_bands(config.get("pricing_usd", {})) if self.token_based else []
+
+    def cost(self, variant: str = None, megapixels: float = None) -> float:
+        if self.unmetered:
+            return 0
+        if self.variants:
+            return self.variants.get(variant, self.default_variant_price) if variant else self.default_variant_price
+        if self.tier_prices:
+            if megapixels is None:
+                return self.tier_prices[-1]
+            index = bisect.bisect_left(self.tier_bounds, megapixels)
+            return self.tier_prices[min(index, len(self.tier_prices) - 1)]
+        return self.credits_per_unit
+
+    def token_cost_usd(self, input_tokens: int, output_tokens: int) -> float:
+        for threshold, (input_price, input_unit), (output_price, output_unit) in self.token_bands:
+            if input_tokens <= threshold:
+                # Même ordre d'opérations que le barème d'origine : (tokens / unité) * prix
+                input_cost_usd = (input_tokens / input_unit) * input_price
+                output_cost_usd = (output_tokens / output_unit) * output_price
+                return input_cost_usd + output_cost_usd
+        return 0
+
+
+def _compile_token_bands(pricing: dict) -> list:
+    """
+    Convertir les clés du type "input_per_1M_tokens[_low|_high]" en (prix, unité)
+
+    Sans suffixe : une seule tranche. Avec "_low"/"_high" : tranche basse jusqu'à
+    threshold_tokens (inclus) puis tranche haute.
+    """
+    rates = {}
+    for name, price in pricing.items():
+        parts = name.split("_")
+        if len(parts) < 4 or parts[1] != "per" or parts[3] != "tokens":
+            continue
+        direction, unit = parts[0], parts[2]
+        band = parts[4] if len(parts) > 4 else "single"
+        # Le prix n'est pas ramené au token : la division préalable changerait les arrondis flottants
+        rates.setdefault(band, {})[direction] = (price, _TOKEN_UNITS[unit])
+
+    def band(name: str) -> tuple:
+        return rates.get(name, {}).get("input", (0, 1)), rates.get(name, {}).get("output", (0, 1))
+
+    if "single" in rates:
+        return [(float("inf"), *band("single"))]
+    threshold = pricing.get("threshold_tokens", float("inf"))
+    return [(threshold, *band("low")), (float("inf"), *band("high"))]
+
+
+PRICING: Dict[str, CompiledModel] = {model["key"]: CompiledModel(model) for model in CREDITS_CONFIG["models"]}
+EURO_PER_CREDIT = CREDITS_CONFIG["meta"]["euro_per_credit"]
+ROUNDING_STEP = CREDITS_CONFIG["meta"]["rounding"]["step_credit"]
+
+
+def round_credits(total: float) -> float:
+    """Arrondir un coût selon le barème (au 0.5 crédit supérieur)"""
+    return math.ceil(total / ROUNDING_STEP) * ROUNDING_STEP
+
+
 def get_credits_cost(model_key: str, variant: str = None, megapixels: float = None) -> float:
     """
     Calculer le coût en crédits pour un modèle donné
@@ -148,46 +241,15 @@ def get_credits_cost(model_key: str, variant: str = None, megapixels: float = No
         megapixels: Nombre de mégapixels pour image_upscaler
     
     Returns:
-        Nombre de crédits nécessaires
+        Nombre de crédits nécessaires (0 si le modèle est inconnu)
     """
-    for model in CREDITS_CONFIG["models"]:
-        if model["key"] == model_key:
-            # Modèle illimité (gratuit)
-            if model.get("unmetered"):
-                return 0
-            
-            # Modèle avec variantes
-            if "variants" in model:
-                if variant:
-                    for v in model["variants"]:
-                        if v["variant"] == variant:
-                            return v["credits_per_unit"]
-                # Si pas de variante spécifiée, retourner la première
-                return model["variants"][0]["credits_per_unit"]
-            
-            # Modèle avec tiers (image_upscaler)
-            if "tiers" in model:
-                if megapixels is not None:
-                    for tier in model["tiers"]:
-                        if tier.get("or_above") and megapixels >= tier["max_megapixels"]:
-                            return tier["credits_per_unit"]
-                        elif megapixels <= tier["max_megapixels"]:
-                            return tier["credits_per_unit"]
-                # Par défaut, retourner le dernier tier
-                return model["tiers"][-1]["credits_per_unit"]
-            
-            # Modèle simple
-            return model.get("credits_per_unit", 0)
-    
-    # Modèle non trouvé, retourner 0 (gratuit)
-    return 0
+    model = PRICING.get(model_key)
+    return model.cost(variant, megapixels) if model else 0
 
 def is_model_free(model_key: str) -> bool:
     """Vérifier si un modèle est gratuit (illimité)"""
-    for model in CREDITS_CONFIG["models"]:
-        if model["key"] == model_key:
-            return model.get("unmetered", False)
-    return False
+    model = PRICING.get(model_key)
+    return model.unmetered if model else False
 
 def calculate_token_based_credits(model_key: str, input_tokens: int, output_tokens: int) -> float:
     """
@@ -201,38 +263,9 @@ def calculate_token_based_credits(model_key: str, input_tokens: int, output_toke
     Returns:
         Nombre de crédits nécessaires
     """
-    USD_TO_EUR = 0.95  # Taux de conversion approximatif
-    EURO_PER_CREDIT = CREDITS_CONFIG["meta"]["euro_per_credit"]
-    
-    for model in CREDITS_CONFIG["models"]:
-        if model["key"] == model_key and model.get("token_based"):
-            pricing = model.get("pricing_usd", {})
-            
-            if model_key == "chatgpt51":
-                # ChatGPT 5.1: Input $1.25/1M tokens, Output $0.01/1K tokens
-                input_cost_usd = (input_tokens / 1_000_000) * pricing["input_per_1M_tokens"]
-                output_cost_usd = (output_tokens / 1_000) * pricing["output_per_1K_tokens"]
-                total_cost_usd = input_cost_usd + output_cost_usd
-                total_cost_eur = total_cost_usd * USD_TO_EUR
-                credits = total_cost_eur / EURO_PER_CREDIT
-                return round(credits, 2)
-            
-            elif model_key == "gemini3_pro":
-                # Gemini 3 Pro: Prix varie selon le seuil de 200k tokens
-                threshold = pricing["threshold_tokens"]
-                
-                if input_tokens <= threshold:
-                    # Cas A: input ≤ 200k tokens
-                    input_cost_usd = (input_tokens / 1_000_000) * pricing["input_per_1M_tokens_low"]
-                    output_cost_usd = (output_tokens / 1_000) * pricing["output_per_1K_tokens_low"]
-                else:
-                    # Cas B: input > 200k tokens
-                    input_cost_usd = (input_tokens / 1_000) * pricing["input_per_1K_tokens_high"]
-                    output_cost_usd = (output_tokens / 1_000) * pricing["output_per_1K_tokens_high"]
-                
-                total_cost_usd = input_cost_usd + output_cost_usd
-                total_cost_eur = total_cost_usd * USD_TO_EUR
-                credits = total_cost_eur / EURO_PER_CREDIT
-                return round(credits, 2)
+    model = PRICING.get(model_key)
+    if not model or not model.token_based:
+        return 0
     
-    return 0
+    total_cost_eur = model.token_cost_usd(input_tokens, output_tokens) * USD_TO_EUR
+    return round(total_cost_eur / EURO_PER_CREDIT, 2)
@@ -0,0 +1,76 @@
+"""
+Connexion MongoDB partagée
+Un seul client Motor (un pool de connexions, un jeu de threads de surveillance) pour
+tout le backend : server, auth, history, le worker de jobs et les scripts. Ouvert et
+fermé par le lifespan de l'application (ou explicitement par le worker).
+"""
+
+import importlib.util
+import logging
+import os
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+logger = logging.getLogger(__name__)
+
+MONGO_URL = os.environ['MONGO_URL']
+DB_NAME = os.environ['DB_NAME']
+
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '10000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '10000'))
+# 0 : pas de limite (les générations longues n'utilisent pas de requête bloquante)
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '0'))
+MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'primary')
+MONGO_APP_NAME = os.environ.get('MONGO_APP_NAME', 'splendid-backend')
+
+
+def _default_compressors() -> str:
+    # zstd et snappy demandent des paquets optionnels (zstandard, python-snappy) ; zlib est toujours disponible
+    compressors = []
+    if importlib.util.find_spec("zstandard"):
+        compressors.append("zstd")
+    if importlib.util.find_spec("snappy"):
+        compressors.append("snappy")
+    compressors.append("zlib")
+    return ",".join(compressors)
+
+
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS') or _default_compressors()
+
+
+def client_options() -> dict:
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "readPreference": MONGO_READ_PREFERENCE,
+        "compressors": MONGO_COMPRESSORS,
+        "appname": MONGO_APP_NAME,
+    }
+    if MONGO_SOCKET_TIMEOUT_MS:
+        options["socketTimeoutMS"] = MONGO_SOCKET_TIMEOUT_MS
+    return options
+
+
+# Le client ne se connecte qu'à la première opération : les modules peuvent référencer db dès l'import
+client = AsyncIOMotorClient(MONGO_URL, **client_options())
+db = client[DB_NAME]
+
+
+async def connect():
+    """Vérifier la connexion au démarrage (échoue vite si MongoDB est injoignable)"""
+    await client.admin.command("ping")
+    logger.info(
+        f"✅ MongoDB connecté ({DB_NAME}) - pool {MONGO_MIN_POOL_SIZE}-{MONGO_MAX_POOL_SIZE}, "
+        f"compression {MONGO_COMPRESSORS}, lecture {MONGO_READ_PREFERENCE}"
+    )
+
+
+def close():
+    client.close()
+    logger.info("🔌 Connexion MongoDB fermée")
@@ -0,0 +1,102 @@
+"""
+Index MongoDB
+Déclare et vérifie au démarrage les index des collections de sessions, de messages,
+d'historique et d'utilisateurs (les collections techniques - jobs, cache - créent les
+leurs dans leur module)
+"""
+
+import logging
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Code d'erreur MongoDB : index existant avec un autre nom ou d'autres options
+INDEX_OPTIONS_CONFLICT = 85
+
+# Préfixes des paires <outil>_sessions / <outil>_messages
+TOOL_COLLECTIONS = [
+    "nanobanana",
+    "flux_kontext",
+    "kling",
+    "seedream",
+    "grok",
+    "alibaba_wan",
+    "video_upscale",
+    "google_veo",
+    "sora2",
+    "chatgpt5",
+    "image_upscaler",
+    "nanobanana_pro",
+    "gemini3_pro",
+    "chatgpt51",
+]
+
+
+def required_indexes() -> Dict[str, List[IndexModel]]:
+    indexes = {}
+    for tool in TOOL_COLLECTIONS:
+        indexes[f"{tool}_sessions"] = [
+            # Lecture par identifiant (routes de génération, ETag)
+            IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+            # Dernière session d'un utilisateur (routes de création)
+            IndexModel([("user_id", ASCENDING), ("last_updated", DESCENDING)], name="user_id_last_updated"),
+            # Listes des sessions récentes
+            IndexModel([("last_updated", DESCENDING)], name="last_updated"),
+        ]
+        indexes[f"{tool}_messages"] = [
+            # Messages d'une session triés par date (lecture complète, N derniers, comptage, pagination par curseur)
+            IndexModel([("session_id", ASCENDING), ("timestamp", ASCENDING), ("id", ASCENDING)], name="session_id_timestamp_id"),
+        ]
+    indexes["user_history"] = [
+        # Pages d'historique par outil puis tous outils (curseur created_at + _id)
+        IndexModel([("user_id", ASCENDING), ("tool_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_id_tool_id_created_at_id"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_id_created_at_id"),
+    ]
+    indexes["users"] = [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ]
+    return indexes
+
+
+def _key_spec(keys) -> tuple:
+    return tuple((field, int(direction)) for field, direction in keys)
+
+
+async def ensure_indexes(database) -> dict:
+    """
+    Créer les index manquants puis vérifier leur présence
+
+    Un index unique impossible à créer (doublons existants) est signalé sans bloquer
+    le démarrage ; il apparaît dans la liste "missing" du rapport.
+    """
+    failed = []
+    missing = []
+    required = required_indexes()
+
+    for name, models in required.items():
+        collection = database[name]
+        for model in models:
+            try:
+                await collection.create_indexes([model])
+            except OperationFailure as e:
+                if e.code == INDEX_OPTIONS_CONFLICT:
+                    # Même index déjà présent sous un autre nom : la vérification ci-dessous le confirme
+                    continue
+                failed.append(f"{name}.{model.document['name']}")
+                logger.error(f"❌ Index {name}.{model.document['name']} non créé: {e}")
+
+        # Vérification par clés (un index équivalent créé sous un autre nom convient)
+        existing = {_key_spec(info["key"]) for info in (await collection.index_information()).values()}
+        for model in models:
+            if _key_spec(model.document["key"].items()) not in existing:
+                missing.append(f"{name}.{model.document['name']}")
+
+    total = sum(len(models) for models in required.values())
+    if missing:
+        logger.warning(f"⚠️ Index MongoDB manquants ({len(missing)}/{total}): {', '.join(missing)}")
+    else:
+        logger.info(f"✅ Index MongoDB vérifiés : {total} index sur {len(required)} collections")
+    return {"collections": len(required), "indexes": total, "failed": failed, "missing": missing}
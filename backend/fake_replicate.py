@@ -0,0 +1,157 @@
+"""
+Faux fournisseur Replicate pour tester le suivi des predictions en local
+
+Simule les routes de l'API utilisées par le backend et envoie un webhook signé
+à la fin de chaque prediction.
+
+Utilisation :
+    uvicorn fake_replicate:app --port 9000
+    REPLICATE_BASE_URL=http://localhost:9000 \\
+    REPLICATE_WEBHOOK_URL=http://localhost:8001/api/replicate/webhook \\
+    uvicorn server:app --port 8001
+
+Le backend récupère le secret de signature via /v1/webhooks/default/secret.
+Dans les tests (tests/fake_provider.py), l'application est appelée en mémoire et les
+webhooks sont délivrés par webhook_transport.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+
+logger = logging.getLogger(__name__)
+
+# Durée simulée d'une prediction
+FAKE_PREDICTION_SECONDS = float(os.environ.get('FAKE_PREDICTION_SECONDS', '5'))
+# Sortie renvoyée par toutes les predictions
+FAKE_OUTPUT_URL = os.environ.get('FAKE_OUTPUT_URL', 'https://replicate.delivery/fake/output.mp4')
+# Statut final simulé ("succeeded", "failed" ou "canceled")
+FAKE_FINAL_STATUS = os.environ.get('FAKE_FINAL_STATUS', 'succeeded')
+# Statut HTTP renvoyé à la création des predictions (ex: 402, 429, 503) pour simuler une panne
+FAKE_CREATE_ERROR_STATUS = int(os.environ.get('FAKE_CREATE_ERROR_STATUS', '0'))
+# Secret de signature des webhooks (même format que Replicate)
+FAKE_WEBHOOK_SECRET = os.environ.get(
+    'FAKE_REPLICATE_WEBHOOK_SECRET',
+    "whsec_" + base64.b64encode(b"fake-replicate-webhook-secret").decode()
+)
+
+# Transport des webhooks sortants (None : réseau) ; les tests y branchent l'application backend
+webhook_transport = None
+
+app = FastAPI(title="Fake Replicate")
+
+predictions = {}
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def sign_webhook(webhook_id: str, timestamp: str, body: str) -> str:
+    """Signer un webhook comme le fait Replicate (HMAC-SHA256 sur id.timestamp.body)"""
+    secret_bytes = base64.b64decode(FAKE_WEBHOOK_SECRET.split("_", 1)[1])
+    digest = hmac.new(secret_bytes, f"{webhook_id}.{timestamp}.{body}".encode(), hashlib.sha256).digest()
+    return "v1," + base64.b64encode(digest).decode()
+
+
+async def _complete(prediction_id: str, webhook: str = None):
+    await asyncio.sleep(FAKE_PREDICTION_SECONDS)
+    prediction = predictions[prediction_id]
+    prediction["status"] = FAKE_FINAL_STATUS
+    prediction["completed_at"] = _now()
+    if FAKE_FINAL_STATUS == "succeeded":
+        prediction["output"] = FAKE_OUTPUT_URL
+    elif FAKE_FINAL_STATUS == "failed":
+        prediction["error"] = "Fake provider failure"
+
+    if webhook:
+        body = json.dumps(prediction)
+        webhook_id = f"msg_{uuid.uuid4().hex}"
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "webhook-id": webhook_id,
+            "webhook-timestamp": timestamp,
+            "webhook-signature": sign_webhook(webhook_id, timestamp, body),
+        }
+        async with httpx.AsyncClient(transport=webhook_transport) as client:
+            try:
+                await client.post(webhook, content=body, headers=headers, timeout=10)
+            except httpx.HTTPError as e:
+                logger.warning(f"⚠️ Webhook non délivré pour {prediction_id}: {e}")
+
+
+def _create(model: str, version: str, body: dict) -> dict:
+    if FAKE_CREATE_ERROR_STATUS:
+        raise HTTPException(status_code=FAKE_CREATE_ERROR_STATUS, detail="Fake provider error")
+    prediction_id = uuid.uuid4().hex[:26]
+    prediction = {
+        "id": prediction_id,
+        "model": model,
+        "version": version,
+        "status": "starting",
+        "input": body.get("input", {}),
+        "output": None,
+        "logs": "",
+        "error": None,
+        "metrics": {},
+        "created_at": _now(),
+        "started_at": _now(),
+        "completed_at": None,
+        "urls": {},
+    }
+    predictions[prediction_id] = prediction
+    asyncio.create_task(_complete(prediction_id, body.get("webhook")))
+    return prediction
+
+
+@app.get("/v1/models/{owner}/{name}")
+async def get_model(owner: str, name: str):
+    return {
+        "url": f"https://replicate.com/{owner}/{name}",
+        "owner": owner,
+        "name": name,
+        "description": "Fake model",
+        "visibility": "public",
+        "run_count": 0,
+        "latest_version": None,
+    }
+
+
+@app.post("/v1/models/{owner}/{name}/predictions", status_code=201)
+async def create_model_prediction(owner: str, name: str, request: Request):
+    return _create(f"{owner}/{name}", "", await request.json())
+
+
+@app.post("/v1/predictions", status_code=201)
+async def create_prediction(request: Request):
+    body = await request.json()
+    return _create("", body.get("version", ""), body)
+
+
+@app.get("/v1/predictions")
+async def list_predictions():
+    results = sorted(predictions.values(), key=lambda p: p["created_at"], reverse=True)
+    return {"previous": None, "next": None, "results": results[:100]}
+
+
+@app.get("/v1/predictions/{prediction_id}")
+async def get_prediction(prediction_id: str):
+    if prediction_id not in predictions:
+        raise HTTPException(status_code=404, detail="Prediction not found")
+    return predictions[prediction_id]
+
+
+@app.get("/v1/webhooks/default/secret")
+async def get_webhook_secret():
+    return {"key": FAKE_WEBHOOK_SECRET}
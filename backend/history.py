@@ -1,23 +1,18 @@
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from pydantic import BaseModel
 from typing import Optional, List, Any
 from datetime import datetime
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
-import jwt
+from auth import require_user_id
+from blob_store import blob_store
+from pagination import HistoryPage
+from http_cache import etag_matches, history_etag, not_modified, set_cache_headers
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection (client partagé)
+from database import db
 
 # Collection pour l'historique
 history_collection = db['user_history']
 
-# Secret pour JWT
-JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
-JWT_ALGORITHM = 'HS256'
-
 # Router
 history_router = APIRouter(prefix="/history", tags=["History"])
 
@@ -38,30 +33,11 @@ class HistoryEntry(BaseModel):
     metadata: Optional[dict] = None
     created_at: str
 
-def verify_token(token: str) -> Optional[str]:
-    """Vérifier un JWT token"""
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload.get('user_id')
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
-
 @history_router.post("/save")
-async def save_history(request: SaveHistoryRequest, authorization: Optional[str] = Header(None)):
+async def save_history(request: SaveHistoryRequest, user_id: str = Depends(require_user_id)):
     """
     Sauvegarder une entrée dans l'historique de l'utilisateur
     """
-    if not authorization or not authorization.startswith('Bearer '):
-        raise HTTPException(status_code=401, detail="Non authentifié")
-    
-    token = authorization.split(' ')[1]
-    user_id = verify_token(token)
-    
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Token invalide")
-    
     try:
         # Créer l'entrée d'historique
         history_entry = {
@@ -69,7 +45,8 @@ async def save_history(request: SaveHistoryRequest, authorization: Optional[str]
             "tool_id": request.tool_id,
             "tool_name": request.tool_name,
             "prompt": request.prompt,
-            "result": request.result,
+            # Images/vidéos en data URL stockées à part : l'entrée ne garde que leur URL
+            "result": await blob_store.externalize(request.result),
             "metadata": request.metadata or {},
             "created_at": datetime.utcnow()
         }
@@ -86,103 +63,85 @@ async def save_history(request: SaveHistoryRequest, authorization: Optional[str]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
+# Projection du mode summary : sans result (images, vidéos, textes longs) ni metadata
+HISTORY_SUMMARY_PROJECTION = {"result": 0, "metadata": 0}
+
+def serialize_history_entry(entry: dict, summary: bool = False) -> dict:
+    item = {
+        "id": str(entry["_id"]),
+        "tool_id": entry["tool_id"],
+        "tool_name": entry["tool_name"],
+        "prompt": entry["prompt"],
+        "created_at": entry["created_at"].isoformat()
+    }
+    if not summary:
+        item["result"] = entry["result"]
+        item["metadata"] = entry.get("metadata", {})
+    return item
+
+async def history_page(query: dict, page: HistoryPage) -> dict:
+    """Page d'historique (plus récent en premier) avec le curseur de la page suivante"""
+    entries, next_cursor = await page.fetch(
+        history_collection, query, HISTORY_SUMMARY_PROJECTION if page.summary else None
+    )
+    history = [serialize_history_entry(entry, page.summary) for entry in entries]
+
+    result = {
+        "success": True,
+        "history": history,
+        "count": len(history),
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor
+    }
+    if page.include_total:
+        result["total"] = await history_collection.count_documents(query)
+    return result
+
 @history_router.get("/tool/{tool_id}")
-async def get_tool_history(tool_id: str, authorization: Optional[str] = Header(None)):
+async def get_tool_history(
+    tool_id: str,
+    request: Request,
+    response: Response,
+    page: HistoryPage = Depends(),
+    user_id: str = Depends(require_user_id)
+):
     """
-    Récupérer l'historique d'un outil spécifique pour l'utilisateur
+    Récupérer l'historique d'un outil spécifique pour l'utilisateur (paginé)
     """
-    if not authorization or not authorization.startswith('Bearer '):
-        raise HTTPException(status_code=401, detail="Non authentifié")
-    
-    token = authorization.split(' ')[1]
-    user_id = verify_token(token)
-    
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Token invalide")
-    
     try:
-        # Récupérer l'historique pour cet outil
-        cursor = history_collection.find({
-            "user_id": user_id,
-            "tool_id": tool_id
-        }).sort("created_at", -1)  # Plus récent en premier
-        
-        history = []
-        async for entry in cursor:
-            history.append({
-                "id": str(entry["_id"]),
-                "tool_id": entry["tool_id"],
-                "tool_name": entry["tool_name"],
-                "prompt": entry["prompt"],
-                "result": entry["result"],
-                "metadata": entry.get("metadata", {}),
-                "created_at": entry["created_at"].isoformat()
-            })
-        
-        return {
-            "success": True,
-            "history": history,
-            "count": len(history)
-        }
+        query = {"user_id": user_id, "tool_id": tool_id}
+
+        # Historique inchangé (même entrée la plus récente, même nombre) : 304 sans le relire
+        etag = await history_etag(history_collection, query)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        return await history_page(query, page)
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @history_router.get("/all")
-async def get_all_history(authorization: Optional[str] = Header(None)):
+async def get_all_history(page: HistoryPage = Depends(), user_id: str = Depends(require_user_id)):
     """
-    Récupérer tout l'historique de l'utilisateur (tous les outils)
+    Récupérer l'historique de l'utilisateur, tous outils confondus (paginé)
     """
-    if not authorization or not authorization.startswith('Bearer '):
-        raise HTTPException(status_code=401, detail="Non authentifié")
-    
-    token = authorization.split(' ')[1]
-    user_id = verify_token(token)
-    
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Token invalide")
-    
     try:
-        # Récupérer tout l'historique
-        cursor = history_collection.find({
-            "user_id": user_id
-        }).sort("created_at", -1).limit(100)  # Limiter aux 100 dernières entrées
-        
-        history = []
-        async for entry in cursor:
-            history.append({
-                "id": str(entry["_id"]),
-                "tool_id": entry["tool_id"],
-                "tool_name": entry["tool_name"],
-                "prompt": entry["prompt"],
-                "result": entry["result"],
-                "metadata": entry.get("metadata", {}),
-                "created_at": entry["created_at"].isoformat()
-            })
-        
-        return {
-            "success": True,
-            "history": history,
-            "count": len(history)
-        }
+        return await history_page({"user_id": user_id}, page)
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @history_router.delete("/{history_id}")
-async def delete_history_entry(history_id: str, authorization: Optional[str] = Header(None)):
+async def delete_history_entry(history_id: str, user_id: str = Depends(require_user_id)):
     """
     Supprimer une entrée de l'historique
     """
-    if not authorization or not authorization.startswith('Bearer '):
-        raise HTTPException(status_code=401, detail="Non authentifié")
-    
-    token = authorization.split(' ')[1]
-    user_id = verify_token(token)
-    
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Token invalide")
-    
     try:
         # Supprimer l'entrée (seulement si elle appartient à l'utilisateur)
         result = await history_collection.delete_one({
@@ -0,0 +1,71 @@
+"""
+Requêtes conditionnelles (ETag / If-None-Match)
+Les GET de sessions et d'historique sont relus à chaque changement de visibilité de
+l'onglet ; un ETag calculé à partir de quelques champs indexés permet de répondre 304
+sans charger ni sérialiser la liste des messages
+"""
+
+import asyncio
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+
+# Réponses privées (liées à l'utilisateur) : le navigateur les garde mais les revalide à chaque fois
+PRIVATE_REVALIDATE = "private, no-cache"
+# Fichiers adressés par leur contenu : une URL ne change jamais de contenu
+PUBLIC_IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def make_etag(*parts, weak: bool = True) -> str:
+    """ETag à partir de valeurs de version (faible par défaut : il ne hache pas le corps)"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:32]
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def _opaque(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Comparaison faible de If-None-Match (RFC 9110), liste et "*" compris"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(candidate.strip()) for candidate in header.split(",")}
+
+
+def not_modified(etag: str, cache_control: str = PRIVATE_REVALIDATE) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def set_cache_headers(response: Response, etag: str, cache_control: str = PRIVATE_REVALIDATE):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
+
+async def session_etag(sessions, messages, session_id: str) -> str:
+    """
+    Version d'une session : last_updated de la session + nombre de messages
+
+    Le nombre de messages couvre le message utilisateur enregistré avant la génération
+    (last_updated n'est mis à jour qu'à la fin) ; les messages ne sont jamais modifiés.
+    """
+    session, count = await asyncio.gather(
+        sessions.find_one({"id": session_id}, {"_id": 0, "last_updated": 1}),
+        messages.count_documents({"session_id": session_id}),
+    )
+    last_updated: Optional[object] = session.get("last_updated") if session else None
+    return make_etag(session_id, last_updated, count)
+
+
+async def history_etag(collection, query: dict) -> str:
+    """Version d'un historique : entrée la plus récente (high-water mark) + nombre d'entrées"""
+    latest, count = await asyncio.gather(
+        collection.find_one(query, {"_id": 1, "created_at": 1}, sort=[("created_at", -1)]),
+        collection.count_documents(query),
+    )
+    high_water = (latest["_id"], latest.get("created_at")) if latest else None
+    return make_etag(sorted(query.items()), high_water, count)
@@ -0,0 +1,84 @@
+"""
+Client HTTP asynchrone partagé pour télécharger les sorties des fournisseurs
+Une seule instance par processus, avec pool de connexions keep-alive
+"""
+
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Limites du pool (configurables par variables d'environnement)
+HTTP_MAX_CONNECTIONS = int(os.environ.get('HTTP_MAX_CONNECTIONS', '100'))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('HTTP_MAX_KEEPALIVE_CONNECTIONS', '20'))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('HTTP_KEEPALIVE_EXPIRY', '30'))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get('HTTP_MAX_CONNECTIONS_PER_HOST', '10'))
+HTTP_DEFAULT_TIMEOUT = float(os.environ.get('HTTP_DEFAULT_TIMEOUT', '30'))
+HTTP_CHUNK_SIZE = 64 * 1024
+
+_client: Optional[httpx.AsyncClient] = None
+_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+async def start_http_client():
+    """Ouvrir le client partagé (appelé au démarrage de l'application)"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(HTTP_DEFAULT_TIMEOUT),
+            follow_redirects=True,
+        )
+        logger.info(f"🌐 Client HTTP partagé ouvert (max {HTTP_MAX_CONNECTIONS} connexions, {HTTP_MAX_CONNECTIONS_PER_HOST} par hôte)")
+
+
+async def close_http_client():
+    """Fermer le client partagé (appelé à l'arrêt de l'application)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        _host_semaphores.clear()
+        logger.info("🌐 Client HTTP partagé fermé")
+
+
+def get_http_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError("Client HTTP non initialisé (start_http_client n'a pas été appelé)")
+    return _client
+
+
+def _host_semaphore(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(HTTP_MAX_CONNECTIONS_PER_HOST)
+        _host_semaphores[host] = semaphore
+    return semaphore
+
+
+async def stream_download(url: str, timeout: Optional[float] = None) -> AsyncIterator[bytes]:
+    """Télécharger une URL par morceaux, en respectant la limite de connexions par hôte"""
+    client = get_http_client()
+    async with _host_semaphore(url):
+        async with client.stream("GET", url, timeout=timeout or HTTP_DEFAULT_TIMEOUT) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(HTTP_CHUNK_SIZE):
+                yield chunk
+
+
+async def download_bytes(url: str, timeout: Optional[float] = None) -> bytes:
+    """Télécharger le contenu complet d'une URL"""
+    chunks = []
+    async for chunk in stream_download(url, timeout=timeout):
+        chunks.append(chunk)
+    return b"".join(chunks)
@@ -0,0 +1,408 @@
+"""
+Jobs de génération asynchrones
+Une génération soumise en mode asynchrone retourne immédiatement un identifiant de job ;
+le statut et le résultat sont consultables via /api/jobs/{id} ou suivis en direct (SSE),
+uniquement par le demandeur qui a soumis le job
+
+Les jobs sont stockés dans la collection Mongo generation_jobs. Chaque processus API
+exécute lui-même des jobs (JOB_API_WORKER_CONCURRENCY) ; des workers dédiés
+(python worker.py) peuvent s'y ajouter pour augmenter la capacité. Un worker prend
+un bail sur chaque job et le prolonge tant que la génération tourne ; un job dont le
+bail expire (worker arrêté ou planté) est repris par un autre worker.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from pymongo import ASCENDING, ReturnDocument
+
+from scheduler import current_requester, set_requester
+
+logger = logging.getLogger(__name__)
+
+# Durée de conservation d'un job terminé
+JOB_RESULT_TTL_SECONDS = int(os.environ.get('JOB_RESULT_TTL_SECONDS', '3600'))
+# Intervalle des commentaires keep-alive du flux SSE
+JOB_STREAM_HEARTBEAT_SECONDS = int(os.environ.get('JOB_STREAM_HEARTBEAT_SECONDS', '15'))
+# Intervalle de lecture du job pendant un flux SSE
+JOB_STREAM_POLL_SECONDS = float(os.environ.get('JOB_STREAM_POLL_SECONDS', '1'))
+# Durée d'un bail : sans battement de cœur pendant ce délai, le job est repris par un autre worker
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '60'))
+JOB_HEARTBEAT_SECONDS = int(os.environ.get('JOB_HEARTBEAT_SECONDS', '15'))
+# Nombre maximum de tentatives (reprises après plantage comprises)
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+# Attente entre deux recherches de job lorsque la file est vide
+JOB_IDLE_POLL_SECONDS = float(os.environ.get('JOB_IDLE_POLL_SECONDS', '1'))
+# Jobs exécutés en parallèle par un worker
+JOB_WORKER_CONCURRENCY = int(os.environ.get('JOB_WORKER_CONCURRENCY', '4'))
+# Jobs exécutés par le processus API lui-même (0 = l'API ne fait qu'enregistrer les jobs :
+# il faut alors déployer au moins un worker.py, sinon les jobs restent "queued")
+JOB_API_WORKER_CONCURRENCY = int(os.environ.get('JOB_API_WORKER_CONCURRENCY', '4'))
+
+JOB_TERMINAL_STATUSES = ("succeeded", "failed")
+
+jobs_router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+Handler = Callable[[BaseModel], Awaitable[Any]]
+
+
+def _public_job(document: dict) -> dict:
+    """Vue d'un job renvoyée aux clients (sans la requête ni les informations de bail)"""
+    return {
+        "id": document["id"],
+        "tool": document["tool"],
+        "session_id": document.get("session_id"),
+        "status": document["status"],
+        "result": document.get("result"),
+        "error": document.get("error"),
+        "error_status": document.get("error_status"),
+        "attempts": document.get("attempts", 0),
+        "created_at": document["created_at"].isoformat(),
+        "started_at": document["started_at"].isoformat() if document.get("started_at") else None,
+        "completed_at": document["completed_at"].isoformat() if document.get("completed_at") else None,
+    }
+
+
+class JobManager:
+    """
+    File de jobs de génération stockée dans Mongo
+
+    Chaque outil enregistre son handler de génération et son modèle de requête ;
+    un worker exécute ce même handler à partir de la requête enregistrée.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, Tuple[Handler, Type[BaseModel]]] = {}
+        self._collection = None
+
+    def configure(self, database):
+        self._collection = database.generation_jobs
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            raise RuntimeError("File de jobs non configurée (job_manager.configure n'a pas été appelé)")
+        return self._collection
+
+    def register(self, tool: str, handler: Handler, request_model: Type[BaseModel]):
+        self._handlers[tool] = (handler, request_model)
+
+    def handler(self, tool: str) -> Tuple[Handler, Type[BaseModel]]:
+        return self._handlers[tool]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("id", unique=True)
+        await self.collection.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+        await self.collection.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def submit(self, tool: str, request: BaseModel) -> JSONResponse:
+        """Enregistrer un job pour cet outil et retourner une réponse 202 avec son identifiant"""
+        if tool not in self._handlers:
+            raise HTTPException(status_code=400, detail=f"Outil inconnu pour un job: {tool}")
+
+        payload = request.dict()
+        document = {
+            "id": str(uuid.uuid4()),
+            "tool": tool,
+            "session_id": payload.get("session_id"),
+            "requester": current_requester(),
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "created_at": datetime.utcnow(),
+        }
+        await self.collection.insert_one(document)
+        logger.info(f"📥 Job {document['id']} soumis pour {tool}")
+        return job_accepted_response(_public_job(document))
+
+    async def get(self, job_id: str, requester: Optional[str] = None) -> Optional[dict]:
+        """Job par identifiant ; avec `requester`, seulement s'il a été soumis par ce demandeur"""
+        query = {"id": job_id}
+        if requester is not None:
+            query["requester"] = requester
+        document = await self.collection.find_one(query, {"_id": 0, "payload": 0})
+        return _public_job(document) if document else None
+
+    async def watch(self, job_id: str, requester: Optional[str] = None) -> AsyncIterator[dict]:
+        """Produire l'état du job à chaque changement, jusqu'à sa fin"""
+        last_seen = None
+        while True:
+            job = await self.get(job_id, requester)
+            if job is None:
+                return
+            state = (job["status"], job["attempts"])
+            if state != last_seen:
+                last_seen = state
+                yield job
+            if job["status"] in JOB_TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(JOB_STREAM_POLL_SECONDS)
+
+    # Côté worker
+
+    async def claim(self, worker_id: str) -> Optional[dict]:
+        """Prendre un bail sur le plus ancien job en attente (ou dont le bail a expiré)"""
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "queued"},
+                    {"status": "running", "lease_expires_at": {"$lt": now}},
+                ],
+                "attempts": {"$lt": JOB_MAX_ATTEMPTS},
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "lease_owner": worker_id,
+                    "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    "started_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Prolonger le bail ; retourne False si le job a été repris par un autre worker"""
+        result = await self.collection.update_one(
+            {"id": job_id, "lease_owner": worker_id, "status": "running"},
+            {"$set": {
+                "lease_expires_at": datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS),
+                "heartbeat_at": datetime.utcnow(),
+            }},
+        )
+        return result.matched_count == 1
+
+    async def finish(self, job_id: str, worker_id: str, fields: dict):
+        now = datetime.utcnow()
+        await self.collection.update_one(
+            {"id": job_id, "lease_owner": worker_id},
+            {
+                "$set": {
+                    **fields,
+                    "completed_at": now,
+                    "expires_at": now + timedelta(seconds=JOB_RESULT_TTL_SECONDS),
+                    "lease_owner": None,
+                    "lease_expires_at": None,
+                },
+                # La requête (parfois volumineuse : images en data URL) n'est plus utile
+                "$unset": {"payload": ""},
+            },
+        )
+
+    async def release(self, job_id: str, worker_id: str):
+        """Remettre un job en file (arrêt propre du worker) sans compter la tentative"""
+        await self.collection.update_one(
+            {"id": job_id, "lease_owner": worker_id, "status": "running"},
+            {
+                "$set": {"status": "queued", "lease_owner": None, "lease_expires_at": None},
+                "$inc": {"attempts": -1},
+            },
+        )
+
+    async def fail_abandoned(self) -> int:
+        """Marquer en échec les jobs dont le bail a expiré après la dernière tentative autorisée"""
+        now = datetime.utcnow()
+        result = await self.collection.update_many(
+            {
+                "status": "running",
+                "lease_expires_at": {"$lt": now},
+                "attempts": {"$gte": JOB_MAX_ATTEMPTS},
+            },
+            {
+                "$set": {
+                    "status": "failed",
+                    "error": "Le job a été abandonné après plusieurs tentatives",
+                    "error_status": 500,
+                    "completed_at": now,
+                    "expires_at": now + timedelta(seconds=JOB_RESULT_TTL_SECONDS),
+                    "lease_owner": None,
+                    "lease_expires_at": None,
+                },
+                "$unset": {"payload": ""},
+            },
+        )
+        return result.modified_count
+
+    async def get_stats(self) -> dict:
+        counts = {}
+        async for row in self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        return {"jobs": counts}
+
+
+job_manager = JobManager()
+
+
+class JobWorker:
+    """
+    Boucle d'exécution des jobs
+
+    Prend des jobs dans la file (jusqu'à `concurrency` en parallèle), prolonge leur
+    bail pendant l'exécution puis enregistre le résultat.
+    """
+
+    def __init__(self, manager: JobManager, concurrency: int):
+        self.manager = manager
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._stopping = False
+        self._loop_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._loop_task is None and self.concurrency > 0:
+            self._loop_task = asyncio.create_task(self.run())
+
+    async def run(self):
+        logger.info(f"👷 Worker de jobs {self.worker_id} démarré ({self.concurrency} jobs en parallèle)")
+        while not self._stopping:
+            if len(self._tasks) >= self.concurrency:
+                await asyncio.wait(set(self._tasks.values()), return_when=asyncio.FIRST_COMPLETED)
+                continue
+            try:
+                document = await self.manager.claim(self.worker_id)
+                if document is None:
+                    await self.manager.fail_abandoned()
+                    await asyncio.sleep(JOB_IDLE_POLL_SECONDS)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erreur lors de la prise d'un job: {str(e)}")
+                await asyncio.sleep(JOB_IDLE_POLL_SECONDS)
+                continue
+
+            task = asyncio.create_task(self._execute(document))
+            self._tasks[document["id"]] = task
+            task.add_done_callback(lambda _, job_id=document["id"]: self._tasks.pop(job_id, None))
+
+    async def _execute(self, document: dict):
+        job_id = document["id"]
+        if document["attempts"] > 1:
+            logger.info(f"🔁 Reprise du job {job_id} ({document['tool']}), tentative {document['attempts']}")
+        else:
+            logger.info(f"▶️ Job {job_id} ({document['tool']}) pris par {self.worker_id}")
+
+        run_task = asyncio.create_task(self._run_handler(document))
+        try:
+            while True:
+                done, _ = await asyncio.wait({run_task}, timeout=JOB_HEARTBEAT_SECONDS)
+                if done:
+                    break
+                if not await self.manager.heartbeat(job_id, self.worker_id):
+                    logger.warning(f"⚠️ Bail perdu pour le job {job_id}, exécution interrompue")
+                    run_task.cancel()
+                    return
+            fields = run_task.result()
+        except asyncio.CancelledError:
+            run_task.cancel()
+            # Arrêt du worker : le job est remis en file pour un autre worker
+            await asyncio.shield(self.manager.release(job_id, self.worker_id))
+            raise
+
+        await self.manager.finish(job_id, self.worker_id, fields)
+        logger.info(f"✅ Job {job_id} ({document['tool']}) terminé: {fields['status']}")
+
+    async def _run_handler(self, document: dict) -> dict:
+        # La génération est ordonnancée au nom du demandeur d'origine, sans limite de file
+        set_requester(document.get("requester"), background=True)
+        try:
+            handler, request_model = self.manager.handler(document["tool"])
+            result = await handler(request_model(**document["payload"]))
+            result = result.dict() if isinstance(result, BaseModel) else result
+            return {"status": "succeeded", "result": result}
+        except HTTPException as e:
+            return {"status": "failed", "error": str(e.detail), "error_status": e.status_code}
+        except Exception as e:
+            logger.error(f"Erreur lors de l'exécution du job {document['id']}: {str(e)}")
+            return {"status": "failed", "error": str(e), "error_status": 500}
+
+    async def stop(self):
+        """Arrêter de prendre des jobs et remettre en file ceux en cours"""
+        self._stopping = True
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            self._loop_task = None
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Worker intégré au processus API (voir JOB_API_WORKER_CONCURRENCY)
+api_job_worker = JobWorker(job_manager, JOB_API_WORKER_CONCURRENCY)
+
+
+def job_accepted_response(job: dict) -> JSONResponse:
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job["id"],
+            "status": job["status"],
+            "status_url": f"/api/jobs/{job['id']}",
+            "stream_url": f"/api/jobs/{job['id']}/stream",
+        },
+        headers={"Location": f"/api/jobs/{job['id']}"},
+    )
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@jobs_router.get("/{job_id}")
+async def get_job(job_id: str):
+    """Statut et résultat d'un job de génération"""
+    # Le job d'un autre demandeur est traité comme inexistant
+    job = await job_manager.get(job_id, current_requester())
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job non trouvé")
+    return job
+
+
+@jobs_router.get("/{job_id}/stream")
+async def stream_job(job_id: str):
+    """Suivre un job en Server-Sent Events (un événement par changement de statut)"""
+    requester = current_requester()
+    if await job_manager.get(job_id, requester) is None:
+        raise HTTPException(status_code=404, detail="Job non trouvé")
+
+    async def events():
+        updates = job_manager.watch(job_id, requester).__aiter__()
+        next_update = asyncio.ensure_future(updates.__anext__())
+        try:
+            while True:
+                done, _ = await asyncio.wait({next_update}, timeout=JOB_STREAM_HEARTBEAT_SECONDS)
+                if not done:
+                    # Commentaire SSE : garde la connexion ouverte derrière les proxys
+                    yield ": keep-alive\n\n"
+                    continue
+                try:
+                    job = next_update.result()
+                except StopAsyncIteration:
+                    return
+                yield _sse_event(job["status"], job)
+                next_update = asyncio.ensure_future(updates.__anext__())
+        finally:
+            next_update.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
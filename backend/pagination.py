@@ -0,0 +1,165 @@
+"""
+Pagination par curseur (keyset) des messages de session et de l'historique
+Les pages sont lues à partir d'une position (timestamp, id) grâce aux index
+session_id + timestamp + id et user_id [+ tool_id] + created_at + _id, sans skip
+"""
+
+import os
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+SESSION_PAGE_MAX_LIMIT = int(os.environ.get('SESSION_PAGE_MAX_LIMIT', '200'))
+HISTORY_PAGE_DEFAULT_LIMIT = int(os.environ.get('HISTORY_PAGE_DEFAULT_LIMIT', '100'))
+HISTORY_PAGE_MAX_LIMIT = int(os.environ.get('HISTORY_PAGE_MAX_LIMIT', '200'))
+# En-têtes des curseurs de la page renvoyée (exposés au frontend via CORS)
+PAGE_HEADERS = ["X-Page-Before", "X-Page-After", "X-Has-More"]
+# Toujours renvoyés avec une projection : identité et position du message
+MESSAGE_KEY_FIELDS = ("id", "timestamp")
+
+
+def encode_cursor(timestamp: datetime, message_id: str) -> str:
+    return f"{timestamp.isoformat()}|{message_id}"
+
+
+def _parse_timestamp(value: str) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    # Les timestamps sont stockés en UTC sans fuseau
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+class MessagePage:
+    """Paramètres de pagination d'une route /session/{session_id} (dépendance FastAPI)"""
+
+    def __init__(
+        self,
+        before: Optional[str] = Query(None, description="Messages antérieurs à ce curseur, timestamp ISO ou id de message"),
+        after: Optional[str] = Query(None, description="Messages postérieurs à ce curseur, timestamp ISO ou id de message"),
+        limit: Optional[int] = Query(None, ge=1, le=SESSION_PAGE_MAX_LIMIT),
+        fields: Optional[str] = Query(None, description="Champs à renvoyer, séparés par des virgules (ex: id,role,content)"),
+    ):
+        if before and after:
+            raise HTTPException(status_code=400, detail="Utiliser before ou after, pas les deux")
+        self.before = before
+        self.after = after
+        self.limit = limit
+        self.fields = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+
+    @property
+    def paginated(self) -> bool:
+        return bool(self.before or self.after or self.limit)
+
+    async def _position(self, collection, session_id: str, cursor: str) -> Tuple[datetime, Optional[str]]:
+        """Curseur -> (timestamp, id) : "timestamp|id", timestamp seul ou id de message"""
+        timestamp_part, _, message_id = cursor.partition("|")
+        timestamp = _parse_timestamp(timestamp_part)
+        if timestamp is not None:
+            return timestamp, message_id or None
+        message = await collection.find_one({"session_id": session_id, "id": cursor}, {"_id": 0, "timestamp": 1})
+        if not message:
+            raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+        return message["timestamp"], cursor
+
+    async def fetch(self, collection, session_id: str, response: Response, max_messages: Optional[int]) -> List[dict]:
+        """
+        Messages de la page, du plus ancien au plus récent
+
+        Sans paramètre : toute la session (jusqu'à max_messages), comme avant.
+        Avec limit seul ou before : les `limit` messages les plus récents avant le curseur.
+        Avec after : les `limit` messages suivant le curseur.
+        """
+        query = {"session_id": session_id}
+        projection = None
+        if self.fields:
+            projection = {field: 1 for field in (*MESSAGE_KEY_FIELDS, *self.fields)}
+            projection["_id"] = 0
+
+        if not self.paginated:
+            return await collection.find(query, projection).sort("timestamp", 1).to_list(max_messages)
+
+        limit = self.limit or SESSION_PAGE_MAX_LIMIT
+        ascending = bool(self.after)
+        cursor = self.after or self.before
+        if cursor:
+            timestamp, message_id = await self._position(collection, session_id, cursor)
+            operator = "$gt" if ascending else "$lt"
+            if message_id:
+                query["$or"] = [
+                    {"timestamp": {operator: timestamp}},
+                    {"timestamp": timestamp, "id": {operator: message_id}},
+                ]
+            else:
+                query["timestamp"] = {operator: timestamp}
+
+        direction = 1 if ascending else -1
+        # Un message de plus que demandé indique s'il reste une page
+        messages = await collection.find(query, projection).sort(
+            [("timestamp", direction), ("id", direction)]
+        ).limit(limit + 1).to_list(limit + 1)
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if not ascending:
+            messages.reverse()
+
+        if messages:
+            response.headers["X-Page-Before"] = encode_cursor(messages[0]["timestamp"], messages[0]["id"])
+            response.headers["X-Page-After"] = encode_cursor(messages[-1]["timestamp"], messages[-1]["id"])
+        response.headers["X-Has-More"] = "true" if has_more else "false"
+        return messages
+
+
+def projected_response(messages: List[dict], response: Response) -> JSONResponse:
+    """Réponse d'une page projetée (champs partiels : sans validation par le modèle de message)"""
+    headers = {name: value for name, value in response.headers.items() if name != "content-length"}
+    return JSONResponse(jsonable_encoder(messages), headers=headers)
+
+
+class HistoryPage:
+    """Paramètres de pagination de l'historique, du plus récent au plus ancien (dépendance FastAPI)"""
+
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(None, description="next_cursor de la page précédente"),
+        limit: int = Query(HISTORY_PAGE_DEFAULT_LIMIT, ge=1, le=HISTORY_PAGE_MAX_LIMIT),
+        include_total: bool = Query(False, description="Ajouter le nombre total d'entrées"),
+        summary: bool = Query(False, description="Sans result ni metadata (listes légères)"),
+    ):
+        self.cursor = cursor
+        self.limit = limit
+        self.include_total = include_total
+        self.summary = summary
+
+    def keyset(self) -> dict:
+        """Filtre des entrées situées après le curseur (created_at puis _id décroissants)"""
+        if not self.cursor:
+            return {}
+        timestamp_part, _, id_part = self.cursor.partition("|")
+        created_at = _parse_timestamp(timestamp_part)
+        try:
+            entry_id = ObjectId(id_part)
+        except (InvalidId, TypeError):
+            entry_id = None
+        if created_at is None or entry_id is None:
+            raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+        return {"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": entry_id}},
+        ]}
+
+    async def fetch(self, collection, query: dict, projection: Optional[dict] = None) -> Tuple[List[dict], Optional[str]]:
+        """Retourner (entrées de la page, curseur de la page suivante ou None)"""
+        entries = await collection.find({**query, **self.keyset()}, projection).sort(
+            [("created_at", -1), ("_id", -1)]
+        ).limit(self.limit + 1).to_list(self.limit + 1)
+        if len(entries) <= self.limit:
+            return entries, None
+        entries = entries[:self.limit]
+        return entries, encode_cursor(entries[-1]["created_at"], str(entries[-1]["_id"]))
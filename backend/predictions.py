@@ -0,0 +1,356 @@
+"""
+Suivi des predictions Replicate
+Les predictions sont terminées par webhook, sinon par un poller central unique
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Request
+from replicate.webhook import Webhooks, WebhookSigningSecret, WebhookValidationError
+
+import providers
+
+logger = logging.getLogger(__name__)
+
+# URL publique du receveur de webhooks, ex: https://mon-domaine/api/replicate/webhook
+# Sans cette variable, les predictions sont suivies uniquement par polling
+REPLICATE_WEBHOOK_URL = os.environ.get('REPLICATE_WEBHOOK_URL')
+# Secret de signature (whsec_...). S'il est absent, il est récupéré une fois auprès de l'API Replicate
+REPLICATE_WEBHOOK_SECRET = os.environ.get('REPLICATE_WEBHOOK_SECRET')
+# Tolérance sur l'horodatage des webhooks (protection contre le rejeu)
+REPLICATE_WEBHOOK_TOLERANCE_SECONDS = int(os.environ.get('REPLICATE_WEBHOOK_TOLERANCE_SECONDS', '300'))
+# Intervalle du polling de secours lorsque les webhooks sont actifs
+WEBHOOK_FALLBACK_POLL_SECONDS = int(os.environ.get('WEBHOOK_FALLBACK_POLL_SECONDS', '30'))
+
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+
+# Durée de conservation d'un webhook arrivé avant que la requête ne commence à attendre
+EARLY_WEBHOOK_TTL_SECONDS = 600
+
+# Planification du poller central
+POLL_MIN_INTERVAL_SECONDS = float(os.environ.get('POLL_MIN_INTERVAL_SECONDS', '2'))
+POLL_MAX_INTERVAL_SECONDS = float(os.environ.get('POLL_MAX_INTERVAL_SECONDS', '20'))
+# Premier contrôle à cette fraction de la durée typique du modèle
+POLL_FIRST_CHECK_RATIO = float(os.environ.get('POLL_FIRST_CHECK_RATIO', '0.5'))
+# À partir de ce nombre de predictions à contrôler, un seul appel de liste remplace les rechargements
+POLL_BATCH_LIST_MIN = int(os.environ.get('POLL_BATCH_LIST_MIN', '3'))
+POLL_MAX_CONCURRENT_RELOADS = int(os.environ.get('POLL_MAX_CONCURRENT_RELOADS', '8'))
+
+# Durées typiques (secondes) par modèle, affinées ensuite par les durées observées
+MODEL_TYPICAL_SECONDS = {
+    "kwaivgi/kling-v2.1": 150,
+    "bytedance/seedream-4": 30,
+    "xai/grok-2-image": 240,
+    "wan-video/wan-2.5-t2v": 150,
+    "topazlabs/video-upscale": 240,
+}
+MODEL_TYPICAL_SECONDS.update(json.loads(os.environ.get('PREDICTION_TYPICAL_SECONDS', '{}') or '{}'))
+DEFAULT_TYPICAL_SECONDS = 60
+# Poids d'une nouvelle durée observée dans la moyenne glissante
+DURATION_EWMA_ALPHA = 0.2
+
+replicate_router = APIRouter(prefix="/replicate", tags=["Replicate"])
+
+
+def _as_dict(resource) -> dict:
+    # model_dump sous pydantic v2 ; le SDK Replicate 1.x s'appuie encore sur pydantic.v1 (dict)
+    return resource.model_dump() if hasattr(resource, "model_dump") else resource.dict()
+
+
+class TrackedPrediction:
+    """Une prediction en cours dans la table du poller"""
+
+    def __init__(self, prediction, model: str, next_check_at: float):
+        self.prediction = prediction
+        self.model = model
+        self.started_at = time.monotonic()
+        self.next_check_at = next_check_at
+        self.checks = 0
+        self.overdue_checks = 0
+        self.waiters: List[asyncio.Future] = []
+
+
+class PredictionTracker:
+    """
+    Table unique des predictions en cours
+
+    Les predictions sont terminées par webhook quand c'est possible. Sinon un seul
+    poller d'arrière-plan les contrôle par lots, selon un planning adapté à la durée
+    typique de chaque modèle, puis réveille toutes les requêtes qui attendent.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, TrackedPrediction] = {}
+        self._early: Dict[str, Tuple[dict, float]] = {}
+        self._durations: Dict[str, float] = {}
+        self._poller_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # Désactivé dans les workers de jobs : les webhooks arrivent sur les processus API
+        self.use_webhooks = True
+        self._stats = {
+            "list_calls": 0,
+            "reload_calls": 0,
+            "webhook_completions": 0,
+            "poll_completions": 0,
+            "timeouts": 0,
+        }
+
+    @property
+    def webhooks_enabled(self) -> bool:
+        return self.use_webhooks and bool(REPLICATE_WEBHOOK_URL)
+
+    def webhook_params(self) -> dict:
+        if not self.webhooks_enabled:
+            return {}
+        return {"webhook": REPLICATE_WEBHOOK_URL, "webhook_events_filter": ["completed"]}
+
+    def expected_duration(self, model: str) -> float:
+        return self._durations.get(model) or MODEL_TYPICAL_SECONDS.get(model, DEFAULT_TYPICAL_SECONDS)
+
+    def _next_interval(self, tracked: TrackedPrediction) -> float:
+        """Contrôles espacés au début, resserrés à l'approche de la fin attendue"""
+        elapsed = time.monotonic() - tracked.started_at
+        expected = self.expected_duration(tracked.model)
+        if elapsed < expected:
+            interval = max(POLL_MIN_INTERVAL_SECONDS, (expected - elapsed) / 2)
+        else:
+            # Au-delà de la durée attendue : intervalle court puis recul progressif
+            interval = POLL_MIN_INTERVAL_SECONDS * (1.5 ** tracked.overdue_checks)
+            tracked.overdue_checks += 1
+        interval = min(interval, POLL_MAX_INTERVAL_SECONDS)
+        if self.webhooks_enabled:
+            # Le webhook est la voie normale : le polling ne sert que de filet de sécurité
+            interval = max(interval, WEBHOOK_FALLBACK_POLL_SECONDS)
+        return interval
+
+    def _track(self, prediction, model: str) -> TrackedPrediction:
+        tracked = self._inflight.get(prediction.id)
+        if tracked is None:
+            first_check = max(POLL_MIN_INTERVAL_SECONDS, self.expected_duration(model) * POLL_FIRST_CHECK_RATIO)
+            if self.webhooks_enabled:
+                first_check = max(first_check, WEBHOOK_FALLBACK_POLL_SECONDS)
+            tracked = TrackedPrediction(prediction, model, time.monotonic() + first_check)
+            self._inflight[prediction.id] = tracked
+            self._ensure_poller()
+        return tracked
+
+    def _complete(self, tracked: TrackedPrediction):
+        self._inflight.pop(tracked.prediction.id, None)
+        if tracked.prediction.status == "succeeded":
+            duration = time.monotonic() - tracked.started_at
+            previous = self._durations.get(tracked.model)
+            self._durations[tracked.model] = duration if previous is None else (
+                DURATION_EWMA_ALPHA * duration + (1 - DURATION_EWMA_ALPHA) * previous
+            )
+        for future in tracked.waiters:
+            if not future.done():
+                future.set_result(tracked.prediction)
+
+    @staticmethod
+    def _apply(prediction, payload: dict):
+        for field in ("status", "output", "error", "logs", "metrics", "started_at", "completed_at"):
+            if field in payload:
+                setattr(prediction, field, payload[field])
+
+    def resolve(self, payload: dict) -> bool:
+        """Terminer une prediction à partir d'un webhook (retourne False si elle n'est pas suivie ici)"""
+        prediction_id = payload.get("id")
+        if not prediction_id or payload.get("status") not in TERMINAL_STATUSES:
+            return False
+
+        tracked = self._inflight.get(prediction_id)
+        if tracked is None:
+            # Webhook arrivé avant le suivi (ou destiné à un autre processus) : on le garde un moment
+            self._prune_early()
+            self._early[prediction_id] = (payload, time.monotonic())
+            return False
+
+        self._apply(tracked.prediction, payload)
+        self._stats["webhook_completions"] += 1
+        logger.info(f"🔔 Prediction {prediction_id} terminée par webhook: {tracked.prediction.status}")
+        self._complete(tracked)
+        return True
+
+    def _prune_early(self):
+        now = time.monotonic()
+        for prediction_id, (_, received_at) in list(self._early.items()):
+            if now - received_at > EARLY_WEBHOOK_TTL_SECONDS:
+                del self._early[prediction_id]
+
+    async def start(self, model: str, input: dict):
+        """Créer une prediction (avec webhook de fin si configuré) et l'inscrire dans la table"""
+        prediction = await providers.create_prediction(model, input=input, **self.webhook_params())
+        if prediction.status not in TERMINAL_STATUSES:
+            self._track(prediction, model)
+            early = self._early.pop(prediction.id, None)
+            if early:
+                self.resolve(early[0])
+        return prediction
+
+    async def wait(self, prediction, max_wait_seconds: int, model: Optional[str] = None):
+        """
+        Attendre la fin d'une prediction
+
+        Retourne la prediction mise à jour et le temps écoulé en secondes.
+        Si le délai est dépassé, la prediction est retournée dans son état non terminal.
+        """
+        started_at = time.monotonic()
+        if prediction.status in TERMINAL_STATUSES:
+            return prediction, 0
+
+        tracked = self._track(prediction, model or prediction.model)
+        future = asyncio.get_running_loop().create_future()
+        tracked.waiters.append(future)
+        try:
+            prediction = await asyncio.wait_for(future, timeout=max_wait_seconds)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            if future in tracked.waiters:
+                tracked.waiters.remove(future)
+            if not tracked.waiters:
+                self._inflight.pop(tracked.prediction.id, None)
+        return prediction, int(time.monotonic() - started_at)
+
+    # Poller central
+
+    def _ensure_poller(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._poller_task is None or self._poller_task.done():
+            self._poller_task = asyncio.create_task(self._poll_loop())
+        self._wakeup.set()
+
+    async def _poll_loop(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            due = [tracked for tracked in self._inflight.values() if tracked.next_check_at <= now]
+            if due:
+                try:
+                    await self._check_batch(due)
+                except Exception as e:
+                    logger.error(f"Erreur du poller de predictions: {str(e)}")
+                    for tracked in due:
+                        if tracked.next_check_at <= now:
+                            tracked.next_check_at = time.monotonic() + self._next_interval(tracked)
+
+            if self._inflight:
+                sleep_for = max(0.0, min(t.next_check_at for t in self._inflight.values()) - time.monotonic())
+            else:
+                sleep_for = None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=sleep_for)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _check_batch(self, due: List[TrackedPrediction]):
+        remaining = {tracked.prediction.id: tracked for tracked in due}
+
+        if len(remaining) >= POLL_BATCH_LIST_MIN:
+            # Un seul appel de liste rafraîchit toutes les predictions récentes
+            try:
+                client = providers.get_replicate_client()
+                page = await client.predictions.async_list()
+                self._stats["list_calls"] += 1
+                listed_predictions = page.results
+            except Exception as e:
+                # En cas d'échec, on se rabat sur les rechargements individuels
+                logger.warning(f"⚠️ Liste des predictions indisponible: {e}")
+                listed_predictions = []
+            for listed in listed_predictions:
+                tracked = remaining.get(listed.id)
+                if tracked is None:
+                    continue
+                if listed.status == "succeeded" and listed.output is None:
+                    # Sortie absente de la liste : rechargement individuel
+                    continue
+                self._apply(tracked.prediction, _as_dict(listed))
+                del remaining[listed.id]
+                self._after_check(tracked)
+
+        semaphore = asyncio.Semaphore(POLL_MAX_CONCURRENT_RELOADS)
+
+        async def _reload(tracked: TrackedPrediction):
+            async with semaphore:
+                try:
+                    await tracked.prediction.async_reload()
+                    self._stats["reload_calls"] += 1
+                except Exception as e:
+                    logger.warning(f"⚠️ Rechargement de la prediction {tracked.prediction.id} impossible: {e}")
+                self._after_check(tracked)
+
+        await asyncio.gather(*(_reload(tracked) for tracked in remaining.values()))
+
+    def _after_check(self, tracked: TrackedPrediction):
+        tracked.checks += 1
+        if tracked.prediction.status in TERMINAL_STATUSES:
+            self._stats["poll_completions"] += 1
+            elapsed = int(time.monotonic() - tracked.started_at)
+            logger.info(f"Prediction {tracked.prediction.id} terminée après {elapsed}s ({tracked.checks} contrôles): {tracked.prediction.status}")
+            self._complete(tracked)
+        else:
+            tracked.next_check_at = time.monotonic() + self._next_interval(tracked)
+
+    def get_stats(self) -> dict:
+        return {
+            **self._stats,
+            "in_flight": len(self._inflight),
+            "expected_durations": {
+                model: round(self.expected_duration(model), 1)
+                for model in set(MODEL_TYPICAL_SECONDS) | set(self._durations)
+            },
+        }
+
+    async def stop(self):
+        if self._poller_task is not None:
+            self._poller_task.cancel()
+            self._poller_task = None
+
+
+prediction_tracker = PredictionTracker()
+
+_webhook_secret: Optional[WebhookSigningSecret] = None
+
+
+async def get_webhook_secret() -> WebhookSigningSecret:
+    global _webhook_secret
+    if _webhook_secret is None:
+        if REPLICATE_WEBHOOK_SECRET:
+            _webhook_secret = WebhookSigningSecret(key=REPLICATE_WEBHOOK_SECRET)
+        else:
+            client = providers.get_replicate_client()
+            _webhook_secret = await client.webhooks.default.async_secret()
+    return _webhook_secret
+
+
+@replicate_router.post("/webhook")
+async def replicate_webhook(request: Request):
+    """
+    Receveur des webhooks Replicate
+    Vérifie la signature puis réveille la requête qui attend la prediction
+    """
+    body = (await request.body()).decode("utf-8")
+
+    try:
+        secret = await get_webhook_secret()
+        Webhooks.validate(
+            headers=dict(request.headers),
+            body=body,
+            secret=secret,
+            tolerance=REPLICATE_WEBHOOK_TOLERANCE_SECONDS,
+        )
+    except WebhookValidationError as e:
+        logger.warning(f"⚠️ Webhook Replicate rejeté: {e}")
+        raise HTTPException(status_code=401, detail="Signature de webhook invalide")
+    except Exception as e:
+        logger.error(f"Erreur lors de la vérification du webhook: {str(e)}")
+        raise HTTPException(status_code=503, detail="Secret de webhook indisponible")
+
+    payload = json.loads(body)
+    delivered = prediction_tracker.resolve(payload)
+    return {"success": True, "delivered": delivered}
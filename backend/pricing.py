@@ -0,0 +1,81 @@
+"""
+Devis de crédits
+Chiffre plusieurs configurations en un seul appel (page des tarifs, vérification du
+solde avant de lancer une génération) à partir du barème compilé de credits_config
+"""
+
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel, Field
+
+from auth import get_current_user_id, get_user
+from credits_config import PRICING, calculate_token_based_credits, round_credits
+
+# Nombre maximal de configurations par devis
+QUOTE_MAX_ITEMS = 200
+
+# Router
+pricing_router = APIRouter(prefix="/credits", tags=["Credits"])
+
+# Models
+class QuoteItem(BaseModel):
+    model_key: str
+    variant: Optional[str] = None
+    megapixels: Optional[float] = None
+    units: float = 1
+    # Modèles facturés au token
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+class QuoteRequest(BaseModel):
+    items: List[QuoteItem] = Field(..., max_length=QUOTE_MAX_ITEMS)
+
+
+def quote_item(item: QuoteItem) -> dict:
+    """Coût d'une configuration, arrondi comme lors de la déduction réelle"""
+    model = PRICING.get(item.model_key)
+    if model is None:
+        return {"model_key": item.model_key, "error": "Modèle inconnu", "credits": 0}
+
+    if model.unmetered:
+        credits_per_unit, credits = 0, 0
+    elif model.token_based:
+        credits_per_unit = None
+        credits = round_credits(calculate_token_based_credits(item.model_key, item.input_tokens, item.output_tokens))
+    else:
+        credits_per_unit = model.cost(item.variant, item.megapixels)
+        credits = round_credits(credits_per_unit * item.units)
+
+    return {
+        "model_key": item.model_key,
+        "variant": item.variant,
+        "unit": model.unit,
+        "unmetered": model.unmetered,
+        "credits_per_unit": credits_per_unit,
+        "credits": credits,
+    }
+
+
+@pricing_router.post("/quote")
+async def quote(request: QuoteRequest, user_id: Optional[str] = Depends(get_current_user_id)):
+    """
+    Chiffrer une liste de configurations
+
+    Si l'utilisateur est connecté, le solde est renvoyé avec l'indication de ce qui
+    peut être lancé (chaque configuration seule, et l'ensemble)
+    """
+    items = [quote_item(item) for item in request.items]
+    total = sum(item["credits"] for item in items)
+    response = {"items": items, "total_credits": total}
+
+    if user_id:
+        user = await get_user(user_id)
+        if user:
+            balance = user.get("credits", 0)
+            for item in items:
+                item["affordable"] = item["credits"] <= balance
+            response["credits_balance"] = balance
+            response["affordable"] = total <= balance
+
+    return response
@@ -0,0 +1,433 @@
+"""
+Couche d'accès aux fournisseurs IA (Replicate)
+Exécute les appels aux modèles sans bloquer la boucle d'événements
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Union
+
+import httpx
+import replicate
+from replicate.exceptions import ReplicateError
+from replicate.version import Version, Versions
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximum de threads pour le travail bloquant (SDK synchrone, PIL, ...)
+PROVIDER_MAX_WORKERS = int(os.environ.get('PROVIDER_MAX_WORKERS', '32'))
+
+# Versions de modèles imposées par configuration, ex: {"google/nano-banana": "<version_id>"}
+# La valeur "latest" désactive l'épinglage pour ce modèle
+REPLICATE_MODEL_VERSIONS = json.loads(os.environ.get('REPLICATE_MODEL_VERSIONS', '{}') or '{}')
+# Intervalle de rafraîchissement des versions résolues
+REPLICATE_MODEL_REFRESH_SECONDS = int(os.environ.get('REPLICATE_MODEL_REFRESH_SECONDS', '3600'))
+
+# Disjoncteurs : nombre d'erreurs (402/429/5xx) dans la fenêtre avant ouverture
+CIRCUIT_MODEL_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_MODEL_FAILURE_THRESHOLD', '3'))
+CIRCUIT_PROVIDER_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_PROVIDER_FAILURE_THRESHOLD', '6'))
+CIRCUIT_FAILURE_WINDOW_SECONDS = int(os.environ.get('CIRCUIT_FAILURE_WINDOW_SECONDS', '60'))
+# Durée d'ouverture avant les requêtes d'essai, doublée à chaque essai raté
+CIRCUIT_OPEN_SECONDS = int(os.environ.get('CIRCUIT_OPEN_SECONDS', '30'))
+CIRCUIT_MAX_OPEN_SECONDS = int(os.environ.get('CIRCUIT_MAX_OPEN_SECONDS', '300'))
+# Requêtes d'essai simultanées autorisées en semi-ouverture
+CIRCUIT_HALF_OPEN_TRIALS = int(os.environ.get('CIRCUIT_HALF_OPEN_TRIALS', '1'))
+
+
+class InstrumentedExecutor:
+    """Pool de threads borné qui mesure l'attente, la durée et la concurrence des appels"""
+
+    def __init__(self, max_workers: int, name: str):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.queued = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Exécuter une fonction bloquante dans le pool et attendre son résultat"""
+        loop = asyncio.get_running_loop()
+        enqueued_at = time.monotonic()
+        with self._lock:
+            self.submitted += 1
+            self.queued += 1
+
+        def _call():
+            started_at = time.monotonic()
+            with self._lock:
+                self.queued -= 1
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                self.total_wait_seconds += started_at - enqueued_at
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                raise
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+                    self.completed += 1
+                    self.total_run_seconds += time.monotonic() - started_at
+
+        return await loop.run_in_executor(self._executor, _call)
+
+    def stats(self) -> Dict[str, Any]:
+        """Photographie des métriques du pool"""
+        with self._lock:
+            completed = self.completed or 1
+            return {
+                "name": self.name,
+                "max_workers": self.max_workers,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "queued": self.queued,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "avg_wait_seconds": round(self.total_wait_seconds / completed, 4),
+                "avg_run_seconds": round(self.total_run_seconds / completed, 4),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+provider_executor = InstrumentedExecutor(PROVIDER_MAX_WORKERS, "provider")
+
+# Compteurs des appels natifs asynchrones (hors pool de threads)
+_async_calls = {"in_flight": 0, "max_in_flight": 0, "completed": 0, "failed": 0}
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Exécuter du travail bloquant (SDK synchrone, traitement d'image) hors de la boucle"""
+    return await provider_executor.run(func, *args, **kwargs)
+
+
+async def _track_async(coro):
+    _async_calls["in_flight"] += 1
+    _async_calls["max_in_flight"] = max(_async_calls["max_in_flight"], _async_calls["in_flight"])
+    try:
+        result = await coro
+        _async_calls["completed"] += 1
+        return result
+    except Exception:
+        _async_calls["failed"] += 1
+        raise
+    finally:
+        _async_calls["in_flight"] -= 1
+
+
+class CircuitOpenError(Exception):
+    """
+    Levée sans appeler le fournisseur lorsque le disjoncteur est ouvert
+
+    Le message reprend la cause ("402 Insufficient credit", "rate limit", ...) pour que
+    les routes affichent le même message d'erreur qu'après un vrai appel.
+    """
+
+    def __init__(self, name: str, cause: str, retry_in: int):
+        if cause == "402":
+            message = f"402 Insufficient credit ({name} désactivé temporairement, nouvel essai dans {retry_in}s)"
+        elif cause == "429":
+            message = f"Replicate rate limit atteinte ({name} désactivé temporairement, nouvel essai dans {retry_in}s)"
+        else:
+            message = f"Service {name} indisponible après plusieurs erreurs, nouvel essai dans {retry_in}s"
+        super().__init__(message)
+        self.cause = cause
+        self.retry_in = retry_in
+
+
+def classify_provider_error(error: Exception) -> Optional[str]:
+    """Retourner "402", "429" ou "5xx" pour une erreur du fournisseur, None pour une erreur propre à la requête"""
+    if isinstance(error, ReplicateError) and error.status is not None:
+        if error.status in (402, 429):
+            return str(error.status)
+        if error.status >= 500:
+            return "5xx"
+        return None
+    if isinstance(error, (httpx.TransportError, httpx.TimeoutException)):
+        return "5xx"
+    return None
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur fermé / ouvert / semi-ouvert
+
+    S'ouvre après `threshold` erreurs fournisseur dans la fenêtre, répond ensuite
+    immédiatement en erreur, puis laisse passer quelques requêtes d'essai : un
+    succès le referme, un échec le rouvre pour une durée doublée.
+    """
+
+    def __init__(self, name: str, threshold: int):
+        self.name = name
+        self.threshold = threshold
+        self.state = "closed"
+        self._failures: Deque[float] = deque()
+        self._last_cause = "5xx"
+        self._open_seconds = CIRCUIT_OPEN_SECONDS
+        self._opened_at = 0.0
+        self._trials = 0
+        self.rejected = 0
+        self.opened_count = 0
+
+    def before_call(self):
+        if self.state == "open":
+            retry_in = self._opened_at + self._open_seconds - time.monotonic()
+            if retry_in > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self._last_cause, int(retry_in) + 1)
+            self.state = "half_open"
+            self._trials = 0
+            logger.info(f"🔌 Disjoncteur {self.name} semi-ouvert, requête d'essai")
+        if self.state == "half_open":
+            if self._trials >= CIRCUIT_HALF_OPEN_TRIALS:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self._last_cause, 1)
+            self._trials += 1
+
+    def record_success(self):
+        if self.state == "half_open":
+            logger.info(f"🔌 Disjoncteur {self.name} refermé")
+        self.state = "closed"
+        self._failures.clear()
+        self._open_seconds = CIRCUIT_OPEN_SECONDS
+        self._trials = 0
+
+    def record_failure(self, cause: str):
+        now = time.monotonic()
+        self._last_cause = cause
+        if self.state == "half_open":
+            self._open_seconds = min(self._open_seconds * 2, CIRCUIT_MAX_OPEN_SECONDS)
+            self._open(now)
+            return
+        self._failures.append(now)
+        while self._failures and now - self._failures[0] > CIRCUIT_FAILURE_WINDOW_SECONDS:
+            self._failures.popleft()
+        # Crédit épuisé : inutile d'attendre d'autres erreurs
+        if cause == "402" or len(self._failures) >= self.threshold:
+            self._open(now)
+
+    def _open(self, now: float):
+        self.state = "open"
+        self._opened_at = now
+        self._failures.clear()
+        self.opened_count += 1
+        logger.warning(f"🔌 Disjoncteur {self.name} ouvert ({self._last_cause}) pour {self._open_seconds}s")
+
+    def release_trial(self):
+        # Essai terminé sans verdict sur le fournisseur (erreur propre à la requête)
+        if self.state == "half_open" and self._trials > 0:
+            self._trials -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "recent_failures": len(self._failures),
+            "last_cause": self._last_cause,
+            "opened_count": self.opened_count,
+            "rejected": self.rejected,
+        }
+
+
+provider_breaker = CircuitBreaker("Replicate", CIRCUIT_PROVIDER_FAILURE_THRESHOLD)
+_model_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def _model_breaker(model: str) -> CircuitBreaker:
+    breaker = _model_breakers.get(model)
+    if breaker is None:
+        breaker = _model_breakers[model] = CircuitBreaker(model, CIRCUIT_MODEL_FAILURE_THRESHOLD)
+    return breaker
+
+
+async def _guarded(model: str, call: Callable[[], Awaitable[Any]]) -> Any:
+    """Exécuter un appel fournisseur derrière les disjoncteurs du fournisseur et du modèle"""
+    breakers = (provider_breaker, _model_breaker(model))
+    provider_breaker.before_call()
+    try:
+        breakers[1].before_call()
+    except CircuitOpenError:
+        provider_breaker.release_trial()
+        raise
+    try:
+        result = await call()
+    except Exception as e:
+        cause = classify_provider_error(e)
+        for breaker in breakers:
+            if cause:
+                breaker.record_failure(cause)
+            else:
+                breaker.release_trial()
+        raise
+    for breaker in breakers:
+        breaker.record_success()
+    return result
+
+
+_replicate_client: Optional[replicate.Client] = None
+
+
+def get_replicate_client() -> replicate.Client:
+    """Client Replicate partagé par tout le processus"""
+    global _replicate_client
+    if _replicate_client is None:
+        _replicate_client = replicate.Client(api_token=os.environ.get('REPLICATE_API_TOKEN'))
+    return _replicate_client
+
+
+class ModelVersionRegistry:
+    """
+    Registre des versions de modèles Replicate
+
+    Chaque modèle est résolu une seule fois (puis rafraîchi périodiquement) afin
+    d'éviter la résolution de la dernière version à chaque génération.
+    """
+
+    def __init__(self, overrides: Dict[str, str], refresh_seconds: int):
+        self.overrides = overrides
+        self.refresh_seconds = refresh_seconds
+        self._versions: Dict[str, Optional[Version]] = {}
+        self._resolved_at: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def _fetch(self, model: str) -> Optional[Version]:
+        client = get_replicate_client()
+        pinned = self.overrides.get(model)
+        if pinned == "latest":
+            return None
+        if pinned:
+            owner, name = model.split("/", 1)
+            return await Versions(client, model=(owner, name)).async_get(pinned)
+        replicate_model = await client.models.async_get(model)
+        return replicate_model.latest_version
+
+    async def resolve(self, model: str) -> Union[Version, str]:
+        """Retourner la version épinglée du modèle, ou son nom si aucune version n'est disponible"""
+        if model not in self._versions:
+            lock = self._locks.setdefault(model, asyncio.Lock())
+            async with lock:
+                if model not in self._versions:
+                    await self.refresh(model)
+        return self._versions.get(model) or model
+
+    async def refresh(self, model: str):
+        try:
+            version = await self._fetch(model)
+            if version is not None and self._versions.get(model) is not version:
+                logger.info(f"📌 Modèle {model} épinglé sur la version {version.id}")
+            self._versions[model] = version
+        except Exception as e:
+            # On conserve la version connue (ou le nom du modèle) plutôt que de bloquer la génération
+            logger.warning(f"⚠️ Impossible de résoudre la version de {model}: {e}")
+            self._versions.setdefault(model, None)
+        self._resolved_at[model] = time.monotonic()
+
+    def version_id(self, model: str) -> Optional[str]:
+        version = self._versions.get(model)
+        return version.id if version is not None else None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            for model in list(self._versions):
+                await self.refresh(model)
+
+    def start(self):
+        if self._refresh_task is None and self.refresh_seconds > 0:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+    def snapshot(self) -> Dict[str, Optional[str]]:
+        return {model: (version.id if version else None) for model, version in self._versions.items()}
+
+
+model_registry = ModelVersionRegistry(REPLICATE_MODEL_VERSIONS, REPLICATE_MODEL_REFRESH_SECONDS)
+
+
+async def _run(model: str, input: dict) -> Any:
+    client = get_replicate_client()
+    if hasattr(client, "async_run"):
+        ref = await model_registry.resolve(model)
+        return await _guarded(model, lambda: _track_async(client.async_run(ref, input=input)))
+    return await _guarded(model, lambda: run_blocking(client.run, model, input=input))
+
+
+async def run_model(model: str, input: dict) -> Any:
+    """
+    Lancer un modèle Replicate et attendre sa sortie sans bloquer la boucle
+
+    Utilise le client asynchrone natif du SDK lorsqu'il est disponible,
+    sinon le pool de threads borné.
+    """
+    return await _run(model, input)
+
+
+async def run_text_model(model: str, input: dict) -> str:
+    """Lancer un modèle de texte et concaténer la sortie (liste ou itérateur de chaînes)"""
+    client = get_replicate_client()
+    if hasattr(client, "async_run"):
+        output = await _run(model, input)
+        if hasattr(output, "__aiter__"):
+            return "".join([str(item) async for item in output])
+        return _join_output(output)
+
+    def _run_and_collect():
+        # L'itérateur synchrone fait des appels réseau : on le consomme dans le thread
+        return _join_output(client.run(model, input=input))
+
+    return await _guarded(model, lambda: run_blocking(_run_and_collect))
+
+
+async def create_prediction(model: str, input: dict, **params):
+    """Créer une prediction Replicate sur la version épinglée du modèle"""
+    client = get_replicate_client()
+    ref = await model_registry.resolve(model)
+    if isinstance(ref, Version):
+        return await _guarded(model, lambda: _track_async(client.predictions.async_create(version=ref, input=input, **params)))
+    return await _guarded(model, lambda: _track_async(client.predictions.async_create(model=model, input=input, **params)))
+
+
+def _join_output(output: Any) -> str:
+    if output is None:
+        return ""
+    if isinstance(output, str):
+        return output
+    return "".join(str(item) for item in output)
+
+
+def get_provider_stats() -> Dict[str, Any]:
+    """Métriques de la couche fournisseur (appels asynchrones et pool de threads)"""
+    return {
+        "async_calls": dict(_async_calls),
+        "executor": provider_executor.stats(),
+        "model_versions": model_registry.snapshot(),
+        "circuit_breakers": {
+            "provider": provider_breaker.stats(),
+            "models": {model: breaker.stats() for model, breaker in _model_breakers.items()},
+        },
+    }
+
+
+def shutdown_providers():
+    provider_executor.shutdown()
@@ -0,0 +1,141 @@
+"""
+Cache des résultats de génération (opt-in)
+Une requête identique (même modèle, même version, mêmes entrées, même seed) renvoie le
+résultat déjà produit au lieu de relancer une génération payante
+
+Deux niveaux : un LRU borné en mémoire, puis la collection Mongo generation_cache
+(index TTL) partagée entre les processus. Le cache conserve les URLs de sortie
+Replicate, qui expirent au bout d'une heure : une entrée doit disparaître avant son
+URL, avec assez de marge pour que la route ait le temps de la télécharger.
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+import providers
+from singleflight import flight_key
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', '256'))
+# Durée de vie des URLs de sortie Replicate
+REPLICATE_OUTPUT_URL_LIFETIME_SECONDS = 3600
+# Nettement sous REPLICATE_OUTPUT_URL_LIFETIME_SECONDS (un succès tardif renverrait une URL expirée)
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get('RESULT_CACHE_TTL_SECONDS', '3000'))
+
+
+def _storable(output: Any) -> Any:
+    """Sortie du SDK (FileOutput, itérateurs, ...) convertie en valeurs JSON simples"""
+    if output is None or isinstance(output, (str, int, float, bool)):
+        return output
+    if isinstance(output, dict):
+        return {key: _storable(value) for key, value in output.items()}
+    if isinstance(output, (list, tuple)):
+        return [_storable(item) for item in output]
+    return str(output)
+
+
+class ResultCache:
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        if ttl_seconds >= REPLICATE_OUTPUT_URL_LIFETIME_SECONDS:
+            logger.warning(
+                f"⚠️ RESULT_CACHE_TTL_SECONDS={ttl_seconds} : les URLs Replicate expirent au bout de "
+                f"{REPLICATE_OUTPUT_URL_LIFETIME_SECONDS}s, le cache pourrait renvoyer des URLs expirées"
+            )
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._collection = None
+        self._stats = {"memory_hits": 0, "mongo_hits": 0, "misses": 0, "bypassed": 0}
+
+    def configure(self, database):
+        self._collection = database.generation_cache
+
+    async def ensure_indexes(self):
+        if self._collection is not None:
+            await self._collection.create_index("key", unique=True)
+            await self._collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def key(self, model: str, inputs: dict) -> str:
+        # La version du modèle fait partie de la clé : une nouvelle version invalide le cache
+        await providers.model_registry.resolve(model)
+        return flight_key(model, {"version": providers.model_registry.version_id(model), "inputs": inputs})
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.monotonic():
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return value
+            del self._memory[key]
+
+        if self._collection is not None:
+            document = await self._collection.find_one({"key": key, "expires_at": {"$gt": datetime.utcnow()}})
+            if document is not None:
+                remaining = (document["expires_at"] - datetime.utcnow()).total_seconds()
+                self._remember(key, document["output"], remaining)
+                self._stats["mongo_hits"] += 1
+                return document["output"]
+
+        self._stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, model: str, output: Any):
+        self._remember(key, output, self.ttl_seconds)
+        if self._collection is not None:
+            await self._collection.update_one(
+                {"key": key},
+                {"$set": {
+                    "key": key,
+                    "model": model,
+                    "output": output,
+                    "created_at": datetime.utcnow(),
+                    "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl_seconds),
+                }},
+                upsert=True,
+            )
+
+    def _remember(self, key: str, value: Any, ttl_seconds: float):
+        self._memory[key] = (value, time.monotonic() + ttl_seconds)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def fetch(self, model: str, inputs: dict, generate: Callable[[], Awaitable[Any]],
+                    use_cache: bool = False, force_regenerate: bool = False) -> Tuple[Any, bool]:
+        """
+        Retourner (sortie, depuis_le_cache)
+
+        Sans use_cache, la génération est toujours lancée et rien n'est stocké.
+        Avec force_regenerate, le cache n'est pas lu mais le nouveau résultat le remplace.
+        """
+        if not use_cache:
+            self._stats["bypassed"] += 1
+            return await generate(), False
+
+        key = await self.key(model, inputs)
+        if not force_regenerate:
+            cached = await self.get(key)
+            if cached is not None:
+                logger.info(f"⚡ Résultat {model} servi depuis le cache ({key[:12]})")
+                return cached, True
+
+        output = _storable(await generate())
+        if output:
+            try:
+                await self.set(key, model, output)
+            except Exception as e:
+                logger.warning(f"⚠️ Impossible d'enregistrer le résultat en cache: {e}")
+        return output, False
+
+    def get_stats(self) -> dict:
+        return {**self._stats, "memory_entries": len(self._memory)}
+
+
+result_cache = ResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS)
@@ -0,0 +1,268 @@
+"""
+Ordonnanceur des générations
+Limite le nombre de générations simultanées par modèle (clés de CREDITS_CONFIG["models"]),
+sert les files d'attente équitablement entre utilisateurs et refuse les requêtes
+(429 + Retry-After) lorsque la file d'un modèle est pleine
+"""
+
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional
+
+from fastapi import Header, HTTPException, Request
+
+from credits_config import CREDITS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Générations simultanées par modèle (par processus), ex: {"sora_2": 2, "google_veo_3_1": 2}
+MODEL_CONCURRENCY_DEFAULTS = {
+    "chatgpt": 8,
+    "topaz_video_upscale": 2,
+    "flux_kontext_pro": 4,
+    "alibaba_wan_2_5": 3,
+    "grok_2_image": 3,
+    "seedream_4": 4,
+    "image_upscaler": 4,
+    "kling_ai_v2_1": 3,
+    "sora_2": 2,
+    "nano_banana": 6,
+    "google_veo_3_1": 2,
+    "nano_banana_pro": 4,
+    "gemini3_pro": 6,
+    "chatgpt51": 8,
+}
+MODEL_CONCURRENCY_LIMITS = json.loads(os.environ.get('MODEL_CONCURRENCY_LIMITS', '{}') or '{}')
+MODEL_CONCURRENCY_DEFAULT = int(os.environ.get('MODEL_CONCURRENCY_DEFAULT', '4'))
+# Taille maximale de la file d'attente d'un modèle, puis par utilisateur
+MODEL_QUEUE_MAX = int(os.environ.get('MODEL_QUEUE_MAX', '20'))
+MODEL_QUEUE_MAX_PER_USER = int(os.environ.get('MODEL_QUEUE_MAX_PER_USER', '3'))
+# Adresses des reverse proxies (séparées par des virgules) dont on accepte X-Forwarded-For ; vide : jamais
+TRUSTED_PROXIES = {ip.strip() for ip in os.environ.get('TRUSTED_PROXIES', '').split(",") if ip.strip()}
+
+# Durées typiques d'une génération (secondes), affinées ensuite par les durées observées
+MODEL_TYPICAL_SECONDS = {
+    "chatgpt": 10,
+    "topaz_video_upscale": 240,
+    "flux_kontext_pro": 20,
+    "alibaba_wan_2_5": 150,
+    "grok_2_image": 30,
+    "seedream_4": 30,
+    "image_upscaler": 30,
+    "kling_ai_v2_1": 150,
+    "sora_2": 180,
+    "nano_banana": 20,
+    "google_veo_3_1": 120,
+    "nano_banana_pro": 40,
+    "gemini3_pro": 20,
+    "chatgpt51": 15,
+}
+DURATION_EWMA_ALPHA = 0.2
+
+_slot_tokens = itertools.count()
+
+# Demandeur courant ("user:<id>" ou "ip:<adresse>"), défini par la dépendance identify_requester
+_requester: ContextVar[str] = ContextVar("requester", default="anonymous")
+# Exécution en arrière-plan (worker de jobs) : on attend une place sans limite de file
+_background: ContextVar[bool] = ContextVar("background", default=False)
+
+
+class QueueFullError(Exception):
+    def __init__(self, model_key: str, retry_after: int):
+        super().__init__(f"File d'attente pleine pour {model_key}")
+        self.model_key = model_key
+        self.retry_after = retry_after
+
+
+class ModelLane:
+    """Places d'exécution et file d'attente équitable d'un modèle"""
+
+    def __init__(self, key: str, limit: int, typical_seconds: float):
+        self.key = key
+        self.limit = limit
+        self.avg_seconds = typical_seconds
+        self.running: Dict[int, float] = {}
+        self._queues: Dict[str, Deque[asyncio.Future]] = {}
+        # Tour de rôle des demandeurs ayant au moins une requête en attente
+        self._turns: Deque[str] = deque()
+        self.queued = 0
+        self.rejected = 0
+
+    def _seconds_until_free_slot(self) -> float:
+        if len(self.running) < self.limit:
+            return 0.0
+        now = time.monotonic()
+        return max(1.0, min(self.avg_seconds - (now - started) for started in self.running.values()))
+
+    def retry_after(self, requester: str) -> int:
+        """Estimer le délai avant qu'une nouvelle requête de ce demandeur puisse entrer en file"""
+        wait = self._seconds_until_free_slot()
+        if requester in self._queues and len(self._queues[requester]) >= MODEL_QUEUE_MAX_PER_USER:
+            # Il faut que la première requête en attente du demandeur démarre
+            rank = self._turns.index(requester) if requester in self._turns else 0
+            wait += (rank // self.limit) * self.avg_seconds
+        return max(1, math.ceil(wait))
+
+    async def acquire(self, requester: str, bounded: bool) -> int:
+        if len(self.running) < self.limit and self.queued == 0:
+            return self._start()
+
+        user_queue = self._queues.get(requester)
+        if bounded and (self.queued >= MODEL_QUEUE_MAX
+                        or (user_queue is not None and len(user_queue) >= MODEL_QUEUE_MAX_PER_USER)):
+            self.rejected += 1
+            raise QueueFullError(self.key, self.retry_after(requester))
+
+        future = asyncio.get_running_loop().create_future()
+        if user_queue is None:
+            user_queue = self._queues[requester] = deque()
+            self._turns.append(requester)
+        user_queue.append(future)
+        self.queued += 1
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Place attribuée au moment de l'annulation : on la rend
+                self.release(future.result(), completed=False)
+            else:
+                self._discard(requester, future)
+            raise
+
+    def _start(self) -> int:
+        token = next(_slot_tokens)
+        self.running[token] = time.monotonic()
+        return token
+
+    def _discard(self, requester: str, future: asyncio.Future):
+        user_queue = self._queues.get(requester)
+        if user_queue and future in user_queue:
+            user_queue.remove(future)
+            self.queued -= 1
+            if not user_queue:
+                del self._queues[requester]
+                self._turns.remove(requester)
+
+    def release(self, token: int, completed: bool = True):
+        started = self.running.pop(token, None)
+        if started is not None and completed:
+            duration = time.monotonic() - started
+            self.avg_seconds = DURATION_EWMA_ALPHA * duration + (1 - DURATION_EWMA_ALPHA) * self.avg_seconds
+        self._grant_next()
+
+    def _grant_next(self):
+        while len(self.running) < self.limit and self._turns:
+            requester = self._turns.popleft()
+            user_queue = self._queues[requester]
+            future = user_queue.popleft()
+            self.queued -= 1
+            if user_queue:
+                self._turns.append(requester)
+            else:
+                del self._queues[requester]
+            if not future.done():
+                future.set_result(self._start())
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "running": len(self.running),
+            "queued": self.queued,
+            "waiting_users": len(self._queues),
+            "rejected": self.rejected,
+            "avg_seconds": round(self.avg_seconds, 1),
+        }
+
+
+class ModelScheduler:
+    """Une file par clé de modèle du barème de crédits"""
+
+    def __init__(self):
+        keys = [model["key"] for model in CREDITS_CONFIG["models"]]
+        for key in MODEL_CONCURRENCY_LIMITS:
+            if key not in keys:
+                logger.warning(f"⚠️ MODEL_CONCURRENCY_LIMITS: clé de modèle inconnue '{key}'")
+        self.lanes: Dict[str, ModelLane] = {
+            key: ModelLane(
+                key,
+                int(MODEL_CONCURRENCY_LIMITS.get(key, MODEL_CONCURRENCY_DEFAULTS.get(key, MODEL_CONCURRENCY_DEFAULT))),
+                MODEL_TYPICAL_SECONDS.get(key, 60),
+            )
+            for key in keys
+        }
+
+    def limit(self, model_key: str):
+        """
+        Décorateur de route de génération : la requête attend une place pour ce modèle
+
+        Les soumissions en mode asynchrone passent directement (la file de jobs sert
+        alors de file d'attente) ; le worker prend la place à l'exécution.
+        """
+        lane = self.lanes[model_key]
+
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if kwargs.get("async_mode"):
+                    return await func(*args, **kwargs)
+                try:
+                    token = await lane.acquire(_requester.get(), bounded=not _background.get())
+                except QueueFullError as e:
+                    logger.warning(f"🚦 {e} (demandeur {_requester.get()}), réessayer dans {e.retry_after}s")
+                    raise HTTPException(
+                        status_code=429,
+                        detail=f"Trop de générations en cours pour ce modèle. Veuillez réessayer dans {e.retry_after} secondes.",
+                        headers={"Retry-After": str(e.retry_after)},
+                    )
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    lane.release(token)
+            return wrapper
+        return decorator
+
+    def get_stats(self) -> dict:
+        return {key: lane.stats() for key, lane in self.lanes.items()}
+
+
+model_scheduler = ModelScheduler()
+
+
+def current_requester() -> str:
+    return _requester.get()
+
+
+def set_requester(requester: Optional[str], background: bool = False):
+    _requester.set(requester or "anonymous")
+    _background.set(background)
+
+
+async def identify_requester(request: Request, authorization: Optional[str] = Header(None)):
+    """Dépendance : identifier le demandeur (utilisateur du token, sinon adresse IP)"""
+    from auth import user_id_from_authorization
+    user_id = user_id_from_authorization(authorization)
+    if user_id:
+        _requester.set(f"user:{user_id}")
+        return
+    _requester.set(f"ip:{client_address(request)}")
+
+
+def client_address(request: Request) -> str:
+    """Adresse du client ; X-Forwarded-For n'est lu que si la connexion vient d'un proxy de confiance"""
+    host = request.client.host if request.client else "unknown"
+    if host not in TRUSTED_PROXIES:
+        return host
+    # Dernier saut avant nos proxies : les entrées plus à gauche sont fournies par le client
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in TRUSTED_PROXIES:
+            return hop
+    return host
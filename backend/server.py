@@ -1,13 +1,14 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, Header
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Depends
 from fastapi.responses import JSONResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 import base64
-import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+import time
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional
@@ -15,8 +16,6 @@ import uuid
 from datetime import datetime
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 import litellm
-import replicate
-import requests
 from PIL import Image, ImageDraw, ImageFont, ImageOps
 import io
 import tempfile
@@ -26,6 +25,25 @@ import shutil
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Modules configurés par variables d'environnement : importés après le chargement du .env
+import providers
+import http_client
+import database
+import db_indexes
+from database import db
+from predictions import prediction_tracker, replicate_router
+from jobs import api_job_worker, job_manager, jobs_router
+from scheduler import identify_requester, model_scheduler
+from singleflight import flight_key, generation_flights
+from result_cache import result_cache
+from session_cache import known_sessions
+from blob_store import blob_router, blob_store
+from temp_images import TEMP_IMAGES_DIR, data_url_to_public_url, get_veo_variant_stats, temp_images_router
+from pagination import PAGE_HEADERS, MessagePage, projected_response
+from conversation_context import CHAT_CONTEXT_MAX_SESSIONS, CHAT_CONTEXT_MESSAGES, CHAT_CONTEXT_TTL_SECONDS, ConversationContext
+from http_cache import etag_matches, not_modified, session_etag, set_cache_headers
+from auth import get_current_user_id
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -33,117 +51,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection (client partagé par tout le backend, voir database.py)
+job_manager.configure(db)
+result_cache.configure(db)
+blob_store.configure(db)
+# Contexte glissant des conversations ChatGPT-5
+chatgpt5_context = ConversationContext(db.chatgpt5_messages, CHAT_CONTEXT_MESSAGES, CHAT_CONTEXT_MAX_SESSIONS, CHAT_CONTEXT_TTL_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Ouverture puis fermeture des ressources partagées (MongoDB, client HTTP, workers)"""
+    await database.connect()
+    await startup_providers()
+    try:
+        yield
+    finally:
+        await shutdown_services()
+        database.close()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
-
-# Create temp directory for storing images
-TEMP_IMAGES_DIR = Path("/tmp/kling_images")
-TEMP_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
-
-# Helper function to get user_id from JWT token
-def get_user_id_from_token(authorization: Optional[str] = Header(None)) -> Optional[str]:
-    """Extract user_id from JWT token in Authorization header"""
-    if not authorization or not authorization.startswith('Bearer '):
-        return None
-    
-    token = authorization.split(' ')[1]
-    
-    # Import verify_token from auth module
-    from auth import verify_token
-    return verify_token(token)
-
-# Helper function to convert data URL to public URL
-def data_url_to_public_url(data_url: str, backend_url: str, resize_for_veo: bool = False) -> str:
-    """Convert a data URL to a public HTTP URL by saving the image temporarily"""
-    try:
-        # Extract the base64 data
-        if not data_url.startswith("data:"):
-            # Already a URL
-            return data_url
-        
-        # Parse data URL: data:image/png;base64,xxxxx or data:image/jpeg;base64,xxxxx
-        header, encoded = data_url.split(",", 1)
-        
-        # Decode base64
-        image_data = base64.b64decode(encoded)
-        
-        # Open image with PIL to ensure it's valid
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Resize for Google Veo 3.1 if necessary (with proper aspect ratio handling)
-        if resize_for_veo:
-            # Google Veo 3.1 requires 16:9 or 9:16 aspect ratio, ideally 1280x720 or 720x1280
-            width, height = image.size
-            aspect_ratio = width / height
-            
-            # Determine the target format
-            if aspect_ratio >= 1:  # Horizontal or square image -> 16:9
-                target_width, target_height = 1280, 720
-                target_aspect = 16/9
-            else:  # Vertical image -> 9:16
-                target_width, target_height = 720, 1280
-                target_aspect = 9/16
-            
-            # Calculate the dimensions to crop to target aspect ratio
-            current_aspect = width / height
-            if current_aspect > target_aspect:
-                # Image is wider than target, crop width
-                new_width = int(height * target_aspect)
-                new_height = height
-                left = (width - new_width) // 2
-                top = 0
-                right = left + new_width
-                bottom = height
-            else:
-                # Image is taller than target, crop height
-                new_width = width
-                new_height = int(width / target_aspect)
-                left = 0
-                top = (height - new_height) // 2
-                right = width
-                bottom = top + new_height
-            
-            # Crop to target aspect ratio (center crop)
-            image = image.crop((left, top, right, bottom))
-            
-            # Now resize to target resolution
-            image = image.resize((target_width, target_height), Image.Resampling.LANCZOS)
-            logging.info(f"Image processed from {width}x{height} to {target_width}x{target_height} for Google Veo 3.1 (cropped and resized)")
-        
-        # Convert to RGB if necessary (for PNG with transparency)
-        if image.mode in ('RGBA', 'LA', 'P'):
-            # Create white background
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image = image.convert('RGBA')
-            background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
-            image = background
-        elif image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Generate unique filename
-        filename = f"{uuid.uuid4()}.jpg"
-        filepath = TEMP_IMAGES_DIR / filename
-        
-        # Save as JPEG (better compatibility with Replicate)
-        image.save(filepath, 'JPEG', quality=95)
-        
-        # Return public URL (under /api prefix for Kubernetes ingress routing)
-        public_url = f"{backend_url}/api/temp-images/{filename}"
-        logging.info(f"Image saved successfully: {filepath} -> {public_url}")
-        return public_url
-    except Exception as e:
-        logging.error(f"Error converting data URL to public URL: {str(e)}")
-        raise
-
+api_router = APIRouter(prefix="/api", dependencies=[Depends(identify_requester)])
 
 # Define Models
 class StatusCheck(BaseModel):
@@ -248,6 +178,9 @@ class GenerateFluxKontextRequest(BaseModel):
     aspect_ratio: str = "16:9"  # Default aspect ratio
     prompt_upsampling: bool = False
     safety_tolerance: int = 2
+    seed: Optional[int] = None  # Seed fixe pour une génération reproductible
+    use_cache: bool = False  # Réutiliser le résultat d'une requête identique
+    force_regenerate: bool = False  # Ignorer le cache et régénérer
 
 class GenerateFluxKontextResponse(BaseModel):
     session_id: str
@@ -309,6 +242,8 @@ class GenerateSeedreamRequest(BaseModel):
     image_input: Optional[str] = None  # Data URL de l'image input (optionnelle)
     size: str = "2K"  # "1K", "2K", ou "4K"
     aspect_ratio: str = "1:1"  # "1:1", "4:3", "3:4", "16:9", "9:16", "3:2", "2:3", "21:9"
+    use_cache: bool = False  # Réutiliser le résultat d'une requête identique
+    force_regenerate: bool = False  # Ignorer le cache et régénérer
 
 class GenerateSeedreamResponse(BaseModel):
     session_id: str
@@ -598,16 +533,18 @@ async def get_status_checks():
 # NanoBanana endpoints
 
 @api_router.post("/nanobanana/generate", response_model=GenerateImageResponse)
-async def generate_image_with_nanobanana(request: GenerateImageRequest):
+@model_scheduler.limit("nano_banana")
+async def generate_image_with_nanobanana(request: GenerateImageRequest, async_mode: bool = False):
     """Génère une image avec NanoBanana (Google Gemini)"""
+    if async_mode:
+        return await job_manager.submit("nanobanana", request)
+
     try:
-        # Créer ou récupérer la session
-        session = await db.nanobanana_sessions.find_one({"id": request.session_id})
-        if not session:
-            # Créer une nouvelle session
-            session_obj = NanoBananaSession(id=request.session_id)
-            await db.nanobanana_sessions.insert_one(session_obj.dict())
-            session = session_obj.dict()
+        # Créer ou récupérer la session (déjà vue par ce processus : aucune lecture Mongo)
+        await known_sessions.ensure(
+            db.nanobanana_sessions, request.session_id,
+            create=lambda: NanoBananaSession(id=request.session_id).dict()
+        )
 
         # Sauvegarder le message utilisateur avec l'image si présente
         user_image_urls = []
@@ -655,7 +592,7 @@ async def generate_image_with_nanobanana(request: GenerateImageRequest):
             content=request.prompt,
             image_urls=user_image_urls
         )
-        await db.nanobanana_messages.insert_one(user_message.dict())
+        await db.nanobanana_messages.insert_one(await blob_store.externalize_message(user_message.dict()))
 
         # Générer l'image avec Gemini
         api_key = os.environ.get('EMERGENT_LLM_KEY')
@@ -686,9 +623,10 @@ async def generate_image_with_nanobanana(request: GenerateImageRequest):
             # Générer l'image avec Replicate
             logging.info(f"Génération d'image avec Replicate - modèle: google/nano-banana, prompt: {request.prompt}")
             
-            output = replicate.run(
-                "google/nano-banana",
-                input=inputs
+            # Une requête identique déjà en cours partage la même génération
+            output = await generation_flights.do(
+                flight_key("google/nano-banana", inputs),
+                lambda: providers.run_model("google/nano-banana", input=inputs)
             )
             
             # Le output est une URL d'image
@@ -699,12 +637,11 @@ async def generate_image_with_nanobanana(request: GenerateImageRequest):
             
             # Télécharger l'image depuis l'URL
             logging.info(f"Téléchargement de l'image depuis: {image_url}")
-            response = requests.get(image_url, timeout=30)
-            response.raise_for_status()
+            image_content = await http_client.download_bytes(image_url, timeout=30)
             
             # Corriger l'orientation EXIF avant de convertir en base64
             try:
-                img = Image.open(io.BytesIO(response.content))
+                img = Image.open(io.BytesIO(image_content))
                 # Corriger automatiquement l'orientation selon les métadonnées EXIF
                 img = ImageOps.exif_transpose(img)
                 # Sauvegarder dans un buffer
@@ -718,7 +655,7 @@ async def generate_image_with_nanobanana(request: GenerateImageRequest):
             except Exception as exif_error:
                 logging.warning(f"⚠️ Impossible de corriger l'orientation EXIF: {exif_error}, utilisation de l'image originale")
                 # Fallback : utiliser l'image originale
-                image_base64 = base64.b64encode(response.content).decode('utf-8')
+                image_base64 = base64.b64encode(image_content).decode('utf-8')
                 image_data_url = f"data:image/jpeg;base64,{image_base64}"
             
             image_urls = [image_data_url]
@@ -753,7 +690,7 @@ async def generate_image_with_nanobanana(request: GenerateImageRequest):
             content=response_text or default_message,
             image_urls=image_urls
         )
-        await db.nanobanana_messages.insert_one(assistant_message.dict())
+        await db.nanobanana_messages.insert_one(await blob_store.externalize_message(assistant_message.dict()))
 
         # Mettre à jour la session
         await db.nanobanana_sessions.update_one(
@@ -774,24 +711,30 @@ async def generate_image_with_nanobanana(request: GenerateImageRequest):
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération: {str(e)}")
 
 @api_router.get("/nanobanana/session/{session_id}", response_model=List[NanoBananaMessage])
-async def get_nanobanana_session(session_id: str):
+async def get_nanobanana_session(session_id: str, request: Request, response: Response, page: MessagePage = Depends()):
     """Récupère l'historique d'une session NanoBanana"""
     try:
-        messages = await db.nanobanana_messages.find(
-            {"session_id": session_id}
-        ).sort("timestamp", 1).to_list(1000)
-        
+        # Session inchangée depuis la dernière lecture : 304 sans charger les messages
+        etag = await session_etag(db.nanobanana_sessions, db.nanobanana_messages, session_id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        # Page de messages (toute la session sans paramètre de pagination)
+        messages = await page.fetch(db.nanobanana_messages, session_id, response, max_messages=1000)
+        if page.fields:
+            return projected_response(messages, response)
         return [NanoBananaMessage(**msg) for msg in messages]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de session: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.post("/nanobanana/session", response_model=NanoBananaSession)
-async def create_nanobanana_session(authorization: Optional[str] = Header(None)):
+async def create_nanobanana_session(user_id: Optional[str] = Depends(get_current_user_id)):
     """Crée ou récupère une session NanoBanana pour l'utilisateur"""
     try:
-        user_id = get_user_id_from_token(authorization)
-        
         # Si l'utilisateur est connecté, chercher sa session existante
         if user_id:
             existing_session = await db.nanobanana_sessions.find_one(
@@ -800,11 +743,13 @@ async def create_nanobanana_session(authorization: Optional[str] = Header(None))
             )
             if existing_session:
                 logger.info(f"📂 Session NanoBanana existante trouvée pour user {user_id}")
+                known_sessions.remember("nanobanana_sessions", existing_session["id"])
                 return NanoBananaSession(**existing_session)
         
         # Créer une nouvelle session
         session = NanoBananaSession(user_id=user_id)
         await db.nanobanana_sessions.insert_one(session.dict())
+        known_sessions.remember("nanobanana_sessions", session.id)
         logger.info(f"✨ Nouvelle session NanoBanana créée pour user {user_id or 'anonymous'}")
         return session
     except Exception as e:
@@ -825,11 +770,9 @@ async def get_nanobanana_sessions():
 # Flux Kontext Pro endpoints
 
 @api_router.post("/flux-kontext/session", response_model=FluxKontextSession)
-async def create_flux_kontext_session(authorization: Optional[str] = Header(None)):
+async def create_flux_kontext_session(user_id: Optional[str] = Depends(get_current_user_id)):
     """Crée ou récupère une session flux-kontext pour l'utilisateur"""
     try:
-        user_id = get_user_id_from_token(authorization)
-        
         # Si l'utilisateur est connecté, chercher sa session existante
         if user_id:
             existing_session = await db.flux_kontext_sessions.find_one(
@@ -838,11 +781,13 @@ async def create_flux_kontext_session(authorization: Optional[str] = Header(None
             )
             if existing_session:
                 logger.info(f"📂 Session flux-kontext existante trouvée pour user {user_id}")
+                known_sessions.remember("flux_kontext_sessions", existing_session["id"])
                 return FluxKontextSession(**existing_session)
         
         # Créer une nouvelle session
         session = FluxKontextSession(user_id=user_id)
         await db.flux_kontext_sessions.insert_one(session.dict())
+        known_sessions.remember("flux_kontext_sessions", session.id)
         logger.info(f"✨ Nouvelle session flux-kontext créée pour user {user_id or 'anonymous'}")
         return session
     except Exception as e:
@@ -850,15 +795,18 @@ async def create_flux_kontext_session(authorization: Optional[str] = Header(None
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.post("/flux-kontext/generate", response_model=GenerateFluxKontextResponse)
-async def generate_image_with_flux_kontext(request: GenerateFluxKontextRequest):
+@model_scheduler.limit("flux_kontext_pro")
+async def generate_image_with_flux_kontext(request: GenerateFluxKontextRequest, async_mode: bool = False):
     """Génère ou édite une image avec Flux Kontext Pro"""
+    if async_mode:
+        return await job_manager.submit("flux_kontext", request)
+
     try:
-        # Créer ou récupérer la session
-        session = await db.flux_kontext_sessions.find_one({"id": request.session_id})
-        if not session:
-            session_obj = FluxKontextSession(id=request.session_id)
-            await db.flux_kontext_sessions.insert_one(session_obj.dict())
-            session = session_obj.dict()
+        # Créer ou récupérer la session (déjà vue par ce processus : aucune lecture Mongo)
+        await known_sessions.ensure(
+            db.flux_kontext_sessions, request.session_id,
+            create=lambda: FluxKontextSession(id=request.session_id).dict()
+        )
 
         # Sauvegarder le message utilisateur avec l'image de référence si présente
         user_content = request.prompt
@@ -873,7 +821,7 @@ async def generate_image_with_flux_kontext(request: GenerateFluxKontextRequest):
             content=user_content,
             image_urls=user_image_urls
         )
-        await db.flux_kontext_messages.insert_one(user_message.dict())
+        await db.flux_kontext_messages.insert_one(await blob_store.externalize_message(user_message.dict()))
 
         # Vérifier le token Replicate
         replicate_token = os.environ.get('REPLICATE_API_TOKEN')
@@ -899,12 +847,19 @@ async def generate_image_with_flux_kontext(request: GenerateFluxKontextRequest):
                 # Convertir data URL en URL accessible si nécessaire
                 inputs["input_image"] = request.input_image
             
+            if request.seed is not None:
+                inputs["seed"] = request.seed
+            
             # Générer l'image avec Replicate
             logging.info(f"Génération d'image avec Replicate - modèle: black-forest-labs/flux-kontext-pro, prompt: {request.prompt}")
             
-            output = replicate.run(
+            # Résultat d'une requête identique réutilisé si demandé (use_cache)
+            output, from_cache = await result_cache.fetch(
                 "black-forest-labs/flux-kontext-pro",
-                input=inputs
+                inputs,
+                lambda: providers.run_model("black-forest-labs/flux-kontext-pro", input=inputs),
+                use_cache=request.use_cache,
+                force_regenerate=request.force_regenerate
             )
             
             # Le output est une URL d'image
@@ -922,6 +877,8 @@ async def generate_image_with_flux_kontext(request: GenerateFluxKontextRequest):
                 response_text = f"✅ Image éditée avec succès avec Flux Kontext Pro!"
             else:
                 response_text = f"✅ Image générée avec succès avec Flux Kontext Pro!"
+            if from_cache:
+                response_text += " (résultat en cache)"
             
         except Exception as e:
             error_occurred = True
@@ -957,7 +914,7 @@ async def generate_image_with_flux_kontext(request: GenerateFluxKontextRequest):
                 content=response_text,
                 image_urls=image_urls
             )
-            await db.flux_kontext_messages.insert_one(assistant_message.dict())
+            await db.flux_kontext_messages.insert_one(await blob_store.externalize_message(assistant_message.dict()))
         except Exception as save_error:
             # Gérer les erreurs de sauvegarde MongoDB (notamment BSON document too large)
             save_error_message = str(save_error)
@@ -979,7 +936,7 @@ async def generate_image_with_flux_kontext(request: GenerateFluxKontextRequest):
                     content=f"❌ **Image trop volumineuse**\n\nL'image générée est trop grande pour être stockée{size_mb}. Cette limitation technique de MongoDB empêche la sauvegarde. L'image a bien été générée par l'IA mais ne peut pas être affichée. Veuillez réessayer avec un aspect ratio plus petit.",
                     image_urls=[]  # Pas d'image car trop volumineuse
                 )
-                await db.flux_kontext_messages.insert_one(error_assistant_message.dict())
+                await db.flux_kontext_messages.insert_one(await blob_store.externalize_message(error_assistant_message.dict()))
             else:
                 # Autre erreur de sauvegarde
                 raise save_error
@@ -1004,14 +961,22 @@ async def generate_image_with_flux_kontext(request: GenerateFluxKontextRequest):
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération: {str(e)}")
 
 @api_router.get("/flux-kontext/session/{session_id}", response_model=List[FluxKontextMessage])
-async def get_flux_kontext_session(session_id: str):
+async def get_flux_kontext_session(session_id: str, request: Request, response: Response, page: MessagePage = Depends()):
     """Récupère l'historique d'une session Flux Kontext Pro"""
     try:
-        messages = await db.flux_kontext_messages.find(
-            {"session_id": session_id}
-        ).sort("timestamp", 1).to_list(1000)
-        
+        # Session inchangée depuis la dernière lecture : 304 sans charger les messages
+        etag = await session_etag(db.flux_kontext_sessions, db.flux_kontext_messages, session_id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        # Page de messages (toute la session sans paramètre de pagination)
+        messages = await page.fetch(db.flux_kontext_messages, session_id, response, max_messages=1000)
+        if page.fields:
+            return projected_response(messages, response)
         return [FluxKontextMessage(**msg) for msg in messages]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de session: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
@@ -1021,11 +986,9 @@ async def get_flux_kontext_session(session_id: str):
 # Kling AI v2.1 endpoints (Image-to-Video Generation)
 
 @api_router.post("/kling/session", response_model=KlingSession)
-async def create_kling_session(authorization: Optional[str] = Header(None)):
+async def create_kling_session(user_id: Optional[str] = Depends(get_current_user_id)):
     """Crée ou récupère une session kling pour l'utilisateur"""
     try:
-        user_id = get_user_id_from_token(authorization)
-        
         # Si l'utilisateur est connecté, chercher sa session existante
         if user_id:
             existing_session = await db.kling_sessions.find_one(
@@ -1034,11 +997,13 @@ async def create_kling_session(authorization: Optional[str] = Header(None)):
             )
             if existing_session:
                 logger.info(f"📂 Session kling existante trouvée pour user {user_id}")
+                known_sessions.remember("kling_sessions", existing_session["id"])
                 return KlingSession(**existing_session)
         
         # Créer une nouvelle session
         session = KlingSession(user_id=user_id)
         await db.kling_sessions.insert_one(session.dict())
+        known_sessions.remember("kling_sessions", session.id)
         logger.info(f"✨ Nouvelle session kling créée pour user {user_id or 'anonymous'}")
         return session
     except Exception as e:
@@ -1046,15 +1011,18 @@ async def create_kling_session(authorization: Optional[str] = Header(None)):
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.post("/kling/generate", response_model=GenerateKlingResponse)
-async def generate_video_with_kling(request: GenerateKlingRequest):
+@model_scheduler.limit("kling_ai_v2_1")
+async def generate_video_with_kling(request: GenerateKlingRequest, async_mode: bool = False):
     """Génère une vidéo avec Kling AI v2.1 (image-to-video)"""
+    if async_mode:
+        return await job_manager.submit("kling", request)
+
     try:
-        # Créer ou récupérer la session
-        session = await db.kling_sessions.find_one({"id": request.session_id})
-        if not session:
-            session_obj = KlingSession(id=request.session_id)
-            await db.kling_sessions.insert_one(session_obj.dict())
-            session = session_obj.dict()
+        # Créer ou récupérer la session (déjà vue par ce processus : aucune lecture Mongo)
+        await known_sessions.ensure(
+            db.kling_sessions, request.session_id,
+            create=lambda: KlingSession(id=request.session_id).dict()
+        )
 
         # Sauvegarder le message utilisateur avec les images
         user_image_urls = [request.start_image]
@@ -1069,7 +1037,7 @@ async def generate_video_with_kling(request: GenerateKlingRequest):
             content=user_content,
             image_urls=user_image_urls
         )
-        await db.kling_messages.insert_one(user_message.dict())
+        await db.kling_messages.insert_one(await blob_store.externalize_message(user_message.dict()))
 
         # Vérifier le token Replicate
         replicate_token = os.environ.get('REPLICATE_API_TOKEN')
@@ -1083,7 +1051,7 @@ async def generate_video_with_kling(request: GenerateKlingRequest):
         try:
             # Convert data URLs to public URLs for Replicate
             backend_url = os.environ.get('BACKEND_URL', 'http://localhost:8001')
-            start_image_url = data_url_to_public_url(request.start_image, backend_url)
+            start_image_url = await providers.run_blocking(data_url_to_public_url, request.start_image, backend_url)
             logging.info(f"Start image converted to: {start_image_url}")
             
             # Préparer les inputs pour le modèle kwaivgi/kling-v2.1
@@ -1099,7 +1067,7 @@ async def generate_video_with_kling(request: GenerateKlingRequest):
             if request.end_image:
                 if request.mode != "pro":
                     raise Exception("L'image de fin (end_image) nécessite le mode 'pro' (1080p)")
-                end_image_url = data_url_to_public_url(request.end_image, backend_url)
+                end_image_url = await providers.run_blocking(data_url_to_public_url, request.end_image, backend_url)
                 logging.info(f"End image converted to: {end_image_url}")
                 inputs["end_image"] = end_image_url
             
@@ -1108,11 +1076,8 @@ async def generate_video_with_kling(request: GenerateKlingRequest):
             logging.info(f"⏳ La génération peut prendre 2-3 minutes, veuillez patienter...")
             
             # Créer une prediction asynchrone
-            import replicate.prediction
-            client = replicate.Client(api_token=os.environ.get('REPLICATE_API_TOKEN'))
-            
-            prediction = client.predictions.create(
-                model="kwaivgi/kling-v2.1",
+            prediction = await prediction_tracker.start(
+                "kwaivgi/kling-v2.1",
                 input=inputs
             )
             
@@ -1120,19 +1085,12 @@ async def generate_video_with_kling(request: GenerateKlingRequest):
             
             # Attendre que la génération soit terminée (avec timeout de 5 minutes)
             max_wait_seconds = 300  # 5 minutes
-            poll_interval = 3  # Vérifier toutes les 3 secondes
-            elapsed = 0
             
-            while prediction.status not in ["succeeded", "failed", "canceled"]:
-                if elapsed >= max_wait_seconds:
-                    raise Exception(f"Timeout: La génération a dépassé {max_wait_seconds//60} minutes")
-                
-                await asyncio.sleep(poll_interval)
-                elapsed += poll_interval
-                
-                # Rafraîchir le statut
-                prediction.reload()
-                logging.info(f"Status après {elapsed}s: {prediction.status}")
+            # Attente de la fin (webhook, ou poller central en secours)
+            prediction, elapsed = await prediction_tracker.wait(prediction, max_wait_seconds)
+            
+            if prediction.status not in ["succeeded", "failed", "canceled"]:
+                raise Exception(f"Timeout: La génération a dépassé {max_wait_seconds//60} minutes")
             
             if prediction.status == "failed":
                 error_msg = prediction.error or "Erreur inconnue"
@@ -1180,7 +1138,7 @@ async def generate_video_with_kling(request: GenerateKlingRequest):
                 content=response_text,
                 video_urls=video_urls
             )
-            await db.kling_messages.insert_one(assistant_message.dict())
+            await db.kling_messages.insert_one(await blob_store.externalize_message(assistant_message.dict()))
         except Exception as save_error:
             save_error_message = str(save_error)
             logging.error(f"Erreur lors de la sauvegarde du message: {save_error_message}")
@@ -1200,7 +1158,7 @@ async def generate_video_with_kling(request: GenerateKlingRequest):
                     content=f"❌ **Vidéo trop volumineuse**\n\nLa vidéo générée est trop grande pour être stockée{size_mb}. Cette limitation technique de MongoDB empêche la sauvegarde. La vidéo a bien été générée par l'IA mais ne peut pas être affichée.",
                     video_urls=[]
                 )
-                await db.kling_messages.insert_one(error_assistant_message.dict())
+                await db.kling_messages.insert_one(await blob_store.externalize_message(error_assistant_message.dict()))
             else:
                 raise save_error
 
@@ -1223,14 +1181,22 @@ async def generate_video_with_kling(request: GenerateKlingRequest):
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération: {str(e)}")
 
 @api_router.get("/kling/session/{session_id}", response_model=List[KlingMessage])
-async def get_kling_session(session_id: str):
+async def get_kling_session(session_id: str, request: Request, response: Response, page: MessagePage = Depends()):
     """Récupère l'historique d'une session Kling AI"""
     try:
-        messages = await db.kling_messages.find(
-            {"session_id": session_id}
-        ).sort("timestamp", 1).to_list(1000)
-        
+        # Session inchangée depuis la dernière lecture : 304 sans charger les messages
+        etag = await session_etag(db.kling_sessions, db.kling_messages, session_id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        # Page de messages (toute la session sans paramètre de pagination)
+        messages = await page.fetch(db.kling_messages, session_id, response, max_messages=1000)
+        if page.fields:
+            return projected_response(messages, response)
         return [KlingMessage(**msg) for msg in messages]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de session: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
@@ -1238,11 +1204,9 @@ async def get_kling_session(session_id: str):
 # Seedream 4 endpoints (Text-to-Image and Image-to-Image Generation)
 
 @api_router.post("/seedream/session", response_model=SeedreamSession)
-async def create_seedream_session(authorization: Optional[str] = Header(None)):
+async def create_seedream_session(user_id: Optional[str] = Depends(get_current_user_id)):
     """Crée ou récupère une session seedream pour l'utilisateur"""
     try:
-        user_id = get_user_id_from_token(authorization)
-        
         # Si l'utilisateur est connecté, chercher sa session existante
         if user_id:
             existing_session = await db.seedream_sessions.find_one(
@@ -1251,11 +1215,13 @@ async def create_seedream_session(authorization: Optional[str] = Header(None)):
             )
             if existing_session:
                 logger.info(f"📂 Session seedream existante trouvée pour user {user_id}")
+                known_sessions.remember("seedream_sessions", existing_session["id"])
                 return SeedreamSession(**existing_session)
         
         # Créer une nouvelle session
         session = SeedreamSession(user_id=user_id)
         await db.seedream_sessions.insert_one(session.dict())
+        known_sessions.remember("seedream_sessions", session.id)
         logger.info(f"✨ Nouvelle session seedream créée pour user {user_id or 'anonymous'}")
         return session
     except Exception as e:
@@ -1263,12 +1229,15 @@ async def create_seedream_session(authorization: Optional[str] = Header(None)):
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.post("/seedream/generate", response_model=GenerateSeedreamResponse)
-async def generate_image_with_seedream(request: GenerateSeedreamRequest):
+@model_scheduler.limit("seedream_4")
+async def generate_image_with_seedream(request: GenerateSeedreamRequest, async_mode: bool = False):
     """Génère une image avec Seedream 4 (text-to-image ou image-to-image)"""
+    if async_mode:
+        return await job_manager.submit("seedream", request)
+
     try:
-        # Créer ou récupérer la session
-        session = await db.seedream_sessions.find_one({"id": request.session_id})
-        if not session:
+        # Créer ou récupérer la session (déjà vue par ce processus : aucune lecture Mongo)
+        if not await known_sessions.ensure(db.seedream_sessions, request.session_id):
             raise HTTPException(status_code=404, detail="Session non trouvée")
         
         # Message utilisateur
@@ -1278,7 +1247,7 @@ async def generate_image_with_seedream(request: GenerateSeedreamRequest):
         # Si une image input est fournie, la convertir en URL publique
         if request.image_input:
             backend_url = os.environ.get('BACKEND_URL', 'http://localhost:8001')
-            image_url = data_url_to_public_url(request.image_input, backend_url)
+            image_url = await providers.run_blocking(data_url_to_public_url, request.image_input, backend_url)
             logging.info(f"Input image converted to: {image_url}")
             user_images.append(image_url)
         
@@ -1293,7 +1262,7 @@ async def generate_image_with_seedream(request: GenerateSeedreamRequest):
             content=user_content,
             image_urls=user_images
         )
-        await db.seedream_messages.insert_one(user_message.dict())
+        await db.seedream_messages.insert_one(await blob_store.externalize_message(user_message.dict()))
         
         # Générer l'image avec Replicate en mode asynchrone
         try:
@@ -1311,47 +1280,61 @@ async def generate_image_with_seedream(request: GenerateSeedreamRequest):
             if request.image_input:
                 inputs["image_input"] = [image_url]
             
-            # Créer une prediction asynchrone
-            client = replicate.Client(api_token=os.environ.get('REPLICATE_API_TOKEN'))
-            
-            prediction = client.predictions.create(
-                model="bytedance/seedream-4",
-                input=inputs
-            )
-            
-            logging.info(f"Prediction créée: {prediction.id}, status: {prediction.status}")
-            
             # Attendre que la génération soit terminée (avec timeout de 3 minutes)
             max_wait_seconds = 180  # 3 minutes
-            poll_interval = 3
-            elapsed = 0
             
-            while prediction.status not in ["succeeded", "failed", "canceled"]:
-                if elapsed >= max_wait_seconds:
+            async def start_and_wait():
+                # Créer une prediction asynchrone
+                prediction = await prediction_tracker.start(
+                    "bytedance/seedream-4",
+                    input=inputs
+                )
+                logging.info(f"Prediction créée: {prediction.id}, status: {prediction.status}")
+                # Attente de la fin (webhook, ou poller central en secours)
+                return await prediction_tracker.wait(prediction, max_wait_seconds)
+            
+            # Entrées de référence : image d'origine plutôt que l'URL temporaire propre à chaque requête
+            reference_inputs = {**inputs, "image_input": request.image_input}
+            
+            async def generate_images():
+                # Une requête identique déjà en cours est rattachée à la même prediction
+                prediction, _ = await generation_flights.do(
+                    flight_key("bytedance/seedream-4", reference_inputs),
+                    start_and_wait
+                )
+                
+                if prediction.status not in ["succeeded", "failed", "canceled"]:
                     raise Exception(f"Timeout: La génération a dépassé {max_wait_seconds//60} minutes")
                 
-                await asyncio.sleep(poll_interval)
-                elapsed += poll_interval
+                if prediction.status == "failed":
+                    error_msg = prediction.error or "Erreur inconnue"
+                    raise Exception(f"La génération a échoué: {error_msg}")
                 
-                prediction.reload()
-                logging.info(f"Status après {elapsed}s: {prediction.status}")
-            
-            if prediction.status == "failed":
-                error_msg = prediction.error or "Erreur inconnue"
-                raise Exception(f"La génération a échoué: {error_msg}")
-            
-            if prediction.status == "canceled":
-                raise Exception("La génération a été annulée")
+                if prediction.status == "canceled":
+                    raise Exception("La génération a été annulée")
+                
+                return prediction.output
+            
+            # Résultat d'une requête identique réutilisé si demandé (use_cache)
+            started_at = time.monotonic()
+            output, from_cache = await result_cache.fetch(
+                "bytedance/seedream-4",
+                reference_inputs,
+                generate_images,
+                use_cache=request.use_cache,
+                force_regenerate=request.force_regenerate
+            )
+            elapsed = int(time.monotonic() - started_at)
             
             # Récupérer les URLs des images (output est un array)
-            image_urls = prediction.output if prediction.output else []
+            image_urls = output if output else []
             
             if not image_urls or len(image_urls) == 0:
                 raise Exception("Aucune image générée par Replicate")
             
             logging.info(f"✅ {len(image_urls)} image(s) générée(s) en {elapsed}s")
             
-            response_text = f"✅ Image générée avec succès avec Seedream 4!\n\n⏱️ Temps de génération: {elapsed}s\nRésolution: {request.size}\nRatio: {request.aspect_ratio}\n{len(image_urls)} image(s) générée(s)"
+            response_text = f"✅ Image générée avec succès avec Seedream 4!{' (résultat en cache)' if from_cache else ''}\n\n⏱️ Temps de génération: {elapsed}s\nRésolution: {request.size}\nRatio: {request.aspect_ratio}\n{len(image_urls)} image(s) générée(s)"
             
         except Exception as e:
             # Message d'erreur
@@ -1369,7 +1352,7 @@ async def generate_image_with_seedream(request: GenerateSeedreamRequest):
                 {"$set": {"last_updated": datetime.utcnow()}}
             )
             
-            await db.seedream_messages.insert_one(error_assistant_message.dict())
+            await db.seedream_messages.insert_one(await blob_store.externalize_message(error_assistant_message.dict()))
             
             return GenerateSeedreamResponse(
                 session_id=request.session_id,
@@ -1395,7 +1378,7 @@ async def generate_image_with_seedream(request: GenerateSeedreamRequest):
         )
         
         # Insérer le message assistant
-        await db.seedream_messages.insert_one(assistant_message.dict())
+        await db.seedream_messages.insert_one(await blob_store.externalize_message(assistant_message.dict()))
         
         return GenerateSeedreamResponse(
             session_id=request.session_id,
@@ -1411,11 +1394,22 @@ async def generate_image_with_seedream(request: GenerateSeedreamRequest):
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.get("/seedream/session/{session_id}", response_model=List[SeedreamMessage])
-async def get_seedream_conversation(session_id: str):
+async def get_seedream_conversation(session_id: str, request: Request, response: Response, page: MessagePage = Depends()):
     """Récupère l'historique de conversation d'une session Seedream"""
     try:
-        messages = await db.seedream_messages.find({"session_id": session_id}).sort("timestamp", 1).to_list(None)
+        # Session inchangée depuis la dernière lecture : 304 sans charger les messages
+        etag = await session_etag(db.seedream_sessions, db.seedream_messages, session_id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        # Page de messages (toute la session sans paramètre de pagination)
+        messages = await page.fetch(db.seedream_messages, session_id, response, max_messages=None)
+        if page.fields:
+            return projected_response(messages, response)
         return [SeedreamMessage(**msg) for msg in messages]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de l'historique Seedream: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
@@ -1424,11 +1418,9 @@ async def get_seedream_conversation(session_id: str):
 # Grok endpoints (Text-to-Image Generation)
 
 @api_router.post("/grok/session", response_model=GrokSession)
-async def create_grok_session(authorization: Optional[str] = Header(None)):
+async def create_grok_session(user_id: Optional[str] = Depends(get_current_user_id)):
     """Crée ou récupère une session grok pour l'utilisateur"""
     try:
-        user_id = get_user_id_from_token(authorization)
-        
         # Si l'utilisateur est connecté, chercher sa session existante
         if user_id:
             existing_session = await db.grok_sessions.find_one(
@@ -1437,11 +1429,13 @@ async def create_grok_session(authorization: Optional[str] = Header(None)):
             )
             if existing_session:
                 logger.info(f"📂 Session grok existante trouvée pour user {user_id}")
+                known_sessions.remember("grok_sessions", existing_session["id"])
                 return GrokSession(**existing_session)
         
         # Créer une nouvelle session
         session = GrokSession(user_id=user_id)
         await db.grok_sessions.insert_one(session.dict())
+        known_sessions.remember("grok_sessions", session.id)
         logger.info(f"✨ Nouvelle session grok créée pour user {user_id or 'anonymous'}")
         return session
     except Exception as e:
@@ -1449,12 +1443,15 @@ async def create_grok_session(authorization: Optional[str] = Header(None)):
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.post("/grok/generate", response_model=GenerateGrokResponse)
-async def generate_image_with_grok(request: GenerateGrokRequest):
+@model_scheduler.limit("grok_2_image")
+async def generate_image_with_grok(request: GenerateGrokRequest, async_mode: bool = False):
     """Génère une image avec Grok (text-to-image)"""
+    if async_mode:
+        return await job_manager.submit("grok", request)
+
     try:
-        # Créer ou récupérer la session
-        session = await db.grok_sessions.find_one({"id": request.session_id})
-        if not session:
+        # Créer ou récupérer la session (déjà vue par ce processus : aucune lecture Mongo)
+        if not await known_sessions.ensure(db.grok_sessions, request.session_id):
             raise HTTPException(status_code=404, detail="Session non trouvée")
         
         # Message utilisateur
@@ -1468,7 +1465,7 @@ async def generate_image_with_grok(request: GenerateGrokRequest):
             content=user_content,
             image_urls=[]
         )
-        await db.grok_messages.insert_one(user_message.dict())
+        await db.grok_messages.insert_one(await blob_store.externalize_message(user_message.dict()))
         
         # Générer l'image avec Replicate en mode asynchrone
         try:
@@ -1480,10 +1477,8 @@ async def generate_image_with_grok(request: GenerateGrokRequest):
             }
             
             # Créer une prediction asynchrone
-            client = replicate.Client(api_token=os.environ.get('REPLICATE_API_TOKEN'))
-            
-            prediction = client.predictions.create(
-                model="xai/grok-2-image",
+            prediction = await prediction_tracker.start(
+                "xai/grok-2-image",
                 input=inputs
             )
             
@@ -1491,18 +1486,12 @@ async def generate_image_with_grok(request: GenerateGrokRequest):
             
             # Attendre que la génération soit terminée (avec timeout de 6 minutes)
             max_wait_seconds = 360  # 6 minutes (Grok peut prendre 4-5 minutes)
-            poll_interval = 3
-            elapsed = 0
             
-            while prediction.status not in ["succeeded", "failed", "canceled"]:
-                if elapsed >= max_wait_seconds:
-                    raise Exception(f"Timeout: La génération a dépassé {max_wait_seconds//60} minutes")
-                
-                await asyncio.sleep(poll_interval)
-                elapsed += poll_interval
-                
-                prediction.reload()
-                logging.info(f"Status après {elapsed}s: {prediction.status}")
+            # Attente de la fin (webhook, ou poller central en secours)
+            prediction, elapsed = await prediction_tracker.wait(prediction, max_wait_seconds)
+            
+            if prediction.status not in ["succeeded", "failed", "canceled"]:
+                raise Exception(f"Timeout: La génération a dépassé {max_wait_seconds//60} minutes")
             
             if prediction.status == "failed":
                 error_msg = prediction.error or "Erreur inconnue"
@@ -1538,7 +1527,7 @@ async def generate_image_with_grok(request: GenerateGrokRequest):
                 {"$set": {"last_updated": datetime.utcnow()}}
             )
             
-            await db.grok_messages.insert_one(error_assistant_message.dict())
+            await db.grok_messages.insert_one(await blob_store.externalize_message(error_assistant_message.dict()))
             
             return GenerateGrokResponse(
                 session_id=request.session_id,
@@ -1564,7 +1553,7 @@ async def generate_image_with_grok(request: GenerateGrokRequest):
         )
         
         # Insérer le message assistant
-        await db.grok_messages.insert_one(assistant_message.dict())
+        await db.grok_messages.insert_one(await blob_store.externalize_message(assistant_message.dict()))
         
         return GenerateGrokResponse(
             session_id=request.session_id,
@@ -1580,11 +1569,22 @@ async def generate_image_with_grok(request: GenerateGrokRequest):
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.get("/grok/session/{session_id}", response_model=List[GrokMessage])
-async def get_grok_conversation(session_id: str):
+async def get_grok_conversation(session_id: str, request: Request, response: Response, page: MessagePage = Depends()):
     """Récupère l'historique de conversation d'une session Grok"""
     try:
-        messages = await db.grok_messages.find({"session_id": session_id}).sort("timestamp", 1).to_list(None)
+        # Session inchangée depuis la dernière lecture : 304 sans charger les messages
+        etag = await session_etag(db.grok_sessions, db.grok_messages, session_id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        # Page de messages (toute la session sans paramètre de pagination)
+        messages = await page.fetch(db.grok_messages, session_id, response, max_messages=None)
+        if page.fields:
+            return projected_response(messages, response)
         return [GrokMessage(**msg) for msg in messages]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de l'historique Grok: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
@@ -1593,11 +1593,9 @@ async def get_grok_conversation(session_id: str):
 # Alibaba Wan 2.5 endpoints (Text-to-Video Generation)
 
 @api_router.post("/alibaba-wan/session", response_model=AlibabaWanSession)
-async def create_alibaba_wan_session(authorization: Optional[str] = Header(None)):
+async def create_alibaba_wan_session(user_id: Optional[str] = Depends(get_current_user_id)):
     """Crée ou récupère une session alibaba-wan pour l'utilisateur"""
     try:
-        user_id = get_user_id_from_token(authorization)
-        
         # Si l'utilisateur est connecté, chercher sa session existante
         if user_id:
             existing_session = await db.alibaba_wan_sessions.find_one(
@@ -1606,11 +1604,13 @@ async def create_alibaba_wan_session(authorization: Optional[str] = Header(None)
             )
             if existing_session:
                 logger.info(f"📂 Session alibaba-wan existante trouvée pour user {user_id}")
+                known_sessions.remember("alibaba_wan_sessions", existing_session["id"])
                 return AlibabaWanSession(**existing_session)
         
         # Créer une nouvelle session
         session = AlibabaWanSession(user_id=user_id)
         await db.alibaba_wan_sessions.insert_one(session.dict())
+        known_sessions.remember("alibaba_wan_sessions", session.id)
         logger.info(f"✨ Nouvelle session alibaba-wan créée pour user {user_id or 'anonymous'}")
         return session
     except Exception as e:
@@ -1618,12 +1618,15 @@ async def create_alibaba_wan_session(authorization: Optional[str] = Header(None)
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.post("/alibaba-wan/generate", response_model=GenerateAlibabaWanResponse)
-async def generate_video_with_alibaba_wan(request: GenerateAlibabaWanRequest):
+@model_scheduler.limit("alibaba_wan_2_5")
+async def generate_video_with_alibaba_wan(request: GenerateAlibabaWanRequest, async_mode: bool = False):
     """Génère une vidéo avec Alibaba Wan 2.5 (text-to-video)"""
+    if async_mode:
+        return await job_manager.submit("alibaba_wan", request)
+
     try:
-        # Créer ou récupérer la session
-        session = await db.alibaba_wan_sessions.find_one({"id": request.session_id})
-        if not session:
+        # Créer ou récupérer la session (déjà vue par ce processus : aucune lecture Mongo)
+        if not await known_sessions.ensure(db.alibaba_wan_sessions, request.session_id):
             raise HTTPException(status_code=404, detail="Session non trouvée")
         
         # Message utilisateur
@@ -1637,7 +1640,7 @@ async def generate_video_with_alibaba_wan(request: GenerateAlibabaWanRequest):
             content=user_content,
             video_urls=[]
         )
-        await db.alibaba_wan_messages.insert_one(user_message.dict())
+        await db.alibaba_wan_messages.insert_one(await blob_store.externalize_message(user_message.dict()))
         
         # Générer la vidéo avec Replicate en mode asynchrone
         try:
@@ -1654,10 +1657,8 @@ async def generate_video_with_alibaba_wan(request: GenerateAlibabaWanRequest):
             }
             
             # Créer une prediction asynchrone
-            client = replicate.Client(api_token=os.environ.get('REPLICATE_API_TOKEN'))
-            
-            prediction = client.predictions.create(
-                model="wan-video/wan-2.5-t2v",
+            prediction = await prediction_tracker.start(
+                "wan-video/wan-2.5-t2v",
                 input=inputs
             )
             
@@ -1665,18 +1666,12 @@ async def generate_video_with_alibaba_wan(request: GenerateAlibabaWanRequest):
             
             # Attendre que la génération soit terminée (avec timeout de 5 minutes)
             max_wait_seconds = 300  # 5 minutes
-            poll_interval = 3
-            elapsed = 0
             
-            while prediction.status not in ["succeeded", "failed", "canceled"]:
-                if elapsed >= max_wait_seconds:
-                    raise Exception(f"Timeout: La génération a dépassé {max_wait_seconds//60} minutes")
-                
-                await asyncio.sleep(poll_interval)
-                elapsed += poll_interval
-                
-                prediction.reload()
-                logging.info(f"Status après {elapsed}s: {prediction.status}")
+            # Attente de la fin (webhook, ou poller central en secours)
+            prediction, elapsed = await prediction_tracker.wait(prediction, max_wait_seconds)
+            
+            if prediction.status not in ["succeeded", "failed", "canceled"]:
+                raise Exception(f"Timeout: La génération a dépassé {max_wait_seconds//60} minutes")
             
             if prediction.status == "failed":
                 error_msg = prediction.error or "Erreur inconnue"
@@ -1712,7 +1707,7 @@ async def generate_video_with_alibaba_wan(request: GenerateAlibabaWanRequest):
                 {"$set": {"last_updated": datetime.utcnow()}}
             )
             
-            await db.alibaba_wan_messages.insert_one(error_assistant_message.dict())
+            await db.alibaba_wan_messages.insert_one(await blob_store.externalize_message(error_assistant_message.dict()))
             
             return GenerateAlibabaWanResponse(
                 session_id=request.session_id,
@@ -1738,7 +1733,7 @@ async def generate_video_with_alibaba_wan(request: GenerateAlibabaWanRequest):
         )
         
         # Insérer le message assistant
-        await db.alibaba_wan_messages.insert_one(assistant_message.dict())
+        await db.alibaba_wan_messages.insert_one(await blob_store.externalize_message(assistant_message.dict()))
         
         return GenerateAlibabaWanResponse(
             session_id=request.session_id,
@@ -1754,11 +1749,22 @@ async def generate_video_with_alibaba_wan(request: GenerateAlibabaWanRequest):
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.get("/alibaba-wan/session/{session_id}", response_model=List[AlibabaWanMessage])
-async def get_alibaba_wan_conversation(session_id: str):
+async def get_alibaba_wan_conversation(session_id: str, request: Request, response: Response, page: MessagePage = Depends()):
     """Récupère l'historique de conversation d'une session Alibaba Wan"""
     try:
-        messages = await db.alibaba_wan_messages.find({"session_id": session_id}).sort("timestamp", 1).to_list(None)
+        # Session inchangée depuis la dernière lecture : 304 sans charger les messages
+        etag = await session_etag(db.alibaba_wan_sessions, db.alibaba_wan_messages, session_id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        # Page de messages (toute la session sans paramètre de pagination)
+        messages = await page.fetch(db.alibaba_wan_messages, session_id, response, max_messages=None)
+        if page.fields:
+            return projected_response(messages, response)
         return [AlibabaWanMessage(**msg) for msg in messages]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de l'historique Alibaba Wan: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
@@ -1767,11 +1773,9 @@ async def get_alibaba_wan_conversation(session_id: str):
 # Video Upscale AI endpoints (Video Upscaling)
 
 @api_router.post("/video-upscale/session", response_model=VideoUpscaleSession)
-async def create_video_upscale_session(authorization: Optional[str] = Header(None)):
+async def create_video_upscale_session(user_id: Optional[str] = Depends(get_current_user_id)):
     """Crée ou récupère une session video-upscale pour l'utilisateur"""
     try:
-        user_id = get_user_id_from_token(authorization)
-        
         # Si l'utilisateur est connecté, chercher sa session existante
         if user_id:
             existing_session = await db.video_upscale_sessions.find_one(
@@ -1780,11 +1784,13 @@ async def create_video_upscale_session(authorization: Optional[str] = Header(Non
             )
             if existing_session:
                 logger.info(f"📂 Session video-upscale existante trouvée pour user {user_id}")
+                known_sessions.remember("video_upscale_sessions", existing_session["id"])
                 return VideoUpscaleSession(**existing_session)
         
         # Créer une nouvelle session
         session = VideoUpscaleSession(user_id=user_id)
         await db.video_upscale_sessions.insert_one(session.dict())
+        known_sessions.remember("video_upscale_sessions", session.id)
         logger.info(f"✨ Nouvelle session video-upscale créée pour user {user_id or 'anonymous'}")
         return session
     except Exception as e:
@@ -1792,12 +1798,15 @@ async def create_video_upscale_session(authorization: Optional[str] = Header(Non
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.post("/video-upscale/generate", response_model=GenerateVideoUpscaleResponse)
-async def upscale_video(request: GenerateVideoUpscaleRequest):
+@model_scheduler.limit("topaz_video_upscale")
+async def upscale_video(request: GenerateVideoUpscaleRequest, async_mode: bool = False):
     """Upscale une vidéo avec Topaz Video Upscale AI"""
+    if async_mode:
+        return await job_manager.submit("video_upscale", request)
+
     try:
-        # Créer ou récupérer la session
-        session = await db.video_upscale_sessions.find_one({"id": request.session_id})
-        if not session:
+        # Créer ou récupérer la session (déjà vue par ce processus : aucune lecture Mongo)
+        if not await known_sessions.ensure(db.video_upscale_sessions, request.session_id):
             raise HTTPException(status_code=404, detail="Session non trouvée")
         
         # Convertir la vidéo data URL en URL publique
@@ -1812,13 +1821,16 @@ async def upscale_video(request: GenerateVideoUpscaleRequest):
             header, encoded = request.video_input.split(",", 1)
             video_data = base64.b64decode(encoded)
             
-            # Generate unique filename
-            filename = f"{uuid.uuid4()}.mp4"
+            # Content-addressed filename: the same video is stored once and keeps its URL
+            filename = f"{hashlib.sha256(video_data).hexdigest()[:32]}.mp4"
             filepath = TEMP_IMAGES_DIR / filename
             
-            # Save video
-            with open(filepath, "wb") as f:
-                f.write(video_data)
+            # Save video (temporary name then rename, so a partial file is never served)
+            if not filepath.exists():
+                tmp_path = TEMP_IMAGES_DIR / f".{filename}.{uuid.uuid4().hex}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(video_data)
+                os.replace(tmp_path, filepath)
             
             # Return public URL
             video_input_url = f"{backend_url}/api/temp-images/{filename}"
@@ -1838,7 +1850,7 @@ async def upscale_video(request: GenerateVideoUpscaleRequest):
             content=user_content,
             video_urls=[video_input_url]
         )
-        await db.video_upscale_messages.insert_one(user_message.dict())
+        await db.video_upscale_messages.insert_one(await blob_store.externalize_message(user_message.dict()))
         
         # Upscaler la vidéo avec Replicate en mode asynchrone
         try:
@@ -1853,10 +1865,8 @@ async def upscale_video(request: GenerateVideoUpscaleRequest):
             }
             
             # Créer une prediction asynchrone
-            client = replicate.Client(api_token=os.environ.get('REPLICATE_API_TOKEN'))
-            
-            prediction = client.predictions.create(
-                model="topazlabs/video-upscale",
+            prediction = await prediction_tracker.start(
+                "topazlabs/video-upscale",
                 input=inputs
             )
             
@@ -1864,18 +1874,12 @@ async def upscale_video(request: GenerateVideoUpscaleRequest):
             
             # Attendre que l'upscaling soit terminé (avec timeout de 10 minutes)
             max_wait_seconds = 600  # 10 minutes
-            poll_interval = 5
-            elapsed = 0
             
-            while prediction.status not in ["succeeded", "failed", "canceled"]:
-                if elapsed >= max_wait_seconds:
-                    raise Exception(f"Timeout: L'upscaling a dépassé {max_wait_seconds//60} minutes")
-                
-                await asyncio.sleep(poll_interval)
-                elapsed += poll_interval
-                
-                prediction.reload()
-                logging.info(f"Status après {elapsed}s: {prediction.status}")
+            # Attente de la fin (webhook, ou poller central en secours)
+            prediction, elapsed = await prediction_tracker.wait(prediction, max_wait_seconds)
+            
+            if prediction.status not in ["succeeded", "failed", "canceled"]:
+                raise Exception(f"Timeout: L'upscaling a dépassé {max_wait_seconds//60} minutes")
             
             if prediction.status == "failed":
                 error_msg = prediction.error or "Erreur inconnue"
@@ -1911,7 +1915,7 @@ async def upscale_video(request: GenerateVideoUpscaleRequest):
                 {"$set": {"last_updated": datetime.utcnow()}}
             )
             
-            await db.video_upscale_messages.insert_one(error_assistant_message.dict())
+            await db.video_upscale_messages.insert_one(await blob_store.externalize_message(error_assistant_message.dict()))
             
             return GenerateVideoUpscaleResponse(
                 session_id=request.session_id,
@@ -1937,7 +1941,7 @@ async def upscale_video(request: GenerateVideoUpscaleRequest):
         )
         
         # Insérer le message assistant
-        await db.video_upscale_messages.insert_one(assistant_message.dict())
+        await db.video_upscale_messages.insert_one(await blob_store.externalize_message(assistant_message.dict()))
         
         return GenerateVideoUpscaleResponse(
             session_id=request.session_id,
@@ -1953,11 +1957,22 @@ async def upscale_video(request: GenerateVideoUpscaleRequest):
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.get("/video-upscale/session/{session_id}", response_model=List[VideoUpscaleMessage])
-async def get_video_upscale_conversation(session_id: str):
+async def get_video_upscale_conversation(session_id: str, request: Request, response: Response, page: MessagePage = Depends()):
     """Récupère l'historique de conversation d'une session Video Upscale"""
     try:
-        messages = await db.video_upscale_messages.find({"session_id": session_id}).sort("timestamp", 1).to_list(None)
+        # Session inchangée depuis la dernière lecture : 304 sans charger les messages
+        etag = await session_etag(db.video_upscale_sessions, db.video_upscale_messages, session_id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        # Page de messages (toute la session sans paramètre de pagination)
+        messages = await page.fetch(db.video_upscale_messages, session_id, response, max_messages=None)
+        if page.fields:
+            return projected_response(messages, response)
         return [VideoUpscaleMessage(**msg) for msg in messages]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de l'historique Video Upscale: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
@@ -1966,11 +1981,9 @@ async def get_video_upscale_conversation(session_id: str):
 # Google Veo 3.1 endpoints (Video Generation)
 
 @api_router.post("/google-veo/session", response_model=GoogleVeoSession)
-async def create_google_veo_session(authorization: Optional[str] = Header(None)):
+async def create_google_veo_session(user_id: Optional[str] = Depends(get_current_user_id)):
     """Crée ou récupère une session google-veo pour l'utilisateur"""
     try:
-        user_id = get_user_id_from_token(authorization)
-        
         # Si l'utilisateur est connecté, chercher sa session existante
         if user_id:
             existing_session = await db.google_veo_sessions.find_one(
@@ -1979,11 +1992,13 @@ async def create_google_veo_session(authorization: Optional[str] = Header(None))
             )
             if existing_session:
                 logger.info(f"📂 Session google-veo existante trouvée pour user {user_id}")
+                known_sessions.remember("google_veo_sessions", existing_session["id"])
                 return GoogleVeoSession(**existing_session)
         
         # Créer une nouvelle session
         session = GoogleVeoSession(user_id=user_id)
         await db.google_veo_sessions.insert_one(session.dict())
+        known_sessions.remember("google_veo_sessions", session.id)
         logger.info(f"✨ Nouvelle session google-veo créée pour user {user_id or 'anonymous'}")
         return session
     except Exception as e:
@@ -1991,15 +2006,18 @@ async def create_google_veo_session(authorization: Optional[str] = Header(None))
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.post("/google-veo/generate", response_model=GenerateVideoResponse)
-async def generate_video_with_veo(request: GenerateVideoRequest):
+@model_scheduler.limit("google_veo_3_1")
+async def generate_video_with_veo(request: GenerateVideoRequest, async_mode: bool = False):
     """Génère une vidéo avec Google Veo 3.1"""
+    if async_mode:
+        return await job_manager.submit("google_veo", request)
+
     try:
-        # Créer ou récupérer la session
-        session = await db.google_veo_sessions.find_one({"id": request.session_id})
-        if not session:
-            session_obj = GoogleVeoSession(id=request.session_id)
-            await db.google_veo_sessions.insert_one(session_obj.dict())
-            session = session_obj.dict()
+        # Créer ou récupérer la session (déjà vue par ce processus : aucune lecture Mongo)
+        await known_sessions.ensure(
+            db.google_veo_sessions, request.session_id,
+            create=lambda: GoogleVeoSession(id=request.session_id).dict()
+        )
 
         # Sauvegarder le message utilisateur
         user_message = GoogleVeoMessage(
@@ -2007,7 +2025,7 @@ async def generate_video_with_veo(request: GenerateVideoRequest):
             role="user",
             content=request.prompt
         )
-        await db.google_veo_messages.insert_one(user_message.dict())
+        await db.google_veo_messages.insert_one(await blob_store.externalize_message(user_message.dict()))
 
         # Utiliser l'API Replicate avec le modèle google/veo-3.1
         replicate_token = os.environ.get('REPLICATE_API_TOKEN')
@@ -2035,7 +2053,7 @@ async def generate_video_with_veo(request: GenerateVideoRequest):
                 backend_url = os.environ.get('BACKEND_URL', 'http://localhost:8001')
                 # Si c'est un data URL, le convertir en URL publique avec redimensionnement pour Veo
                 if request.image.startswith('data:'):
-                    image_url = data_url_to_public_url(request.image, backend_url, resize_for_veo=True)
+                    image_url = await providers.run_blocking(data_url_to_public_url, request.image, backend_url, resize_for_veo=True)
                     # Utiliser 'image' pour l'image-to-video
                     inputs["image"] = image_url
                 else:
@@ -2058,7 +2076,7 @@ async def generate_video_with_veo(request: GenerateVideoRequest):
             logging.info(f"Génération de vidéo avec Replicate - modèle: {model}, prompt: {request.prompt}")
             logging.info(f"Inputs envoyés à Replicate: {inputs}")
             
-            output = replicate.run(
+            output = await providers.run_model(
                 model,
                 input=inputs
             )
@@ -2100,7 +2118,7 @@ async def generate_video_with_veo(request: GenerateVideoRequest):
             content=response_text or "Vidéo générée avec succès !",
             video_urls=video_urls
         )
-        await db.google_veo_messages.insert_one(assistant_message.dict())
+        await db.google_veo_messages.insert_one(await blob_store.externalize_message(assistant_message.dict()))
 
         # Mettre à jour la session
         await db.google_veo_sessions.update_one(
@@ -2123,14 +2141,22 @@ async def generate_video_with_veo(request: GenerateVideoRequest):
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.get("/google-veo/session/{session_id}", response_model=List[GoogleVeoMessage])
-async def get_google_veo_session(session_id: str):
+async def get_google_veo_session(session_id: str, request: Request, response: Response, page: MessagePage = Depends()):
     """Récupère l'historique d'une session Google Veo 3.1"""
     try:
-        messages = await db.google_veo_messages.find(
-            {"session_id": session_id}
-        ).sort("timestamp", 1).to_list(1000)
-        
+        # Session inchangée depuis la dernière lecture : 304 sans charger les messages
+        etag = await session_etag(db.google_veo_sessions, db.google_veo_messages, session_id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        # Page de messages (toute la session sans paramètre de pagination)
+        messages = await page.fetch(db.google_veo_messages, session_id, response, max_messages=1000)
+        if page.fields:
+            return projected_response(messages, response)
         return [GoogleVeoMessage(**msg) for msg in messages]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de l'historique: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
@@ -2140,11 +2166,9 @@ async def get_google_veo_session(session_id: str):
 # SORA 2 endpoints (Video Generation)
 
 @api_router.post("/sora2/session", response_model=Sora2Session)
-async def create_sora2_session(authorization: Optional[str] = Header(None)):
+async def create_sora2_session(user_id: Optional[str] = Depends(get_current_user_id)):
     """Crée ou récupère une session sora2 pour l'utilisateur"""
     try:
-        user_id = get_user_id_from_token(authorization)
-        
         # Si l'utilisateur est connecté, chercher sa session existante
         if user_id:
             existing_session = await db.sora2_sessions.find_one(
@@ -2153,11 +2177,13 @@ async def create_sora2_session(authorization: Optional[str] = Header(None)):
             )
             if existing_session:
                 logger.info(f"📂 Session sora2 existante trouvée pour user {user_id}")
+                known_sessions.remember("sora2_sessions", existing_session["id"])
                 return Sora2Session(**existing_session)
         
         # Créer une nouvelle session
         session = Sora2Session(user_id=user_id)
         await db.sora2_sessions.insert_one(session.dict())
+        known_sessions.remember("sora2_sessions", session.id)
         logger.info(f"✨ Nouvelle session sora2 créée pour user {user_id or 'anonymous'}")
         return session
     except Exception as e:
@@ -2165,15 +2191,18 @@ async def create_sora2_session(authorization: Optional[str] = Header(None)):
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.post("/sora2/generate", response_model=GenerateVideoSora2Response)
-async def generate_video_with_sora2(request: GenerateVideoSora2Request):
+@model_scheduler.limit("sora_2")
+async def generate_video_with_sora2(request: GenerateVideoSora2Request, async_mode: bool = False):
     """Génère une vidéo avec SORA 2"""
+    if async_mode:
+        return await job_manager.submit("sora2", request)
+
     try:
-        # Créer ou récupérer la session
-        session = await db.sora2_sessions.find_one({"id": request.session_id})
-        if not session:
-            session_obj = Sora2Session(id=request.session_id)
-            await db.sora2_sessions.insert_one(session_obj.dict())
-            session = session_obj.dict()
+        # Créer ou récupérer la session (déjà vue par ce processus : aucune lecture Mongo)
+        await known_sessions.ensure(
+            db.sora2_sessions, request.session_id,
+            create=lambda: Sora2Session(id=request.session_id).dict()
+        )
 
         # Sauvegarder le message utilisateur
         user_message = Sora2Message(
@@ -2181,7 +2210,7 @@ async def generate_video_with_sora2(request: GenerateVideoSora2Request):
             role="user",
             content=request.prompt
         )
-        await db.sora2_messages.insert_one(user_message.dict())
+        await db.sora2_messages.insert_one(await blob_store.externalize_message(user_message.dict()))
 
         # Utiliser l'API Replicate avec le modèle openai/sora-2
         replicate_token = os.environ.get('REPLICATE_API_TOKEN')
@@ -2213,7 +2242,7 @@ async def generate_video_with_sora2(request: GenerateVideoSora2Request):
             # Générer la vidéo avec Replicate
             logging.info(f"Génération de vidéo avec Replicate - modèle: openai/sora-2, prompt: {request.prompt}")
             
-            output = replicate.run(
+            output = await providers.run_model(
                 "openai/sora-2",
                 input=inputs
             )
@@ -2256,7 +2285,7 @@ async def generate_video_with_sora2(request: GenerateVideoSora2Request):
             content=response_text or "Vidéo générée avec succès !",
             video_urls=video_urls
         )
-        await db.sora2_messages.insert_one(assistant_message.dict())
+        await db.sora2_messages.insert_one(await blob_store.externalize_message(assistant_message.dict()))
 
         # Mettre à jour la session
         await db.sora2_sessions.update_one(
@@ -2279,14 +2308,22 @@ async def generate_video_with_sora2(request: GenerateVideoSora2Request):
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.get("/sora2/session/{session_id}", response_model=List[Sora2Message])
-async def get_sora2_session(session_id: str):
+async def get_sora2_session(session_id: str, request: Request, response: Response, page: MessagePage = Depends()):
     """Récupère l'historique d'une session SORA 2"""
     try:
-        messages = await db.sora2_messages.find(
-            {"session_id": session_id}
-        ).sort("timestamp", 1).to_list(1000)
-        
+        # Session inchangée depuis la dernière lecture : 304 sans charger les messages
+        etag = await session_etag(db.sora2_sessions, db.sora2_messages, session_id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        # Page de messages (toute la session sans paramètre de pagination)
+        messages = await page.fetch(db.sora2_messages, session_id, response, max_messages=1000)
+        if page.fields:
+            return projected_response(messages, response)
         return [Sora2Message(**msg) for msg in messages]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de l'historique: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
@@ -2294,16 +2331,18 @@ async def get_sora2_session(session_id: str):
 # ChatGPT-5 endpoints
 
 @api_router.post("/chatgpt5/generate", response_model=ChatGPT5Response)
-async def chat_with_gpt5(request: ChatGPT5Request):
+@model_scheduler.limit("chatgpt")
+async def chat_with_gpt5(request: ChatGPT5Request, async_mode: bool = False):
     """Chat avec ChatGPT-5 (OpenAI GPT-5)"""
+    if async_mode:
+        return await job_manager.submit("chatgpt5", request)
+
     try:
-        # Créer ou récupérer la session
-        session = await db.chatgpt5_sessions.find_one({"id": request.session_id})
-        if not session:
-            # Créer une nouvelle session
-            session_obj = ChatGPT5Session(id=request.session_id)
-            await db.chatgpt5_sessions.insert_one(session_obj.dict())
-            session = session_obj.dict()
+        # Créer ou récupérer la session (déjà vue par ce processus : aucune lecture Mongo)
+        await known_sessions.ensure(
+            db.chatgpt5_sessions, request.session_id,
+            create=lambda: ChatGPT5Session(id=request.session_id).dict()
+        )
 
         # Sauvegarder le message utilisateur avec l'image si présente
         user_image_urls = []
@@ -2317,7 +2356,8 @@ async def chat_with_gpt5(request: ChatGPT5Request):
             content=request.prompt,
             image_urls=user_image_urls
         )
-        await db.chatgpt5_messages.insert_one(user_message.dict())
+        await db.chatgpt5_messages.insert_one(await blob_store.externalize_message(user_message.dict()))
+        chatgpt5_context.append(request.session_id, "user", user_message.content)
 
         # Générer la réponse avec ChatGPT-5
         api_key = os.environ.get('EMERGENT_LLM_KEY')
@@ -2337,18 +2377,8 @@ async def chat_with_gpt5(request: ChatGPT5Request):
             
             chat = chat.with_model("openai", "gpt-4o")  # Utiliser gpt-4o pour l'analyse d'images
             
-            # Récupérer TOUT l'historique de la conversation pour le contexte
-            all_messages = await db.chatgpt5_messages.find(
-                {"session_id": request.session_id}
-            ).sort("timestamp", 1).to_list(1000)
-            
-            # Construire l'historique complet pour le contexte
-            conversation_context = []
-            for msg in all_messages:
-                if msg['role'] == 'user':
-                    conversation_context.append(f"Utilisateur: {msg['content']}")
-                else:
-                    conversation_context.append(f"Assistant: {msg['content']}")
+            # Contexte : derniers messages de la conversation (tampon en mémoire, relu en base si absent)
+            conversation_context = await chatgpt5_context.get(request.session_id)
             
             # Créer le message utilisateur avec ou sans image
             if request.image_data and request.image_name:
@@ -2418,7 +2448,8 @@ async def chat_with_gpt5(request: ChatGPT5Request):
             role="assistant", 
             content=response_text
         )
-        await db.chatgpt5_messages.insert_one(assistant_message.dict())
+        await db.chatgpt5_messages.insert_one(await blob_store.externalize_message(assistant_message.dict()))
+        chatgpt5_context.append(request.session_id, "assistant", assistant_message.content)
 
         # Mettre à jour la session
         await db.chatgpt5_sessions.update_one(
@@ -2438,24 +2469,30 @@ async def chat_with_gpt5(request: ChatGPT5Request):
         raise HTTPException(status_code=500, detail=f"Erreur lors du chat: {str(e)}")
 
 @api_router.get("/chatgpt5/session/{session_id}", response_model=List[ChatGPT5Message])
-async def get_chatgpt5_session(session_id: str):
+async def get_chatgpt5_session(session_id: str, request: Request, response: Response, page: MessagePage = Depends()):
     """Récupère l'historique d'une session ChatGPT-5"""
     try:
-        messages = await db.chatgpt5_messages.find(
-            {"session_id": session_id}
-        ).sort("timestamp", 1).to_list(1000)
-        
+        # Session inchangée depuis la dernière lecture : 304 sans charger les messages
+        etag = await session_etag(db.chatgpt5_sessions, db.chatgpt5_messages, session_id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        # Page de messages (toute la session sans paramètre de pagination)
+        messages = await page.fetch(db.chatgpt5_messages, session_id, response, max_messages=1000)
+        if page.fields:
+            return projected_response(messages, response)
         return [ChatGPT5Message(**msg) for msg in messages]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de session: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.post("/chatgpt5/session", response_model=ChatGPT5Session)
-async def create_chatgpt5_session(authorization: Optional[str] = Header(None)):
+async def create_chatgpt5_session(user_id: Optional[str] = Depends(get_current_user_id)):
     """Crée ou récupère une session chatgpt5 pour l'utilisateur"""
     try:
-        user_id = get_user_id_from_token(authorization)
-        
         # Si l'utilisateur est connecté, chercher sa session existante
         if user_id:
             existing_session = await db.chatgpt5_sessions.find_one(
@@ -2464,11 +2501,13 @@ async def create_chatgpt5_session(authorization: Optional[str] = Header(None)):
             )
             if existing_session:
                 logger.info(f"📂 Session chatgpt5 existante trouvée pour user {user_id}")
+                known_sessions.remember("chatgpt5_sessions", existing_session["id"])
                 return ChatGPT5Session(**existing_session)
         
         # Créer une nouvelle session
         session = ChatGPT5Session(user_id=user_id)
         await db.chatgpt5_sessions.insert_one(session.dict())
+        known_sessions.remember("chatgpt5_sessions", session.id)
         logger.info(f"✨ Nouvelle session chatgpt5 créée pour user {user_id or 'anonymous'}")
         return session
     except Exception as e:
@@ -2489,11 +2528,9 @@ async def get_chatgpt5_sessions():
 # AI Image Upscaler endpoints
 
 @api_router.post("/image-upscaler/session", response_model=ImageUpscalerSession)
-async def create_image_upscaler_session(authorization: Optional[str] = Header(None)):
+async def create_image_upscaler_session(user_id: Optional[str] = Depends(get_current_user_id)):
     """Crée ou récupère une session image-upscaler pour l'utilisateur"""
     try:
-        user_id = get_user_id_from_token(authorization)
-        
         # Si l'utilisateur est connecté, chercher sa session existante
         if user_id:
             existing_session = await db.image_upscaler_sessions.find_one(
@@ -2502,11 +2539,13 @@ async def create_image_upscaler_session(authorization: Optional[str] = Header(No
             )
             if existing_session:
                 logger.info(f"📂 Session image-upscaler existante trouvée pour user {user_id}")
+                known_sessions.remember("image_upscaler_sessions", existing_session["id"])
                 return ImageUpscalerSession(**existing_session)
         
         # Créer une nouvelle session
         session = ImageUpscalerSession(user_id=user_id)
         await db.image_upscaler_sessions.insert_one(session.dict())
+        known_sessions.remember("image_upscaler_sessions", session.id)
         logger.info(f"✨ Nouvelle session image-upscaler créée pour user {user_id or 'anonymous'}")
         return session
     except Exception as e:
@@ -2514,15 +2553,18 @@ async def create_image_upscaler_session(authorization: Optional[str] = Header(No
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.post("/image-upscaler/upscale", response_model=UpscaleImageResponse)
-async def upscale_image(request: UpscaleImageRequest):
+@model_scheduler.limit("image_upscaler")
+async def upscale_image(request: UpscaleImageRequest, async_mode: bool = False):
     """Upscale une image avec AI Image Upscaler"""
+    if async_mode:
+        return await job_manager.submit("image_upscaler", request)
+
     try:
-        # Créer ou récupérer la session
-        session = await db.image_upscaler_sessions.find_one({"id": request.session_id})
-        if not session:
-            session_obj = ImageUpscalerSession(id=request.session_id)
-            await db.image_upscaler_sessions.insert_one(session_obj.dict())
-            session = session_obj.dict()
+        # Créer ou récupérer la session (déjà vue par ce processus : aucune lecture Mongo)
+        await known_sessions.ensure(
+            db.image_upscaler_sessions, request.session_id,
+            create=lambda: ImageUpscalerSession(id=request.session_id).dict()
+        )
 
         # Sauvegarder le message utilisateur avec l'image originale
         user_message = ImageUpscalerMessage(
@@ -2531,7 +2573,7 @@ async def upscale_image(request: UpscaleImageRequest):
             content=f"Upscale de l'image avec facteur X{request.scale_factor}",
             image_urls=[request.image_data]
         )
-        await db.image_upscaler_messages.insert_one(user_message.dict())
+        await db.image_upscaler_messages.insert_one(await blob_store.externalize_message(user_message.dict()))
 
         # Vérifier le token Replicate
         replicate_token = os.environ.get('REPLICATE_API_TOKEN')
@@ -2558,7 +2600,7 @@ async def upscale_image(request: UpscaleImageRequest):
             # Upscaler l'image avec Replicate
             logging.info(f"Upscaling d'image avec Replicate - modèle: philz1337x/crystal-upscaler, scale: X{request.scale_factor}")
             
-            output = replicate.run(
+            output = await providers.run_model(
                 "philz1337x/crystal-upscaler",
                 input=inputs
             )
@@ -2574,11 +2616,10 @@ async def upscale_image(request: UpscaleImageRequest):
             if upscaled_url:
                 # Télécharger l'image upscalée et la convertir en base64
                 logging.info(f"Téléchargement de l'image upscalée depuis: {upscaled_url}")
-                response_img = requests.get(upscaled_url, timeout=60)
-                response_img.raise_for_status()
+                image_content = await http_client.download_bytes(upscaled_url, timeout=60)
                 
                 # Convertir en base64
-                image_base64 = base64.b64encode(response_img.content).decode('utf-8')
+                image_base64 = base64.b64encode(image_content).decode('utf-8')
                 image_data_url = f"data:image/png;base64,{image_base64}"
                 
                 image_urls = [image_data_url]
@@ -2610,7 +2651,7 @@ async def upscale_image(request: UpscaleImageRequest):
             content=response_text,
             image_urls=image_urls
         )
-        await db.image_upscaler_messages.insert_one(assistant_message.dict())
+        await db.image_upscaler_messages.insert_one(await blob_store.externalize_message(assistant_message.dict()))
 
         # Mettre à jour la session
         await db.image_upscaler_sessions.update_one(
@@ -2632,51 +2673,48 @@ async def upscale_image(request: UpscaleImageRequest):
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.get("/image-upscaler/session/{session_id}", response_model=List[ImageUpscalerMessage])
-async def get_image_upscaler_session(session_id: str):
+async def get_image_upscaler_session(session_id: str, request: Request, response: Response, page: MessagePage = Depends()):
     """Récupère l'historique d'une session AI Image Upscaler"""
     try:
-        messages = await db.image_upscaler_messages.find(
-            {"session_id": session_id}
-        ).sort("timestamp", 1).to_list(1000)
-        
+        # Session inchangée depuis la dernière lecture : 304 sans charger les messages
+        etag = await session_etag(db.image_upscaler_sessions, db.image_upscaler_messages, session_id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        # Page de messages (toute la session sans paramètre de pagination)
+        messages = await page.fetch(db.image_upscaler_messages, session_id, response, max_messages=1000)
+        if page.fields:
+            return projected_response(messages, response)
         return [ImageUpscalerMessage(**msg) for msg in messages]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de session: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
-# Endpoint to serve temporary images (under /api prefix)
-@api_router.api_route("/temp-images/{filename}", methods=["GET", "HEAD"])
-async def serve_temp_image(filename: str, request: Request):
-    """Serve temporary images for Replicate API (supports GET and HEAD for validation)"""
-    filepath = TEMP_IMAGES_DIR / filename
-    if not filepath.exists():
-        raise HTTPException(status_code=404, detail="Image not found")
-    
-    # For HEAD requests, Replicate just wants to validate the file exists
-    # Return appropriate headers without the body
-    if request.method == "HEAD":
-        return Response(
-            status_code=200,
-            headers={
-                "Content-Type": "image/jpeg",
-                "Content-Length": str(filepath.stat().st_size),
-                "Accept-Ranges": "bytes"
-            }
-        )
-    
-    # For GET requests, return the actual file
-    return FileResponse(filepath)
-
-
+@api_router.get("/providers/stats")
+async def get_providers_stats():
+    """Métriques de la couche fournisseur (appels en cours, file d'attente, durées)"""
+    return {
+        **providers.get_provider_stats(),
+        "predictions": prediction_tracker.get_stats(),
+        "jobs": await job_manager.get_stats(),
+        "scheduler": model_scheduler.get_stats(),
+        "single_flight": generation_flights.get_stats(),
+        "result_cache": result_cache.get_stats(),
+        "known_sessions": known_sessions.get_stats(),
+        "chatgpt5_context": chatgpt5_context.get_stats(),
+        "blobs": blob_store.get_stats(),
+        "veo_variants": get_veo_variant_stats()
+    }
 
 # ==================== NANO BANANA PRO ENDPOINTS ====================
 
 @api_router.post("/nanobanana-pro/session", response_model=NanoBananaProSession)
-async def create_nanobanana_pro_session(authorization: Optional[str] = Header(None)):
+async def create_nanobanana_pro_session(user_id: Optional[str] = Depends(get_current_user_id)):
     """Crée ou récupère une session Nano Banana Pro pour l'utilisateur"""
     try:
-        user_id = get_user_id_from_token(authorization)
-        
         # Si l'utilisateur est connecté, chercher sa session existante
         if user_id:
             existing_session = await db.nanobanana_pro_sessions.find_one(
@@ -2685,11 +2723,13 @@ async def create_nanobanana_pro_session(authorization: Optional[str] = Header(No
             )
             if existing_session:
                 logger.info(f"📂 Session Nano Banana Pro existante trouvée pour user {user_id}")
+                known_sessions.remember("nanobanana_pro_sessions", existing_session["id"])
                 return NanoBananaProSession(**existing_session)
         
         # Créer une nouvelle session
         session = NanoBananaProSession(user_id=user_id)
         await db.nanobanana_pro_sessions.insert_one(session.dict())
+        known_sessions.remember("nanobanana_pro_sessions", session.id)
         logger.info(f"✨ Nouvelle session Nano Banana Pro créée pour user {user_id or 'anonymous'}")
         return session
     except Exception as e:
@@ -2697,15 +2737,18 @@ async def create_nanobanana_pro_session(authorization: Optional[str] = Header(No
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.post("/nanobanana-pro/generate", response_model=GenerateNanoBananaProResponse)
-async def generate_image_with_nanobanana_pro(request: GenerateNanoBananaProRequest):
+@model_scheduler.limit("nano_banana_pro")
+async def generate_image_with_nanobanana_pro(request: GenerateNanoBananaProRequest, async_mode: bool = False):
     """Génère une image avec Nano Banana Pro (Google Gemini 3 Pro)"""
+    if async_mode:
+        return await job_manager.submit("nanobanana_pro", request)
+
     try:
-        # Créer ou récupérer la session
-        session = await db.nanobanana_pro_sessions.find_one({"id": request.session_id})
-        if not session:
-            session_obj = NanoBananaProSession(id=request.session_id)
-            await db.nanobanana_pro_sessions.insert_one(session_obj.dict())
-            session = session_obj.dict()
+        # Créer ou récupérer la session (déjà vue par ce processus : aucune lecture Mongo)
+        await known_sessions.ensure(
+            db.nanobanana_pro_sessions, request.session_id,
+            create=lambda: NanoBananaProSession(id=request.session_id).dict()
+        )
 
         # Sauvegarder le message utilisateur avec les images si présentes
         user_image_urls = request.image_input or []
@@ -2716,7 +2759,7 @@ async def generate_image_with_nanobanana_pro(request: GenerateNanoBananaProReque
             content=request.prompt,
             image_urls=user_image_urls
         )
-        await db.nanobanana_pro_messages.insert_one(user_message.dict())
+        await db.nanobanana_pro_messages.insert_one(await blob_store.externalize_message(user_message.dict()))
 
         # Générer l'image avec Replicate
         replicate_token = os.environ.get('REPLICATE_API_TOKEN')
@@ -2740,7 +2783,7 @@ async def generate_image_with_nanobanana_pro(request: GenerateNanoBananaProReque
             # Générer l'image avec Replicate
             logging.info(f"Génération d'image avec Replicate - modèle: google/nano-banana-pro, prompt: {request.prompt}")
             
-            output = replicate.run(
+            output = await providers.run_model(
                 "google/nano-banana-pro",
                 input=inputs
             )
@@ -2753,12 +2796,11 @@ async def generate_image_with_nanobanana_pro(request: GenerateNanoBananaProReque
             
             # Télécharger l'image depuis l'URL et convertir en base64
             logging.info(f"Téléchargement de l'image depuis: {image_url}")
-            response_req = requests.get(image_url, timeout=30)
-            response_req.raise_for_status()
+            image_content = await http_client.download_bytes(image_url, timeout=30)
             
             # Corriger l'orientation EXIF avant de convertir en base64
             try:
-                img = Image.open(io.BytesIO(response_req.content))
+                img = Image.open(io.BytesIO(image_content))
                 # Corriger automatiquement l'orientation selon les métadonnées EXIF
                 img = ImageOps.exif_transpose(img)
                 # Sauvegarder dans un buffer
@@ -2772,7 +2814,7 @@ async def generate_image_with_nanobanana_pro(request: GenerateNanoBananaProReque
             except Exception as exif_error:
                 logging.warning(f"⚠️ Impossible de corriger l'orientation EXIF: {exif_error}, utilisation de l'image originale")
                 # Fallback : utiliser l'image originale
-                image_base64 = base64.b64encode(response_req.content).decode('utf-8')
+                image_base64 = base64.b64encode(image_content).decode('utf-8')
                 image_data_url = f"data:image/jpeg;base64,{image_base64}"
             
             image_urls = [image_data_url]
@@ -2790,7 +2832,7 @@ async def generate_image_with_nanobanana_pro(request: GenerateNanoBananaProReque
             content=response_text,
             image_urls=image_urls
         )
-        await db.nanobanana_pro_messages.insert_one(assistant_message.dict())
+        await db.nanobanana_pro_messages.insert_one(await blob_store.externalize_message(assistant_message.dict()))
 
         # Mettre à jour la session
         await db.nanobanana_pro_sessions.update_one(
@@ -2811,14 +2853,22 @@ async def generate_image_with_nanobanana_pro(request: GenerateNanoBananaProReque
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération: {str(e)}")
 
 @api_router.get("/nanobanana-pro/session/{session_id}", response_model=List[NanoBananaProMessage])
-async def get_nanobanana_pro_session(session_id: str):
+async def get_nanobanana_pro_session(session_id: str, request: Request, response: Response, page: MessagePage = Depends()):
     """Récupère l'historique d'une session Nano Banana Pro"""
     try:
-        messages = await db.nanobanana_pro_messages.find(
-            {"session_id": session_id}
-        ).sort("timestamp", 1).to_list(1000)
-        
+        # Session inchangée depuis la dernière lecture : 304 sans charger les messages
+        etag = await session_etag(db.nanobanana_pro_sessions, db.nanobanana_pro_messages, session_id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        # Page de messages (toute la session sans paramètre de pagination)
+        messages = await page.fetch(db.nanobanana_pro_messages, session_id, response, max_messages=1000)
+        if page.fields:
+            return projected_response(messages, response)
         return [NanoBananaProMessage(**msg) for msg in messages]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de session: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
@@ -2827,11 +2877,9 @@ async def get_nanobanana_pro_session(session_id: str):
 # ==================== GEMINI 3 PRO ENDPOINTS ====================
 
 @api_router.post("/gemini3-pro/session", response_model=Gemini3ProSession)
-async def create_gemini3_pro_session(authorization: Optional[str] = Header(None)):
+async def create_gemini3_pro_session(user_id: Optional[str] = Depends(get_current_user_id)):
     """Crée ou récupère une session Gemini 3 Pro pour l'utilisateur"""
     try:
-        user_id = get_user_id_from_token(authorization)
-        
         # Si l'utilisateur est connecté, chercher sa session existante
         if user_id:
             existing_session = await db.gemini3_pro_sessions.find_one(
@@ -2840,11 +2888,13 @@ async def create_gemini3_pro_session(authorization: Optional[str] = Header(None)
             )
             if existing_session:
                 logger.info(f"📂 Session Gemini 3 Pro existante trouvée pour user {user_id}")
+                known_sessions.remember("gemini3_pro_sessions", existing_session["id"])
                 return Gemini3ProSession(**existing_session)
         
         # Créer une nouvelle session
         session = Gemini3ProSession(user_id=user_id)
         await db.gemini3_pro_sessions.insert_one(session.dict())
+        known_sessions.remember("gemini3_pro_sessions", session.id)
         logger.info(f"✨ Nouvelle session Gemini 3 Pro créée pour user {user_id or 'anonymous'}")
         return session
     except Exception as e:
@@ -2852,15 +2902,18 @@ async def create_gemini3_pro_session(authorization: Optional[str] = Header(None)
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.post("/gemini3-pro/generate", response_model=GenerateGemini3ProResponse)
-async def generate_text_with_gemini3_pro(request: GenerateGemini3ProRequest):
+@model_scheduler.limit("gemini3_pro")
+async def generate_text_with_gemini3_pro(request: GenerateGemini3ProRequest, async_mode: bool = False):
     """Génère du texte avec Gemini 3 Pro"""
+    if async_mode:
+        return await job_manager.submit("gemini3_pro", request)
+
     try:
-        # Créer ou récupérer la session
-        session = await db.gemini3_pro_sessions.find_one({"id": request.session_id})
-        if not session:
-            session_obj = Gemini3ProSession(id=request.session_id)
-            await db.gemini3_pro_sessions.insert_one(session_obj.dict())
-            session = session_obj.dict()
+        # Créer ou récupérer la session (déjà vue par ce processus : aucune lecture Mongo)
+        await known_sessions.ensure(
+            db.gemini3_pro_sessions, request.session_id,
+            create=lambda: Gemini3ProSession(id=request.session_id).dict()
+        )
 
         # Sauvegarder le message utilisateur avec images si présentes
         user_image_urls = request.images or []
@@ -2871,7 +2924,7 @@ async def generate_text_with_gemini3_pro(request: GenerateGemini3ProRequest):
             content=request.prompt,
             image_urls=user_image_urls
         )
-        await db.gemini3_pro_messages.insert_one(user_message.dict())
+        await db.gemini3_pro_messages.insert_one(await blob_store.externalize_message(user_message.dict()))
 
         # Générer la réponse avec Replicate
         replicate_token = os.environ.get('REPLICATE_API_TOKEN')
@@ -2897,18 +2950,12 @@ async def generate_text_with_gemini3_pro(request: GenerateGemini3ProRequest):
             # Générer la réponse avec Replicate
             logging.info(f"Génération de texte avec Replicate - modèle: google/gemini-3-pro, prompt: {request.prompt}")
             
-            output = replicate.run(
+            # Le output est un itérateur de strings, concaténé par la couche fournisseur
+            response_text = await providers.run_text_model(
                 "google/gemini-3-pro",
                 input=inputs
             )
             
-            # Le output est un itérateur de strings
-            response_parts = []
-            for item in output:
-                response_parts.append(str(item))
-            
-            response_text = "".join(response_parts)
-            
             if not response_text:
                 raise Exception("Aucune réponse générée par Replicate")
             
@@ -2926,7 +2973,7 @@ async def generate_text_with_gemini3_pro(request: GenerateGemini3ProRequest):
             content=response_text,
             image_urls=[]
         )
-        await db.gemini3_pro_messages.insert_one(assistant_message.dict())
+        await db.gemini3_pro_messages.insert_one(await blob_store.externalize_message(assistant_message.dict()))
 
         # Mettre à jour la session
         await db.gemini3_pro_sessions.update_one(
@@ -2946,14 +2993,22 @@ async def generate_text_with_gemini3_pro(request: GenerateGemini3ProRequest):
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération: {str(e)}")
 
 @api_router.get("/gemini3-pro/session/{session_id}", response_model=List[Gemini3ProMessage])
-async def get_gemini3_pro_session(session_id: str):
+async def get_gemini3_pro_session(session_id: str, request: Request, response: Response, page: MessagePage = Depends()):
     """Récupère l'historique d'une session Gemini 3 Pro"""
     try:
-        messages = await db.gemini3_pro_messages.find(
-            {"session_id": session_id}
-        ).sort("timestamp", 1).to_list(1000)
-        
+        # Session inchangée depuis la dernière lecture : 304 sans charger les messages
+        etag = await session_etag(db.gemini3_pro_sessions, db.gemini3_pro_messages, session_id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        # Page de messages (toute la session sans paramètre de pagination)
+        messages = await page.fetch(db.gemini3_pro_messages, session_id, response, max_messages=1000)
+        if page.fields:
+            return projected_response(messages, response)
         return [Gemini3ProMessage(**msg) for msg in messages]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de session: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
@@ -2962,11 +3017,9 @@ async def get_gemini3_pro_session(session_id: str):
 # ==================== CHATGPT 5.1 ENDPOINTS ====================
 
 @api_router.post("/chatgpt51/session", response_model=ChatGPT51Session)
-async def create_chatgpt51_session(authorization: Optional[str] = Header(None)):
+async def create_chatgpt51_session(user_id: Optional[str] = Depends(get_current_user_id)):
     """Crée ou récupère une session ChatGPT 5.1 pour l'utilisateur"""
     try:
-        user_id = get_user_id_from_token(authorization)
-        
         # Si l'utilisateur est connecté, chercher sa session existante
         if user_id:
             existing_session = await db.chatgpt51_sessions.find_one(
@@ -2975,11 +3028,13 @@ async def create_chatgpt51_session(authorization: Optional[str] = Header(None)):
             )
             if existing_session:
                 logger.info(f"📂 Session ChatGPT 5.1 existante trouvée pour user {user_id}")
+                known_sessions.remember("chatgpt51_sessions", existing_session["id"])
                 return ChatGPT51Session(**existing_session)
         
         # Créer une nouvelle session
         session = ChatGPT51Session(user_id=user_id)
         await db.chatgpt51_sessions.insert_one(session.dict())
+        known_sessions.remember("chatgpt51_sessions", session.id)
         logger.info(f"✨ Nouvelle session ChatGPT 5.1 créée pour user {user_id or 'anonymous'}")
         return session
     except Exception as e:
@@ -2987,15 +3042,18 @@ async def create_chatgpt51_session(authorization: Optional[str] = Header(None)):
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @api_router.post("/chatgpt51/generate", response_model=GenerateChatGPT51Response)
-async def generate_text_with_chatgpt51(request: GenerateChatGPT51Request):
+@model_scheduler.limit("chatgpt51")
+async def generate_text_with_chatgpt51(request: GenerateChatGPT51Request, async_mode: bool = False):
     """Génère du texte avec ChatGPT 5.1"""
+    if async_mode:
+        return await job_manager.submit("chatgpt51", request)
+
     try:
-        # Créer ou récupérer la session
-        session = await db.chatgpt51_sessions.find_one({"id": request.session_id})
-        if not session:
-            session_obj = ChatGPT51Session(id=request.session_id)
-            await db.chatgpt51_sessions.insert_one(session_obj.dict())
-            session = session_obj.dict()
+        # Créer ou récupérer la session (déjà vue par ce processus : aucune lecture Mongo)
+        await known_sessions.ensure(
+            db.chatgpt51_sessions, request.session_id,
+            create=lambda: ChatGPT51Session(id=request.session_id).dict()
+        )
 
         # Sauvegarder le message utilisateur avec images si présentes
         user_image_urls = request.image_input or []
@@ -3006,7 +3064,7 @@ async def generate_text_with_chatgpt51(request: GenerateChatGPT51Request):
             content=request.prompt,
             image_urls=user_image_urls
         )
-        await db.chatgpt51_messages.insert_one(user_message.dict())
+        await db.chatgpt51_messages.insert_one(await blob_store.externalize_message(user_message.dict()))
 
         # Générer la réponse avec Replicate
         replicate_token = os.environ.get('REPLICATE_API_TOKEN')
@@ -3031,18 +3089,12 @@ async def generate_text_with_chatgpt51(request: GenerateChatGPT51Request):
             # Générer la réponse avec Replicate
             logging.info(f"Génération de texte avec Replicate - modèle: openai/gpt-5.1, prompt: {request.prompt}")
             
-            output = replicate.run(
+            # Le output est un itérateur de strings, concaténé par la couche fournisseur
+            response_text = await providers.run_text_model(
                 "openai/gpt-5.1",
                 input=inputs
             )
             
-            # Le output est un itérateur de strings
-            response_parts = []
-            for item in output:
-                response_parts.append(str(item))
-            
-            response_text = "".join(response_parts)
-            
             if not response_text:
                 raise Exception("Aucune réponse générée par Replicate")
             
@@ -3060,7 +3112,7 @@ async def generate_text_with_chatgpt51(request: GenerateChatGPT51Request):
             content=response_text,
             image_urls=[]
         )
-        await db.chatgpt51_messages.insert_one(assistant_message.dict())
+        await db.chatgpt51_messages.insert_one(await blob_store.externalize_message(assistant_message.dict()))
 
         # Mettre à jour la session
         await db.chatgpt51_sessions.update_one(
@@ -3080,14 +3132,22 @@ async def generate_text_with_chatgpt51(request: GenerateChatGPT51Request):
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération: {str(e)}")
 
 @api_router.get("/chatgpt51/session/{session_id}", response_model=List[ChatGPT51Message])
-async def get_chatgpt51_session(session_id: str):
+async def get_chatgpt51_session(session_id: str, request: Request, response: Response, page: MessagePage = Depends()):
     """Récupère l'historique d'une session ChatGPT 5.1"""
     try:
-        messages = await db.chatgpt51_messages.find(
-            {"session_id": session_id}
-        ).sort("timestamp", 1).to_list(1000)
-        
+        # Session inchangée depuis la dernière lecture : 304 sans charger les messages
+        etag = await session_etag(db.chatgpt51_sessions, db.chatgpt51_messages, session_id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        # Page de messages (toute la session sans paramètre de pagination)
+        messages = await page.fetch(db.chatgpt51_messages, session_id, response, max_messages=1000)
+        if page.fields:
+            return projected_response(messages, response)
         return [ChatGPT51Message(**msg) for msg in messages]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de session: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
@@ -3096,10 +3156,33 @@ async def get_chatgpt51_session(session_id: str):
 # Import auth and history routers
 from auth import auth_router
 from history import history_router
+from pricing import pricing_router
+
+def register_job_handlers():
+    """Handlers exécutés par les jobs asynchrones (même logique que les routes synchrones)"""
+    job_manager.register("nanobanana", generate_image_with_nanobanana, GenerateImageRequest)
+    job_manager.register("flux_kontext", generate_image_with_flux_kontext, GenerateFluxKontextRequest)
+    job_manager.register("kling", generate_video_with_kling, GenerateKlingRequest)
+    job_manager.register("seedream", generate_image_with_seedream, GenerateSeedreamRequest)
+    job_manager.register("grok", generate_image_with_grok, GenerateGrokRequest)
+    job_manager.register("alibaba_wan", generate_video_with_alibaba_wan, GenerateAlibabaWanRequest)
+    job_manager.register("video_upscale", upscale_video, GenerateVideoUpscaleRequest)
+    job_manager.register("google_veo", generate_video_with_veo, GenerateVideoRequest)
+    job_manager.register("sora2", generate_video_with_sora2, GenerateVideoSora2Request)
+    job_manager.register("chatgpt5", chat_with_gpt5, ChatGPT5Request)
+    job_manager.register("image_upscaler", upscale_image, UpscaleImageRequest)
+    job_manager.register("nanobanana_pro", generate_image_with_nanobanana_pro, GenerateNanoBananaProRequest)
+    job_manager.register("gemini3_pro", generate_text_with_gemini3_pro, GenerateGemini3ProRequest)
+    job_manager.register("chatgpt51", generate_text_with_chatgpt51, GenerateChatGPT51Request)
 
 # Include the routers in the main app
 api_router.include_router(auth_router)
 api_router.include_router(history_router)
+api_router.include_router(pricing_router)
+api_router.include_router(replicate_router)
+api_router.include_router(jobs_router)
+api_router.include_router(blob_router)
+api_router.include_router(temp_images_router)
 app.include_router(api_router)
 
 app.add_middleware(
@@ -3108,8 +3191,22 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", *PAGE_HEADERS],
 )
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+async def startup_providers():
+    register_job_handlers()
+    await http_client.start_http_client()
+    providers.model_registry.start()
+    await job_manager.ensure_indexes()
+    await result_cache.ensure_indexes()
+    await db_indexes.ensure_indexes(db)
+    api_job_worker.start()
+
+async def shutdown_services():
+    # Jobs et suivi des predictions d'abord : ils utilisent encore le client HTTP en s'arrêtant
+    await api_job_worker.stop()
+    await prediction_tracker.stop()
+    await providers.model_registry.stop()
+    await http_client.close_http_client()
+    providers.shutdown_providers()
@@ -0,0 +1,82 @@
+"""
+Cache des sessions connues
+Les routes de génération vérifient que la session existe avant chaque génération ;
+une session déjà vue par ce processus (créée ou lue une première fois) est confirmée
+sans lecture Mongo
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+KNOWN_SESSIONS_MAX_ENTRIES = int(os.environ.get('KNOWN_SESSIONS_MAX_ENTRIES', '5000'))
+KNOWN_SESSIONS_TTL_SECONDS = int(os.environ.get('KNOWN_SESSIONS_TTL_SECONDS', '3600'))
+
+
+class KnownSessions:
+    """Identifiants de sessions confirmés, par collection (un LRU borné à durée de vie limitée par outil)"""
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._sessions: Dict[str, "OrderedDict[str, float]"] = {}
+        self._stats = {"hits": 0, "lookups": 0, "created": 0}
+
+    def _known(self, collection_name: str, session_id: str) -> bool:
+        sessions = self._sessions.get(collection_name)
+        if not sessions:
+            return False
+        expires_at = sessions.get(session_id)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            del sessions[session_id]
+            return False
+        sessions.move_to_end(session_id)
+        return True
+
+    def remember(self, collection_name: str, session_id: str):
+        sessions = self._sessions.setdefault(collection_name, OrderedDict())
+        sessions[session_id] = time.monotonic() + self.ttl_seconds
+        sessions.move_to_end(session_id)
+        while len(sessions) > self.max_entries:
+            sessions.popitem(last=False)
+
+    async def ensure(self, collection, session_id: str, create: Optional[Callable[[], dict]] = None) -> bool:
+        """
+        Confirmer qu'une session existe dans collection
+
+        Sans entrée en cache, la session est lue dans Mongo ; si elle n'existe pas et que
+        create est fourni, le document renvoyé par create() est inséré. Retourne False si
+        la session n'existe pas (et n'a pas été créée). Deux premières requêtes simultanées
+        pour un même identifiant ne créent qu'un document (index unique id_unique).
+        """
+        if self._known(collection.name, session_id):
+            self._stats["hits"] += 1
+            return True
+
+        self._stats["lookups"] += 1
+        session = await collection.find_one({"id": session_id}, {"_id": 1})
+        if not session:
+            if create is None:
+                return False
+            try:
+                await collection.insert_one(create())
+                self._stats["created"] += 1
+            except DuplicateKeyError:
+                # Créée entre-temps par une requête concurrente
+                pass
+        self.remember(collection.name, session_id)
+        return True
+
+    def get_stats(self) -> dict:
+        return {**self._stats, "entries": sum(len(sessions) for sessions in self._sessions.values())}
+
+
+known_sessions = KnownSessions(KNOWN_SESSIONS_MAX_ENTRIES, KNOWN_SESSIONS_TTL_SECONDS)
@@ -0,0 +1,69 @@
+"""
+Déduplication des générations identiques en cours (single-flight)
+Une requête identique à une génération déjà en cours (double-clic, nouvel essai du
+frontend) attend le résultat de celle-ci au lieu de relancer une génération payante
+
+Le partage est limité au même demandeur (utilisateur du token, sinon adresse IP) :
+deux utilisateurs aux entrées identiques obtiennent chacun leur propre génération et
+ne voient jamais la sortie de l'autre. Les crédits restent débités à chaque requête
+(/auth/deduct-credits), qu'elle ait lancé la génération ou rejoint celle en cours.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from scheduler import current_requester
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        if value.startswith("data:"):
+            # Image en data URL : seule son empreinte compte (évite de sérialiser plusieurs Mo)
+            return "sha256:" + hashlib.sha256(value.encode()).hexdigest()
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items() if item is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def flight_key(model: str, inputs: dict) -> str:
+    """Clé d'une génération : modèle + entrées normalisées"""
+    normalized = json.dumps({"model": model, "inputs": _normalize(inputs)}, sort_keys=True, default=str)
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+class SingleFlight:
+    """Une seule exécution par clé ; les appels identiques concurrents partagent son résultat"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.started = 0
+        self.shared = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        # Une génération n'est partagée qu'entre les requêtes d'un même demandeur
+        scoped_key = f"{current_requester()}|{key}"
+        task = self._inflight.get(scoped_key)
+        if task is not None:
+            self.shared += 1
+            logger.info(f"🔗 Génération identique déjà en cours ({key[:12]}), résultat partagé")
+        else:
+            self.started += 1
+            # Tâche séparée : l'annulation d'un appelant n'interrompt pas les autres
+            task = asyncio.ensure_future(func())
+            self._inflight[scoped_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(scoped_key, None))
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "started": self.started, "shared": self.shared}
+
+
+generation_flights = SingleFlight()
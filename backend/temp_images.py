@@ -0,0 +1,201 @@
+"""
+Fichiers temporaires exposés aux fournisseurs (images et vidéos d'entrée)
+Les data URLs envoyées par le frontend sont écrites sous un nom dérivé de leur contenu
+et servies par /api/temp-images, où Replicate les télécharge
+"""
+
+import base64
+import hashlib
+import io
+import json
+import logging
+import mimetypes
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from PIL import Image
+
+from http_cache import PUBLIC_IMMUTABLE, etag_matches, make_etag, not_modified
+
+logger = logging.getLogger(__name__)
+
+# Router
+temp_images_router = APIRouter(prefix="/temp-images", tags=["Temp images"])
+
+# Create temp directory for storing images
+TEMP_IMAGES_DIR = Path("/tmp/kling_images")
+TEMP_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+# Content-addressed files: "<sha256[:32]>.<ext>" and Veo variants "<sha256[:32]>-veo-<W>x<H>.jpg"
+CONTENT_ADDRESSED_FILENAME = re.compile(r"^[0-9a-f]{32}(-veo-\d+x\d+)?\.[a-z0-9]+$")
+
+# Pre-processed Veo frames: per-variant metadata is kept outside the served directory
+VEO_VARIANT_METADATA_DIR = Path("/tmp/kling_images_meta")
+VEO_VARIANT_METADATA_DIR.mkdir(parents=True, exist_ok=True)
+# Cache counters, updated from the thread pools that run data_url_to_public_url
+veo_variant_stats = {"hits": 0, "misses": 0, "processing_ms_total": 0.0}
+veo_variant_stats_lock = threading.Lock()
+
+
+def get_veo_variant_stats() -> dict:
+    with veo_variant_stats_lock:
+        return dict(veo_variant_stats)
+
+
+def veo_target_geometry(width: int, height: int) -> tuple:
+    """Google Veo 3.1 requires 16:9 or 9:16 aspect ratio, ideally 1280x720 or 720x1280"""
+    if width / height >= 1:  # Horizontal or square image -> 16:9
+        return 1280, 720
+    return 720, 1280  # Vertical image -> 9:16
+
+
+# Helper function to convert data URL to public URL
+def data_url_to_public_url(data_url: str, backend_url: str, resize_for_veo: bool = False) -> str:
+    """Convert a data URL to a public HTTP URL by saving the image temporarily"""
+    try:
+        # Extract the base64 data
+        if not data_url.startswith("data:"):
+            # Already a URL
+            return data_url
+        
+        # Parse data URL: data:image/png;base64,xxxxx or data:image/jpeg;base64,xxxxx
+        header, encoded = data_url.split(",", 1)
+        
+        # Decode base64
+        image_data = base64.b64decode(encoded)
+        
+        # Open image with PIL to ensure it's valid (lazy: only the header is read here)
+        image = Image.open(io.BytesIO(image_data))
+        
+        # Content-addressed filename: same bytes + same processing -> same file and URL
+        # Veo frames are keyed by source hash and target geometry
+        content_hash = hashlib.sha256(image_data).hexdigest()[:32]
+        if resize_for_veo:
+            target_width, target_height = veo_target_geometry(*image.size)
+            filename = f"{content_hash}-veo-{target_width}x{target_height}.jpg"
+        else:
+            filename = f"{content_hash}.jpg"
+        filepath = TEMP_IMAGES_DIR / filename
+        public_url = f"{backend_url}/api/temp-images/{filename}"
+        if filepath.exists():
+            # Already processed: skip decoding and re-encoding
+            if resize_for_veo:
+                with veo_variant_stats_lock:
+                    veo_variant_stats["hits"] += 1
+            logger.info(f"Image already available: {filepath} -> {public_url}")
+            return public_url
+        
+        processing_started = time.perf_counter()
+        
+        # Resize for Google Veo 3.1 if necessary (with proper aspect ratio handling)
+        if resize_for_veo:
+            width, height = image.size
+            target_aspect = target_width / target_height
+            
+            # Calculate the dimensions to crop to target aspect ratio
+            current_aspect = width / height
+            if current_aspect > target_aspect:
+                # Image is wider than target, crop width
+                new_width = int(height * target_aspect)
+                new_height = height
+                left = (width - new_width) // 2
+                top = 0
+                right = left + new_width
+                bottom = height
+            else:
+                # Image is taller than target, crop height
+                new_width = width
+                new_height = int(width / target_aspect)
+                left = 0
+                top = (height - new_height) // 2
+                right = width
+                bottom = top + new_height
+            
+            # Crop to target aspect ratio (center crop)
+            image = image.crop((left, top, right, bottom))
+            
+            # Now resize to target resolution
+            image = image.resize((target_width, target_height), Image.Resampling.LANCZOS)
+            logger.info(f"Image processed from {width}x{height} to {target_width}x{target_height} for Google Veo 3.1 (cropped and resized)")
+        
+        # Convert to RGB if necessary (for PNG with transparency)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # Create white background
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            if image.mode == 'P':
+                image = image.convert('RGBA')
+            background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        # Save as JPEG (better compatibility with Replicate)
+        # Written to a temporary name then renamed, so concurrent requests never serve a partial file
+        tmp_path = TEMP_IMAGES_DIR / f".{filename}.{uuid.uuid4().hex}.tmp"
+        image.save(tmp_path, 'JPEG', quality=95)
+        os.replace(tmp_path, filepath)
+        
+        if resize_for_veo:
+            # Record the processing time of this variant (not under TEMP_IMAGES_DIR: it is publicly served)
+            processing_ms = round((time.perf_counter() - processing_started) * 1000, 1)
+            with veo_variant_stats_lock:
+                veo_variant_stats["misses"] += 1
+                veo_variant_stats["processing_ms_total"] += processing_ms
+            metadata = {
+                "source_hash": content_hash,
+                "source_size": [width, height],
+                "target_size": [target_width, target_height],
+                "processing_ms": processing_ms,
+                "created_at": datetime.utcnow().isoformat(),
+            }
+            (VEO_VARIANT_METADATA_DIR / f"{filename}.json").write_text(json.dumps(metadata))
+            logger.info(f"Veo frame variant {filename} processed in {processing_ms}ms")
+        
+        # Public URL (under /api prefix for Kubernetes ingress routing)
+        logger.info(f"Image saved successfully: {filepath} -> {public_url}")
+        return public_url
+    except Exception as e:
+        logger.error(f"Error converting data URL to public URL: {str(e)}")
+        raise
+
+
+# Endpoint to serve temporary images (mounted under /api/temp-images)
+@temp_images_router.api_route("/{filename}", methods=["GET", "HEAD"])
+async def serve_temp_image(filename: str, request: Request):
+    """Serve temporary images and videos for Replicate API (supports GET and HEAD for validation)"""
+    filepath = TEMP_IMAGES_DIR / filename
+    # Dot files are in-progress writes; .json files are metadata, never media
+    if filename.startswith(".") or filename.endswith(".json") or not filepath.is_file():
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    stat = filepath.stat()
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if CONTENT_ADDRESSED_FILENAME.match(filename):
+        # Content-hash names: the bytes behind a URL never change, so the name is a strong validator
+        etag = make_etag(Path(filename).stem, weak=False)
+        cache_control = PUBLIC_IMMUTABLE
+    else:
+        # Files written before content-hash names
+        etag = make_etag(stat.st_mtime_ns, stat.st_size, weak=False)
+        cache_control = "public, max-age=3600"
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+    
+    # For HEAD requests, Replicate just wants to validate the file exists
+    # Return appropriate headers without the body
+    if request.method == "HEAD":
+        return Response(
+            status_code=200,
+            headers={**headers, "Content-Type": media_type, "Content-Length": str(stat.st_size)}
+        )
+    
+    # For GET requests, return the actual file
+    return FileResponse(filepath, media_type=media_type, headers=headers, stat_result=stat)
@@ -0,0 +1,61 @@
+"""
+Worker de jobs de génération
+
+Exécute les jobs enregistrés dans la collection generation_jobs avec la même logique
+de génération que les routes de server.py. Plusieurs workers peuvent tourner en
+parallèle (sur plusieurs cœurs ou machines) ; un job interrompu est repris par un
+autre worker à l'expiration de son bail.
+
+Utilisation :
+    cd backend && python worker.py
+"""
+
+import asyncio
+import logging
+import signal
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv(Path(__file__).parent / '.env')
+
+import database
+import http_client
+import providers
+from jobs import JOB_WORKER_CONCURRENCY, JobWorker, job_manager
+from predictions import prediction_tracker
+# Les handlers des outils sont les fonctions de génération de server.py (son import configure aussi la base)
+from server import register_job_handlers
+
+logger = logging.getLogger("worker")
+
+
+async def main():
+    await database.connect()
+    await http_client.start_http_client()
+    providers.model_registry.start()
+    # Les webhooks Replicate arrivent sur les processus API : le worker suit ses predictions par polling
+    prediction_tracker.use_webhooks = False
+    await job_manager.ensure_indexes()
+    register_job_handlers()
+
+    worker = JobWorker(job_manager, JOB_WORKER_CONCURRENCY)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    worker.start()
+    await stop_event.wait()
+
+    logger.info(f"🛑 Arrêt du worker {worker.worker_id}, remise en file des jobs en cours")
+    await worker.stop()
+    await prediction_tracker.stop()
+    await providers.model_registry.stop()
+    await http_client.close_http_client()
+    providers.shutdown_providers()
+    database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
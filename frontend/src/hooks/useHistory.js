@@ -3,6 +3,29 @@ import { useState, useEffect } from 'react';
 export const useHistory = (toolId, toolName) => {
   const [history, setHistory] = useState([]);
   const [loading, setLoading] = useState(true);
+  // Curseur de la page suivante (null : tout l'historique est chargé)
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
+  // Une page d'historique (la plus récente sans curseur)
+  const fetchHistoryPage = async (token, cursor) => {
+    const params = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+    const response = await fetch(
+      `${process.env.REACT_APP_BACKEND_URL}/api/history/tool/${toolId}${params}`,
+      {
+        headers: {
+          'Authorization': `Bearer ${token}`
+        }
+      }
+    );
+
+    console.log('📡 Réponse historique:', response.status);
+    if (!response.ok) {
+      console.error('❌ Erreur historique:', response.status);
+      return null;
+    }
+    return response.json();
+  };
 
   const loadHistory = async () => {
     try {
@@ -14,22 +37,12 @@ export const useHistory = (toolId, toolName) => {
         return;
       }
 
-      const response = await fetch(
-        `${process.env.REACT_APP_BACKEND_URL}/api/history/tool/${toolId}`,
-        {
-          headers: {
-            'Authorization': `Bearer ${token}`
-          }
-        }
-      );
-
-      console.log('📡 Réponse historique:', response.status);
-      if (response.ok) {
-        const data = await response.json();
+      // Première page seulement : les suivantes sont chargées à la demande (loadMore)
+      const data = await fetchHistoryPage(token, null);
+      if (data) {
         console.log('✅ Historique chargé:', data.history?.length || 0, 'entrées');
         setHistory(data.history || []);
-      } else {
-        console.error('❌ Erreur historique:', response.status);
+        setNextCursor(data.next_cursor || null);
       }
     } catch (error) {
       console.error('❌ Erreur chargement historique:', error);
@@ -38,6 +51,26 @@ export const useHistory = (toolId, toolName) => {
     }
   };
 
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const token = localStorage.getItem('authToken');
+      if (!token) return;
+
+      const data = await fetchHistoryPage(token, nextCursor);
+      if (data) {
+        console.log('✅ Page d\'historique suivante:', data.history?.length || 0, 'entrées');
+        setHistory(prev => [...prev, ...(data.history || [])]);
+        setNextCursor(data.next_cursor || null);
+      }
+    } catch (error) {
+      console.error('❌ Erreur chargement historique:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // Charger l'historique au montage et quand toolId change
   useEffect(() => {
     if (toolId) {
@@ -129,6 +162,9 @@ export const useHistory = (toolId, toolName) => {
   return {
     history,
     loading,
+    hasMore: nextCursor !== null,
+    loadingMore,
+    loadMore,
     saveToHistory,
     deleteFromHistory,
     reloadHistory: loadHistory
@@ -0,0 +1,58 @@
+"""
+Branchement du suivi des predictions sur le faux fournisseur (backend/fake_replicate.py)
+Le client Replicate et les webhooks passent par des transports ASGI en mémoire
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import httpx  # noqa: E402
+import replicate  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+import fake_replicate  # noqa: E402
+import predictions  # noqa: E402
+import providers  # noqa: E402
+
+FAKE_MODEL = "test/fake-model"
+WEBHOOK_URL = "http://backend/replicate/webhook"
+
+
+def backend_app() -> FastAPI:
+    """Application réduite au receveur de webhooks"""
+    app = FastAPI()
+    app.include_router(predictions.replicate_router)
+    return app
+
+
+def use_fake_replicate(monkeypatch, webhook_app=None, prediction_seconds: float = 0.05,
+                       final_status: str = "succeeded") -> predictions.PredictionTracker:
+    """
+    Brancher providers et predictions sur le faux fournisseur ; retourne un tracker neuf
+
+    Avec webhook_app, les predictions sont créées avec un webhook délivré à cette application.
+    """
+    fake_replicate.predictions.clear()
+    monkeypatch.setattr(fake_replicate, "FAKE_PREDICTION_SECONDS", prediction_seconds)
+    monkeypatch.setattr(fake_replicate, "FAKE_FINAL_STATUS", final_status)
+    monkeypatch.setattr(
+        fake_replicate, "webhook_transport", httpx.ASGITransport(app=webhook_app) if webhook_app else None
+    )
+
+    client = replicate.Client(
+        api_token="test-token",
+        base_url="http://fake-replicate",
+        transport=httpx.ASGITransport(app=fake_replicate.app),
+    )
+    monkeypatch.setattr(providers, "_replicate_client", client)
+    monkeypatch.setattr(providers, "model_registry", providers.ModelVersionRegistry({}, 0))
+    monkeypatch.setattr(providers, "provider_breaker", providers.CircuitBreaker("Replicate", 6))
+    monkeypatch.setattr(providers, "_model_breakers", {})
+
+    monkeypatch.setattr(predictions, "REPLICATE_WEBHOOK_URL", WEBHOOK_URL if webhook_app else None)
+    monkeypatch.setattr(predictions, "_webhook_secret", None)
+    tracker = predictions.PredictionTracker()
+    monkeypatch.setattr(predictions, "prediction_tracker", tracker)
+    return tracker
@@ -0,0 +1,174 @@
+"""
+Collection Mongo en mémoire pour les tests (sous-ensemble de l'API Motor utilisé par le backend)
+Chaque opération rend la main à la boucle, comme un vrai aller-retour réseau
+"""
+
+import asyncio
+import copy
+from typing import List, Optional
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+
+def _matches_condition(value, condition) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        for operator, operand in condition.items():
+            if operator == "$lt" and not (value is not None and value < operand):
+                return False
+            if operator == "$lte" and not (value is not None and value <= operand):
+                return False
+            if operator == "$gt" and not (value is not None and value > operand):
+                return False
+            if operator == "$gte" and not (value is not None and value >= operand):
+                return False
+            if operator == "$ne" and value == operand:
+                return False
+            if operator == "$in" and value not in operand:
+                return False
+        return True
+    return value == condition
+
+
+def matches(document: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(document, clause) for clause in condition):
+                return False
+        elif not _matches_condition(document.get(key), condition):
+            return False
+    return True
+
+
+def _project(document: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(document)
+    included = {key for key, value in projection.items() if value and key != "_id"}
+    if included:
+        result = {key: document[key] for key in included if key in document}
+        if projection.get("_id", 1) and "_id" in document:
+            result["_id"] = document["_id"]
+        return copy.deepcopy(result)
+    excluded = {key for key, value in projection.items() if not value}
+    return copy.deepcopy({key: value for key, value in document.items() if key not in excluded})
+
+
+def _sorted(documents: List[dict], sort) -> List[dict]:
+    for field, direction in reversed(sort or []):
+        documents = sorted(documents, key=lambda document: document.get(field), reverse=direction < 0)
+    return documents
+
+
+class MemoryCursor:
+    def __init__(self, documents: List[dict], projection: Optional[dict]):
+        self._documents = documents
+        self._projection = projection
+        self._sort = []
+        self._limit = 0
+
+    def sort(self, key, direction=None):
+        self._sort = [(key, direction)] if isinstance(key, str) else list(key)
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    async def to_list(self, length: Optional[int]):
+        await asyncio.sleep(0)
+        documents = _sorted(self._documents, self._sort)
+        for limit in (self._limit, length):
+            if limit:
+                documents = documents[:limit]
+        return [_project(document, self._projection) for document in documents]
+
+
+class UpdateResult:
+    def __init__(self, matched_count: int, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = matched_count
+        self.upserted_id = upserted_id
+
+
+class MemoryCollection:
+    def __init__(self, name: str, unique: tuple = ()):
+        self.name = name
+        self.unique = unique
+        self.documents: List[dict] = []
+
+    def _check_unique(self, document: dict):
+        for field in self.unique:
+            for existing in self.documents:
+                if field in document and existing.get(field) == document[field]:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {field}")
+
+    async def insert_one(self, document: dict):
+        await asyncio.sleep(0)
+        document.setdefault("_id", ObjectId())
+        self._check_unique(document)
+        self.documents.append(copy.deepcopy(document))
+
+    async def find_one(self, query: dict, projection: Optional[dict] = None, sort=None):
+        await asyncio.sleep(0)
+        found = _sorted([document for document in self.documents if matches(document, query)], sort)
+        return _project(found[0], projection) if found else None
+
+    def find(self, query: dict, projection: Optional[dict] = None) -> MemoryCursor:
+        return MemoryCursor([document for document in self.documents if matches(document, query)], projection)
+
+    async def count_documents(self, query: dict) -> int:
+        await asyncio.sleep(0)
+        return sum(1 for document in self.documents if matches(document, query))
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        await asyncio.sleep(0)
+        for document in self.documents:
+            if matches(document, query):
+                document.update(copy.deepcopy(update.get("$set", {})))
+                return UpdateResult(1)
+        if not upsert:
+            return UpdateResult(0)
+        document = {key: value for key, value in query.items() if not key.startswith("$")}
+        document.update(update.get("$setOnInsert", {}))
+        document.update(update.get("$set", {}))
+        await self.insert_one(document)
+        return UpdateResult(0, document["_id"])
+
+
+class MemoryDownloadStream:
+    def __init__(self, data: bytes, chunk_size: int = 4):
+        self._data = data
+        self._chunk_size = chunk_size
+        self.length = len(data)
+        self.closed = False
+
+    async def readchunk(self) -> bytes:
+        chunk, self._data = self._data[:self._chunk_size], self._data[self._chunk_size:]
+        return chunk
+
+    def close(self):
+        self.closed = True
+
+
+class MemoryGridFSBucket:
+    """Sous-ensemble de AsyncIOMotorGridFSBucket : fichiers dans <bucket>.files, octets en mémoire"""
+
+    def __init__(self, files: MemoryCollection):
+        self.files = files
+        self.chunks = {}
+
+    async def upload_from_stream(self, filename: str, data: bytes, metadata: Optional[dict] = None):
+        file_id = ObjectId()
+        self.chunks[file_id] = bytes(data)
+        await self.files.insert_one({
+            "_id": file_id,
+            "filename": filename,
+            "length": len(data),
+            "uploadDate": len(self.chunks),
+            "metadata": metadata,
+        })
+        return file_id
+
+    async def open_download_stream(self, file_id) -> MemoryDownloadStream:
+        await asyncio.sleep(0)
+        return MemoryDownloadStream(self.chunks[file_id])
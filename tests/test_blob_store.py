@@ -0,0 +1,128 @@
+"""
+Stockage des médias : externalisation des data URLs, déduplication et lecture des blobs
+"""
+
+import asyncio
+import base64
+import hashlib
+import sys
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import blob_store as blob_store_module  # noqa: E402
+from blob_store import BlobStore  # noqa: E402
+from tests.memory_db import MemoryCollection, MemoryGridFSBucket  # noqa: E402
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\nfake image"
+PNG_DATA_URL = "data:image/png;base64," + base64.b64encode(PNG_BYTES).decode()
+PNG_HASH = hashlib.sha256(PNG_BYTES).hexdigest()
+
+
+def memory_store() -> BlobStore:
+    store = BlobStore("blobs")
+    store._files = MemoryCollection("blobs.files")
+    store._bucket = MemoryGridFSBucket(store._files)
+    return store
+
+
+async def read_all(store: BlobStore, blob_hash: str):
+    stream, content_type = await store.open(blob_hash)
+    data = b""
+    while True:
+        chunk = await stream.readchunk()
+        if not chunk:
+            break
+        data += chunk
+    stream.close()
+    return data, content_type
+
+
+def test_externalize_round_trip(monkeypatch):
+    monkeypatch.setenv("BACKEND_URL", "http://backend")
+    store = memory_store()
+
+    async def scenario():
+        url = await store.externalize(PNG_DATA_URL)
+        return url, await read_all(store, url.rsplit("/", 1)[1])
+
+    url, (data, content_type) = asyncio.run(scenario())
+    assert url == f"http://backend/api/blobs/{PNG_HASH}"
+    assert data == PNG_BYTES
+    assert content_type == "image/png"
+
+
+def test_same_content_is_stored_once():
+    store = memory_store()
+
+    async def scenario():
+        return [await store.externalize(PNG_DATA_URL) for _ in range(3)]
+
+    urls = asyncio.run(scenario())
+    assert len(set(urls)) == 1
+    assert len(store._files.documents) == 1
+    assert store.get_stats() == {"stored": 1, "deduplicated": 2, "bytes_stored": len(PNG_BYTES)}
+
+
+def test_nested_values_are_externalized_and_others_kept():
+    store = memory_store()
+    value = {
+        "images": [PNG_DATA_URL, "https://replicate.delivery/output.png"],
+        "text": "réponse",
+        "count": 2,
+        "broken": "data:image/png;base64,@@not-base64@@",
+    }
+
+    result = asyncio.run(store.externalize(value))
+
+    assert result["images"][0].endswith(f"/api/blobs/{PNG_HASH}")
+    assert result["images"][1] == "https://replicate.delivery/output.png"
+    assert result["text"] == "réponse"
+    assert result["count"] == 2
+    # Data URL invalide : conservée telle quelle plutôt que perdue
+    assert result["broken"] == value["broken"]
+
+
+def test_externalize_message_only_touches_media_fields():
+    store = memory_store()
+    message = {"content": PNG_DATA_URL, "image_urls": [PNG_DATA_URL], "video_urls": None}
+
+    result = asyncio.run(store.externalize_message(message))
+
+    assert result["content"] == PNG_DATA_URL
+    assert result["image_urls"][0].endswith(f"/api/blobs/{PNG_HASH}")
+    assert result["video_urls"] is None
+
+
+def test_unknown_blob():
+    assert asyncio.run(memory_store().open("0" * 64)) is None
+
+
+def test_serve_blob_streams_and_revalidates(monkeypatch):
+    store = memory_store()
+    asyncio.run(store.externalize(PNG_DATA_URL))
+    monkeypatch.setattr(blob_store_module, "blob_store", store)
+    app = FastAPI()
+    app.include_router(blob_store_module.blob_router, prefix="/api")
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+            return (
+                await client.get(f"/api/blobs/{PNG_HASH}"),
+                await client.get(f"/api/blobs/{PNG_HASH}", headers={"If-None-Match": f'"{PNG_HASH}"'}),
+                await client.get(f"/api/blobs/{'0' * 64}"),
+                await client.get("/api/blobs/not-a-hash"),
+            )
+
+    found, revalidated, missing, invalid = asyncio.run(scenario())
+    assert found.status_code == 200
+    assert found.content == PNG_BYTES
+    assert found.headers["content-type"] == "image/png"
+    assert found.headers["etag"] == f'"{PNG_HASH}"'
+    assert revalidated.status_code == 304
+    assert missing.status_code == 404
+    assert invalid.status_code == 404
@@ -0,0 +1,162 @@
+"""
+Disjoncteurs fournisseur / modèle : fermé, ouvert, semi-ouvert
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from replicate.exceptions import ReplicateError  # noqa: E402
+
+import providers  # noqa: E402
+from providers import CircuitBreaker, CircuitOpenError, classify_provider_error  # noqa: E402
+
+
+class Clock:
+    """Horloge monotone contrôlée par le test"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # Seul le module providers voit cette horloge (la boucle asyncio garde la vraie)
+    monkeypatch.setattr(providers, "time", SimpleNamespace(monotonic=clock))
+    monkeypatch.setattr(providers, "CIRCUIT_OPEN_SECONDS", 30)
+    monkeypatch.setattr(providers, "CIRCUIT_MAX_OPEN_SECONDS", 100)
+    monkeypatch.setattr(providers, "CIRCUIT_FAILURE_WINDOW_SECONDS", 60)
+    monkeypatch.setattr(providers, "CIRCUIT_HALF_OPEN_TRIALS", 1)
+    return clock
+
+
+def test_opens_after_threshold_failures_in_window(clock):
+    breaker = CircuitBreaker("model", threshold=3)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure("5xx")
+    assert breaker.state == "closed"
+
+    breaker.before_call()
+    breaker.record_failure("5xx")
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker.before_call()
+    assert raised.value.cause == "5xx"
+    assert 1 <= raised.value.retry_in <= 31
+    assert breaker.rejected == 1
+
+
+def test_old_failures_leave_the_window(clock):
+    breaker = CircuitBreaker("model", threshold=3)
+    breaker.record_failure("5xx")
+    breaker.record_failure("5xx")
+    clock.now += 61
+    breaker.record_failure("5xx")
+    assert breaker.state == "closed"
+
+
+def test_insufficient_credit_opens_immediately(clock):
+    breaker = CircuitBreaker("Replicate", threshold=6)
+    breaker.record_failure("402")
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError, match="402 Insufficient credit"):
+        breaker.before_call()
+
+
+def test_half_open_trial_success_closes(clock):
+    breaker = CircuitBreaker("model", threshold=1)
+    breaker.record_failure("429")
+    clock.now += 31
+
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    # Une seule requête d'essai à la fois
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_half_open_trial_failure_reopens_for_longer(clock):
+    breaker = CircuitBreaker("model", threshold=1)
+    breaker.record_failure("5xx")
+    clock.now += 31
+    breaker.before_call()
+    breaker.record_failure("5xx")
+    assert breaker.state == "open"
+
+    # Durée doublée : toujours ouvert après 31 s, semi-ouvert après 61 s
+    clock.now += 31
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock.now += 30
+    breaker.before_call()
+    assert breaker.state == "half_open"
+
+
+def test_open_duration_is_capped(clock):
+    breaker = CircuitBreaker("model", threshold=1)
+    breaker.record_failure("5xx")
+    for _ in range(5):
+        clock.now += 1000
+        breaker.before_call()
+        breaker.record_failure("5xx")
+    assert breaker._open_seconds == 100
+
+
+def test_request_error_releases_trial_without_verdict(clock):
+    breaker = CircuitBreaker("model", threshold=1)
+    breaker.record_failure("5xx")
+    clock.now += 31
+    breaker.before_call()
+    breaker.release_trial()
+
+    assert breaker.state == "half_open"
+    breaker.before_call()
+
+
+def test_classify_provider_error():
+    assert classify_provider_error(ReplicateError(status=402, detail="no credit")) == "402"
+    assert classify_provider_error(ReplicateError(status=429, detail="slow down")) == "429"
+    assert classify_provider_error(ReplicateError(status=503, detail="down")) == "5xx"
+    assert classify_provider_error(ReplicateError(status=422, detail="bad input")) is None
+    assert classify_provider_error(httpx.ConnectError("refused")) == "5xx"
+    assert classify_provider_error(ValueError("bug")) is None
+
+
+def test_guarded_calls_fail_fast_once_model_breaker_is_open(clock, monkeypatch):
+    monkeypatch.setattr(providers, "provider_breaker", CircuitBreaker("Replicate", 6))
+    monkeypatch.setattr(providers, "_model_breakers", {})
+    monkeypatch.setattr(providers, "CIRCUIT_MODEL_FAILURE_THRESHOLD", 2)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        raise ReplicateError(status=503, detail="down")
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(ReplicateError):
+                await providers._guarded("owner/model", failing)
+        with pytest.raises(CircuitOpenError):
+            await providers._guarded("owner/model", failing)
+        # Les autres modèles du fournisseur restent disponibles
+        return await providers._guarded("owner/other", lambda: asyncio.sleep(0, result="ok"))
+
+    assert asyncio.run(scenario()) == "ok"
+    assert len(calls) == 2
+    assert providers._model_breakers["owner/model"].state == "open"
+    assert providers.provider_breaker.state == "closed"
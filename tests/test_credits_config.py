@@ -0,0 +1,73 @@
+"""
+Barème compilé : mêmes résultats que le calcul d'origine pour les modèles au token
+"""
+
+import itertools
+import math
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from credits_config import CREDITS_CONFIG, calculate_token_based_credits, round_credits  # noqa: E402
+
+
+def baseline_token_credits(model_key: str, input_tokens: int, output_tokens: int) -> float:
+    """Calcul d'origine (branches par modèle), conservé comme référence"""
+    USD_TO_EUR = 0.95
+    EURO_PER_CREDIT = CREDITS_CONFIG["meta"]["euro_per_credit"]
+
+    for model in CREDITS_CONFIG["models"]:
+        if model["key"] == model_key and model.get("token_based"):
+            pricing = model.get("pricing_usd", {})
+
+            if model_key == "chatgpt51":
+                input_cost_usd = (input_tokens / 1_000_000) * pricing["input_per_1M_tokens"]
+                output_cost_usd = (output_tokens / 1_000) * pricing["output_per_1K_tokens"]
+            elif model_key == "gemini3_pro":
+                if input_tokens <= pricing["threshold_tokens"]:
+                    input_cost_usd = (input_tokens / 1_000_000) * pricing["input_per_1M_tokens_low"]
+                    output_cost_usd = (output_tokens / 1_000) * pricing["output_per_1K_tokens_low"]
+                else:
+                    input_cost_usd = (input_tokens / 1_000) * pricing["input_per_1K_tokens_high"]
+                    output_cost_usd = (output_tokens / 1_000) * pricing["output_per_1K_tokens_high"]
+            else:
+                continue
+
+            total_cost_eur = (input_cost_usd + output_cost_usd) * USD_TO_EUR
+            return round(total_cost_eur / EURO_PER_CREDIT, 2)
+
+    return 0
+
+
+TOKEN_MODELS = [model["key"] for model in CREDITS_CONFIG["models"] if model.get("token_based")]
+INPUT_TOKENS = sorted({*range(0, 400_001, 3_700), 1, 999, 199_400, 199_999, 200_000, 200_001, 1_000_000})
+OUTPUT_TOKENS = sorted({*range(0, 64_001, 1_315), 1, 999, 21_615})
+
+
+def test_token_models_are_covered():
+    assert set(TOKEN_MODELS) == {"chatgpt51", "gemini3_pro"}
+
+
+def test_token_credits_match_baseline():
+    for model_key, input_tokens, output_tokens in itertools.product(TOKEN_MODELS, INPUT_TOKENS, OUTPUT_TOKENS):
+        expected = baseline_token_credits(model_key, input_tokens, output_tokens)
+        assert calculate_token_based_credits(model_key, input_tokens, output_tokens) == expected, (
+            model_key, input_tokens, output_tokens
+        )
+
+
+def test_charged_credits_match_baseline_rounding():
+    for model_key, input_tokens, output_tokens in itertools.product(TOKEN_MODELS, INPUT_TOKENS, OUTPUT_TOKENS):
+        expected = math.ceil(baseline_token_credits(model_key, input_tokens, output_tokens) * 2) / 2
+        assert round_credits(calculate_token_based_credits(model_key, input_tokens, output_tokens)) == expected
+
+
+def test_reported_overcharge_case():
+    assert calculate_token_based_credits("chatgpt51", 199_400, 21_615) == 17.0
+    assert round_credits(calculate_token_based_credits("chatgpt51", 199_400, 21_615)) == 17.0
+
+
+def test_unknown_or_flat_models_cost_nothing_in_tokens():
+    assert calculate_token_based_credits("nano_banana", 1_000, 1_000) == 0
+    assert calculate_token_based_credits("unknown", 1_000, 1_000) == 0
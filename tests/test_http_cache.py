@@ -0,0 +1,130 @@
+"""
+ETag / If-None-Match : calcul des versions et réponses 304
+"""
+
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI, Request, Response
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from http_cache import (  # noqa: E402
+    PRIVATE_REVALIDATE,
+    etag_matches,
+    history_etag,
+    make_etag,
+    not_modified,
+    session_etag,
+    set_cache_headers,
+)
+from tests.memory_db import MemoryCollection  # noqa: E402
+
+
+def request_with(if_none_match=None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "headers": headers})
+
+
+def test_make_etag_is_stable_and_weak_by_default():
+    assert make_etag("session", 3) == make_etag("session", 3)
+    assert make_etag("session", 3) != make_etag("session", 4)
+    assert make_etag("session", 3).startswith('W/"')
+    assert make_etag("abc", weak=False).startswith('"')
+
+
+def test_if_none_match_uses_weak_comparison():
+    etag = make_etag("session", 3)
+    strong = etag[2:]
+    assert etag_matches(request_with(etag), etag)
+    assert etag_matches(request_with(strong), etag)
+    assert etag_matches(request_with(f'"other", {etag}'), etag)
+    assert etag_matches(request_with("*"), etag)
+    assert not etag_matches(request_with('"other"'), etag)
+    assert not etag_matches(request_with(), etag)
+
+
+def test_not_modified_response():
+    response = not_modified('"abc"')
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == '"abc"'
+    assert response.headers["cache-control"] == PRIVATE_REVALIDATE
+
+
+def history_app(collection: MemoryCollection) -> FastAPI:
+    """Même enchaînement que /api/history/tool/{tool_id} : ETag, 304, sinon lecture complète"""
+    app = FastAPI()
+
+    @app.get("/history/{tool_id}")
+    async def history(tool_id: str, request: Request, response: Response):
+        query = {"user_id": "u1", "tool_id": tool_id}
+        etag = await history_etag(collection, query)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+        return {"count": await collection.count_documents(query)}
+
+    return app
+
+
+def test_history_revalidation_returns_304_until_a_new_entry():
+    collection = MemoryCollection("user_history")
+    created_at = datetime(2025, 1, 1)
+    collection.documents.append({"_id": 1, "user_id": "u1", "tool_id": "kling", "created_at": created_at})
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=history_app(collection))
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+            first = await client.get("/history/kling")
+            etag = first.headers["etag"]
+            unchanged = await client.get("/history/kling", headers={"If-None-Match": etag})
+            collection.documents.append({
+                "_id": 2, "user_id": "u1", "tool_id": "kling", "created_at": created_at + timedelta(seconds=1)
+            })
+            changed = await client.get("/history/kling", headers={"If-None-Match": etag})
+            return first, unchanged, changed
+
+    first, unchanged, changed = asyncio.run(scenario())
+    assert first.status_code == 200
+    assert first.headers["cache-control"] == PRIVATE_REVALIDATE
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+    assert changed.status_code == 200
+    assert changed.json() == {"count": 2}
+    assert changed.headers["etag"] != first.headers["etag"]
+
+
+def test_history_etag_depends_on_query():
+    collection = MemoryCollection("user_history")
+    collection.documents.append({"_id": 1, "user_id": "u1", "tool_id": "kling", "created_at": datetime(2025, 1, 1)})
+
+    async def scenario():
+        return (
+            await history_etag(collection, {"user_id": "u1", "tool_id": "kling"}),
+            await history_etag(collection, {"user_id": "u1", "tool_id": "grok"}),
+        )
+
+    kling, grok = asyncio.run(scenario())
+    assert kling != grok
+
+
+def test_session_etag_changes_with_messages_and_last_updated():
+    sessions = MemoryCollection("kling_sessions")
+    messages = MemoryCollection("kling_messages")
+    sessions.documents.append({"id": "s1", "last_updated": datetime(2025, 1, 1)})
+
+    def etag():
+        return asyncio.run(session_etag(sessions, messages, "s1"))
+
+    empty = etag()
+    assert etag() == empty
+    # Message utilisateur enregistré avant la génération (last_updated inchangé)
+    messages.documents.append({"session_id": "s1", "id": "m1"})
+    with_message = etag()
+    assert with_message != empty
+    sessions.documents[0]["last_updated"] = datetime(2025, 1, 2)
+    assert etag() != with_message
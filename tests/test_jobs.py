@@ -0,0 +1,93 @@
+"""
+Jobs de génération : consultation et suivi réservés au demandeur qui a soumis le job
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from fastapi import APIRouter, Depends, FastAPI, Header
+from pydantic import BaseModel
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import jobs  # noqa: E402
+from jobs import JobManager, jobs_router  # noqa: E402
+from scheduler import set_requester  # noqa: E402
+from tests.memory_db import MemoryCollection  # noqa: E402
+
+
+class GenerationRequest(BaseModel):
+    session_id: Optional[str] = None
+    prompt: str
+
+
+async def identify_test_user(x_user: Optional[str] = Header(None)):
+    # Remplace identify_requester (token Google) par un en-tête de test
+    set_requester(f"user:{x_user}" if x_user else "ip:127.0.0.1")
+
+
+def jobs_app(monkeypatch) -> JobManager:
+    manager = JobManager()
+    manager._collection = MemoryCollection("generation_jobs", unique=("id",))
+    manager.register("nano_banana", lambda request: asyncio.sleep(0, result={"image": "ok"}), GenerationRequest)
+    monkeypatch.setattr(jobs, "job_manager", manager)
+    monkeypatch.setattr(jobs, "JOB_STREAM_POLL_SECONDS", 0.01)
+    return manager
+
+
+def submit_as(manager: JobManager, user: str) -> str:
+    async def scenario():
+        set_requester(f"user:{user}")
+        response = await manager.submit("nano_banana", GenerationRequest(session_id="s1", prompt="un chat"))
+        return response.headers["location"].rsplit("/", 1)[-1]
+
+    return asyncio.run(scenario())
+
+
+def request(method: str, path: str, user: Optional[str] = None) -> httpx.Response:
+    api_router = APIRouter(prefix="/api", dependencies=[Depends(identify_test_user)])
+    api_router.include_router(jobs_router)
+    app = FastAPI()
+    app.include_router(api_router)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+            return await client.request(method, path, headers={"X-User": user} if user else {})
+
+    return asyncio.run(scenario())
+
+
+def test_submitter_can_read_its_job(monkeypatch):
+    manager = jobs_app(monkeypatch)
+    job_id = submit_as(manager, "alice")
+
+    response = request("GET", f"/api/jobs/{job_id}", user="alice")
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "queued"
+    assert "requester" not in response.json()
+
+
+def test_other_requesters_get_404(monkeypatch):
+    manager = jobs_app(monkeypatch)
+    job_id = submit_as(manager, "alice")
+
+    assert request("GET", f"/api/jobs/{job_id}", user="bob").status_code == 404
+    assert request("GET", f"/api/jobs/{job_id}").status_code == 404
+    assert request("GET", f"/api/jobs/{job_id}/stream", user="bob").status_code == 404
+    assert request("GET", "/api/jobs/missing", user="alice").status_code == 404
+
+
+def test_submitter_can_stream_its_job(monkeypatch):
+    manager = jobs_app(monkeypatch)
+    job_id = submit_as(manager, "alice")
+    asyncio.run(manager.collection.update_one({"id": job_id}, {"$set": {"status": "succeeded", "result": {"image": "ok"}}}))
+
+    response = request("GET", f"/api/jobs/{job_id}/stream", user="alice")
+
+    assert response.status_code == 200
+    assert response.text.startswith("event: succeeded\n")
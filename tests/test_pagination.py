@@ -0,0 +1,167 @@
+"""
+Pagination par curseur : pages de messages dans les deux sens et pages d'historique
+"""
+
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException, Response
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from pagination import HistoryPage, MessagePage  # noqa: E402
+from tests.memory_db import MemoryCollection  # noqa: E402
+
+START = datetime(2025, 1, 1, 12, 0, 0)
+
+
+def messages_collection(count: int) -> MemoryCollection:
+    """`count` messages ; deux messages partagent chaque timestamp (départage par id)"""
+    collection = MemoryCollection("kling_messages")
+    for index in range(count):
+        collection.documents.append({
+            "id": f"m{index:03d}",
+            "session_id": "s1",
+            "role": "user" if index % 2 == 0 else "assistant",
+            "content": f"message {index}",
+            "timestamp": START + timedelta(seconds=index // 2),
+        })
+    collection.documents.append({"id": "other", "session_id": "s2", "timestamp": START})
+    return collection
+
+
+def message_page(before=None, after=None, limit=None, fields=None) -> MessagePage:
+    return MessagePage(before=before, after=after, limit=limit, fields=fields)
+
+
+def fetch(page: MessagePage, collection: MemoryCollection, max_messages=None):
+    response = Response()
+    messages = asyncio.run(page.fetch(collection, "s1", response, max_messages))
+    return [message["id"] for message in messages], response.headers
+
+
+def test_without_parameters_the_whole_session_is_returned():
+    ids, headers = fetch(message_page(), messages_collection(7))
+    assert ids == [f"m{index:03d}" for index in range(7)]
+    assert "x-has-more" not in headers
+
+
+def test_limit_returns_latest_messages_oldest_first():
+    ids, headers = fetch(message_page(limit=3), messages_collection(7))
+    assert ids == ["m004", "m005", "m006"]
+    assert headers["x-has-more"] == "true"
+    assert headers["x-page-before"].endswith("|m004")
+    assert headers["x-page-after"].endswith("|m006")
+
+
+def test_walking_backwards_covers_every_message_once():
+    collection = messages_collection(11)
+    seen = []
+    page = message_page(limit=3)
+    while True:
+        ids, headers = fetch(page, collection)
+        seen = ids + seen
+        if headers["x-has-more"] == "false":
+            break
+        page = message_page(before=headers["x-page-before"], limit=3)
+    assert seen == [f"m{index:03d}" for index in range(11)]
+
+
+def test_walking_forwards_covers_every_message_once():
+    collection = messages_collection(11)
+    seen = []
+    # Curseur timestamp seul, antérieur à la session
+    cursor = (START - timedelta(seconds=1)).isoformat()
+    while True:
+        ids, headers = fetch(message_page(after=cursor, limit=4), collection)
+        seen += ids
+        if headers["x-has-more"] == "false":
+            break
+        cursor = headers["x-page-after"]
+    assert seen == [f"m{index:03d}" for index in range(11)]
+
+
+def test_cursor_on_shared_timestamp_keeps_the_other_message():
+    collection = messages_collection(6)
+    # m002 et m003 ont le même timestamp : le curseur (timestamp, id) sépare les deux
+    ids, _ = fetch(message_page(before="m003", limit=10), collection)
+    assert ids == ["m000", "m001", "m002"]
+    ids, _ = fetch(message_page(after="m002", limit=10), collection)
+    assert ids == ["m003", "m004", "m005"]
+
+
+def test_last_page_has_no_more():
+    ids, headers = fetch(message_page(after="m004", limit=10), messages_collection(6))
+    assert ids == ["m005"]
+    assert headers["x-has-more"] == "false"
+    ids, headers = fetch(message_page(after="m005", limit=10), messages_collection(6))
+    assert ids == []
+    assert headers["x-has-more"] == "false"
+    assert "x-page-before" not in headers
+
+
+def test_fields_projection_keeps_cursor_fields():
+    collection = messages_collection(4)
+    response = Response()
+    page = message_page(limit=2, fields="role")
+    messages = asyncio.run(page.fetch(collection, "s1", response, None))
+    assert [set(message) for message in messages] == [{"id", "timestamp", "role"}] * 2
+
+
+def test_invalid_cursors_are_rejected():
+    with pytest.raises(HTTPException) as both:
+        message_page(before="m001", after="m002")
+    assert both.value.status_code == 400
+    with pytest.raises(HTTPException) as unknown:
+        fetch(message_page(before="missing"), messages_collection(3))
+    assert unknown.value.status_code == 400
+
+
+def history_collection(count: int) -> MemoryCollection:
+    """`count` entrées, trois par created_at (départage par _id)"""
+    collection = MemoryCollection("user_history")
+    for index in range(count):
+        collection.documents.append({
+            "_id": ObjectId(f"{index:024x}"),
+            "user_id": "u1",
+            "tool_id": "kling",
+            "created_at": START + timedelta(minutes=index // 3),
+        })
+    collection.documents.append({"_id": ObjectId(), "user_id": "u2", "tool_id": "kling", "created_at": START})
+    return collection
+
+
+def history_page(cursor=None, limit=4) -> HistoryPage:
+    return HistoryPage(cursor=cursor, limit=limit, include_total=False, summary=False)
+
+
+def test_history_pages_newest_first_without_gaps():
+    collection = history_collection(10)
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        entries, cursor = asyncio.run(history_page(cursor).fetch(collection, {"user_id": "u1"}))
+        pages += 1
+        seen += [int(str(entry["_id"]), 16) for entry in entries]
+        if cursor is None:
+            break
+    assert seen == list(range(9, -1, -1))
+    assert pages == 3
+
+
+def test_history_exact_last_page_has_no_cursor():
+    entries, cursor = asyncio.run(history_page(limit=10).fetch(history_collection(10), {"user_id": "u1"}))
+    assert len(entries) == 10
+    assert cursor is None
+
+
+def test_history_invalid_cursor_is_rejected():
+    for cursor in ("garbage", f"{START.isoformat()}|not-an-id", "not-a-date|" + "0" * 24):
+        with pytest.raises(HTTPException) as invalid:
+            history_page(cursor).keyset()
+        assert invalid.value.status_code == 400
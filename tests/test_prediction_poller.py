@@ -0,0 +1,98 @@
+"""
+Poller central des predictions : contrôles par lots (un appel de liste) et recul progressif
+"""
+
+import asyncio
+import time
+
+from tests.fake_provider import FAKE_MODEL, use_fake_replicate
+
+import predictions  # noqa: E402
+from predictions import TrackedPrediction  # noqa: E402
+
+
+def start_and_check(tracker, count: int):
+    """Créer `count` predictions, attendre leur fin côté fournisseur, puis contrôler le lot"""
+
+    async def scenario():
+        started = [await tracker.start(FAKE_MODEL, {"prompt": f"image {index}"}) for index in range(count)]
+        waiters = [asyncio.ensure_future(tracker.wait(prediction, max_wait_seconds=5)) for prediction in started]
+        await asyncio.sleep(0.2)
+        await tracker._check_batch(list(tracker._inflight.values()))
+        results = [prediction for prediction, _ in await asyncio.gather(*waiters)]
+        await tracker.stop()
+        return results
+
+    return asyncio.run(scenario())
+
+
+def test_due_predictions_are_refreshed_with_one_list_call(monkeypatch):
+    tracker = use_fake_replicate(monkeypatch)
+
+    results = start_and_check(tracker, predictions.POLL_BATCH_LIST_MIN)
+
+    assert [prediction.status for prediction in results] == ["succeeded"] * predictions.POLL_BATCH_LIST_MIN
+    assert all(prediction.output for prediction in results)
+    stats = tracker.get_stats()
+    assert stats["list_calls"] == 1
+    assert stats["reload_calls"] == 0
+    assert stats["poll_completions"] == predictions.POLL_BATCH_LIST_MIN
+    assert stats["in_flight"] == 0
+
+
+def test_small_batches_are_reloaded_individually(monkeypatch):
+    tracker = use_fake_replicate(monkeypatch)
+
+    results = start_and_check(tracker, predictions.POLL_BATCH_LIST_MIN - 1)
+
+    assert all(prediction.status == "succeeded" for prediction in results)
+    stats = tracker.get_stats()
+    assert stats["list_calls"] == 0
+    assert stats["reload_calls"] == predictions.POLL_BATCH_LIST_MIN - 1
+
+
+def test_unfinished_predictions_are_rescheduled(monkeypatch):
+    tracker = use_fake_replicate(monkeypatch, prediction_seconds=5)
+
+    async def scenario():
+        prediction = await tracker.start(FAKE_MODEL, {"prompt": "vidéo"})
+        tracked = tracker._inflight[prediction.id]
+        before = time.monotonic()
+        await tracker._check_batch([tracked])
+        await tracker.stop()
+        return tracked, before
+
+    tracked, before = asyncio.run(scenario())
+    assert tracked.prediction.status == "starting"
+    assert tracked.checks == 1
+    assert tracked.next_check_at > before
+
+
+def test_interval_shrinks_towards_expected_end_then_backs_off(monkeypatch):
+    tracker = use_fake_replicate(monkeypatch)
+    monkeypatch.setattr(predictions, "POLL_MIN_INTERVAL_SECONDS", 2)
+    monkeypatch.setattr(predictions, "POLL_MAX_INTERVAL_SECONDS", 20)
+    monkeypatch.setattr(predictions, "MODEL_TYPICAL_SECONDS", {FAKE_MODEL: 100})
+    tracked = TrackedPrediction(prediction=None, model=FAKE_MODEL, next_check_at=0)
+
+    # Avant la durée attendue : moitié du temps restant, bornée par l'intervalle maximum
+    tracked.started_at = time.monotonic() - 90
+    assert 4.9 <= tracker._next_interval(tracked) <= 5.0
+    tracked.started_at = time.monotonic()
+    assert tracker._next_interval(tracked) == 20
+
+    # Au-delà : intervalle minimum puis recul x1.5 à chaque contrôle, jusqu'au maximum
+    tracked.started_at = time.monotonic() - 150
+    intervals = [tracker._next_interval(tracked) for _ in range(8)]
+    assert intervals[:4] == [2, 3, 4.5, 6.75]
+    assert intervals == sorted(intervals)
+    assert intervals[-1] == 20
+
+
+def test_webhooks_keep_polling_as_a_safety_net(monkeypatch):
+    tracker = use_fake_replicate(monkeypatch)
+    monkeypatch.setattr(predictions, "REPLICATE_WEBHOOK_URL", "http://backend/replicate/webhook")
+    tracked = TrackedPrediction(prediction=None, model=FAKE_MODEL, next_check_at=0)
+    tracked.started_at = time.monotonic() - 1000
+
+    assert tracker._next_interval(tracked) == predictions.WEBHOOK_FALLBACK_POLL_SECONDS
@@ -0,0 +1,85 @@
+"""
+Suivi des predictions contre le faux fournisseur : webhook signé, signature invalide,
+webhook perdu rattrapé par le poller
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+
+from tests.fake_provider import FAKE_MODEL, WEBHOOK_URL, backend_app, use_fake_replicate
+
+import fake_replicate  # noqa: E402
+import predictions  # noqa: E402
+
+
+def test_signed_webhook_completes_prediction(monkeypatch):
+    tracker = use_fake_replicate(monkeypatch, webhook_app=backend_app())
+
+    async def scenario():
+        prediction = await tracker.start(FAKE_MODEL, {"prompt": "un chat"})
+        assert prediction.status == "starting"
+        result, _ = await tracker.wait(prediction, max_wait_seconds=5)
+        await tracker.stop()
+        return result
+
+    result = asyncio.run(scenario())
+    assert result.status == "succeeded"
+    assert result.output == fake_replicate.FAKE_OUTPUT_URL
+    stats = tracker.get_stats()
+    assert stats["webhook_completions"] == 1
+    # Webhook reçu avant le premier contrôle du poller (WEBHOOK_FALLBACK_POLL_SECONDS)
+    assert stats["reload_calls"] == 0
+    assert stats["list_calls"] == 0
+    assert stats["in_flight"] == 0
+
+
+def test_bad_signature_is_rejected(monkeypatch):
+    tracker = use_fake_replicate(monkeypatch)
+    tracker._inflight.clear()
+    body = json.dumps({"id": "abc", "status": "succeeded", "output": "https://example.com/forged.png"})
+    webhook_id = "msg_forged"
+    timestamp = str(int(time.time()))
+
+    async def post(signature: str):
+        transport = httpx.ASGITransport(app=backend_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+            return await client.post("/replicate/webhook", content=body, headers={
+                "Content-Type": "application/json",
+                "webhook-id": webhook_id,
+                "webhook-timestamp": timestamp,
+                "webhook-signature": signature,
+            })
+
+    forged = asyncio.run(post("v1," + "A" * 44))
+    assert forged.status_code == 401
+
+    # Même requête correctement signée : acceptée (mais non suivie par ce processus)
+    valid = asyncio.run(post(fake_replicate.sign_webhook(webhook_id, timestamp, body)))
+    assert valid.status_code == 200
+    assert valid.json() == {"success": True, "delivered": False}
+
+
+def test_poller_completes_prediction_when_webhook_is_lost(monkeypatch):
+    # Le webhook part vers une application sans receveur : il n'arrive jamais
+    tracker = use_fake_replicate(monkeypatch, webhook_app=backend_app())
+    monkeypatch.setattr(fake_replicate, "webhook_transport", httpx.ASGITransport(app=fake_replicate.app))
+    monkeypatch.setattr(predictions, "WEBHOOK_FALLBACK_POLL_SECONDS", 0.2)
+    monkeypatch.setattr(predictions, "POLL_MIN_INTERVAL_SECONDS", 0.05)
+    monkeypatch.setattr(predictions, "DEFAULT_TYPICAL_SECONDS", 0.1)
+    assert tracker.webhook_params() == {"webhook": WEBHOOK_URL, "webhook_events_filter": ["completed"]}
+
+    async def scenario():
+        prediction = await tracker.start(FAKE_MODEL, {"prompt": "un chien"})
+        result, _ = await tracker.wait(prediction, max_wait_seconds=5)
+        await tracker.stop()
+        return result
+
+    result = asyncio.run(scenario())
+    assert result.status == "succeeded"
+    stats = tracker.get_stats()
+    assert stats["webhook_completions"] == 0
+    assert stats["poll_completions"] == 1
+    assert stats["reload_calls"] >= 1
@@ -0,0 +1,64 @@
+"""
+Cache des résultats de génération : durée de vie sous celle des URLs Replicate
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import providers  # noqa: E402
+import result_cache  # noqa: E402
+from result_cache import ResultCache  # noqa: E402
+
+
+def memory_cache(monkeypatch, ttl_seconds: int = result_cache.RESULT_CACHE_TTL_SECONDS) -> ResultCache:
+    monkeypatch.setattr(providers, "model_registry", providers.ModelVersionRegistry({"owner/model": "latest"}, 0))
+    return ResultCache(max_entries=8, ttl_seconds=ttl_seconds)
+
+
+def test_default_ttl_expires_before_replicate_urls():
+    assert result_cache.RESULT_CACHE_TTL_SECONDS <= result_cache.REPLICATE_OUTPUT_URL_LIFETIME_SECONDS - 300
+
+
+def test_identical_request_is_served_from_cache(monkeypatch):
+    cache = memory_cache(monkeypatch)
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        return f"https://replicate.delivery/{len(calls)}.png"
+
+    async def scenario():
+        return [await cache.fetch("owner/model", {"prompt": "un chat", "seed": 1}, generate, use_cache=True) for _ in range(2)]
+
+    assert asyncio.run(scenario()) == [("https://replicate.delivery/1.png", False), ("https://replicate.delivery/1.png", True)]
+    assert len(calls) == 1
+
+
+def test_entry_expires_after_ttl(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(result_cache, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    cache = memory_cache(monkeypatch, ttl_seconds=3000)
+
+    async def scenario():
+        await cache.set("key", "owner/model", "https://replicate.delivery/1.png")
+        before = await cache.get("key")
+        clock.now += 3001
+        return before, await cache.get("key")
+
+    assert asyncio.run(scenario()) == ("https://replicate.delivery/1.png", None)
+
+
+def test_cache_is_opt_in(monkeypatch):
+    cache = memory_cache(monkeypatch)
+
+    async def scenario():
+        first = await cache.fetch("owner/model", {"prompt": "un chat"}, lambda: asyncio.sleep(0, result="a"))
+        second = await cache.fetch("owner/model", {"prompt": "un chat"}, lambda: asyncio.sleep(0, result="b"))
+        return first, second
+
+    assert asyncio.run(scenario()) == (("a", False), ("b", False))
+    assert cache.get_stats()["bypassed"] == 2
@@ -0,0 +1,161 @@
+"""
+Ordonnanceur des générations : admission, file équitable entre demandeurs, refus 429
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import scheduler  # noqa: E402
+from scheduler import ModelLane, ModelScheduler, QueueFullError  # noqa: E402
+
+
+def test_slots_are_granted_round_robin_between_requesters():
+    lane = ModelLane("sora_2", limit=1, typical_seconds=60)
+    order = []
+
+    async def generation(requester: str, name: str):
+        token = await lane.acquire(requester, bounded=True)
+        order.append(name)
+        await asyncio.sleep(0)
+        lane.release(token)
+
+    async def scenario():
+        holder = await lane.acquire("user:holder", bounded=True)
+        # Alice met trois requêtes en file avant que Bob n'en mette une
+        tasks = [asyncio.ensure_future(generation("user:alice", f"alice-{index}")) for index in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(generation("user:bob", "bob-0")))
+        await asyncio.sleep(0)
+        assert lane.stats()["queued"] == 4
+        assert lane.stats()["waiting_users"] == 2
+        lane.release(holder)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["alice-0", "bob-0", "alice-1", "alice-2"]
+    assert lane.stats()["running"] == 0
+    assert lane.stats()["queued"] == 0
+
+
+def test_free_slot_is_taken_immediately():
+    lane = ModelLane("nano_banana", limit=2, typical_seconds=20)
+
+    async def scenario():
+        return [await lane.acquire("user:a", bounded=True), await lane.acquire("user:b", bounded=True)]
+
+    tokens = asyncio.run(scenario())
+    assert len(set(tokens)) == 2
+    assert lane.stats()["running"] == 2
+
+
+def test_per_user_queue_limit_rejects_with_retry_after(monkeypatch):
+    monkeypatch.setattr(scheduler, "MODEL_QUEUE_MAX_PER_USER", 2)
+    lane = ModelLane("sora_2", limit=1, typical_seconds=60)
+
+    async def scenario():
+        await lane.acquire("user:holder", bounded=True)
+        waiting = [asyncio.ensure_future(lane.acquire("user:alice", bounded=True)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError) as full:
+            await lane.acquire("user:alice", bounded=True)
+        # Un autre demandeur peut encore entrer en file
+        other = asyncio.ensure_future(lane.acquire("user:bob", bounded=True))
+        await asyncio.sleep(0)
+        for task in (*waiting, other):
+            task.cancel()
+        await asyncio.gather(*waiting, other, return_exceptions=True)
+        return full.value
+
+    error = asyncio.run(scenario())
+    assert error.retry_after >= 1
+    assert lane.rejected == 1
+    assert lane.stats()["queued"] == 0
+
+
+def test_global_queue_limit_and_background_jobs(monkeypatch):
+    monkeypatch.setattr(scheduler, "MODEL_QUEUE_MAX", 1)
+
+    lane = ModelLane("kling_ai_v2_1", limit=1, typical_seconds=150)
+
+    async def scenario():
+        await lane.acquire("user:holder", bounded=True)
+        queued = asyncio.ensure_future(lane.acquire("user:a", bounded=True))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await lane.acquire("user:b", bounded=True)
+        # Les jobs d'arrière-plan attendent sans limite de file
+        background = asyncio.ensure_future(lane.acquire("user:b", bounded=False))
+        await asyncio.sleep(0)
+        queued_count = lane.queued
+        for task in (queued, background):
+            task.cancel()
+        await asyncio.gather(queued, background, return_exceptions=True)
+        return queued_count
+
+    assert asyncio.run(scenario()) == 2
+    assert lane.queued == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    lane = ModelLane("sora_2", limit=1, typical_seconds=60)
+
+    async def scenario():
+        holder = await lane.acquire("user:holder", bounded=True)
+        waiter = asyncio.ensure_future(lane.acquire("user:a", bounded=True))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        lane.release(holder)
+
+    asyncio.run(scenario())
+    assert lane.stats() | {"avg_seconds": 0} == {
+        "limit": 1, "running": 0, "queued": 0, "waiting_users": 0, "rejected": 0, "avg_seconds": 0
+    }
+
+
+def test_route_decorator_answers_429_when_queue_is_full(monkeypatch):
+    monkeypatch.setattr(scheduler, "MODEL_QUEUE_MAX", 0)
+    model_scheduler = ModelScheduler()
+    model_scheduler.lanes["sora_2"].limit = 1
+    release = asyncio.Event()
+
+    @model_scheduler.limit("sora_2")
+    async def generate(async_mode: bool = False):
+        await release.wait()
+        return "ok"
+
+    async def scenario():
+        scheduler.set_requester("user:alice")
+        running = asyncio.ensure_future(generate())
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as rejected:
+            await generate()
+        release.set()
+        # Mode asynchrone : pas de place prise, la file de jobs sert de file d'attente
+        assert await generate(async_mode=True) == "ok"
+        return rejected.value, await running
+
+    rejected, result = asyncio.run(scenario())
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert result == "ok"
+
+
+def client_request(peer: str, forwarded: str = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "client": (peer, 1234), "headers": headers})
+
+
+def test_forwarded_for_is_only_trusted_from_configured_proxies(monkeypatch):
+    monkeypatch.setattr(scheduler, "TRUSTED_PROXIES", {"10.0.0.1"})
+
+    assert scheduler.client_address(client_request("1.2.3.4", "9.9.9.9")) == "1.2.3.4"
+    assert scheduler.client_address(client_request("10.0.0.1", "6.6.6.6, 5.5.5.5")) == "5.5.5.5"
+    assert scheduler.client_address(client_request("10.0.0.1")) == "10.0.0.1"
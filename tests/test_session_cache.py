@@ -0,0 +1,62 @@
+"""
+Sessions connues : confirmation sans lecture Mongo et création concurrente d'une session
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from session_cache import KnownSessions  # noqa: E402
+from tests.memory_db import MemoryCollection  # noqa: E402
+
+
+def new_session(session_id: str):
+    return lambda: {"id": session_id, "messages": []}
+
+
+def test_concurrent_first_requests_create_one_session():
+    sessions = MemoryCollection("kling_sessions", unique=("id",))
+    known = KnownSessions(max_entries=10, ttl_seconds=60)
+
+    async def scenario():
+        return await asyncio.gather(
+            known.ensure(sessions, "session-1", new_session("session-1")),
+            known.ensure(sessions, "session-1", new_session("session-1")),
+        )
+
+    assert asyncio.run(scenario()) == [True, True]
+    assert len(sessions.documents) == 1
+    assert known.get_stats()["created"] == 1
+    assert known._known("kling_sessions", "session-1")
+
+
+def test_known_session_skips_mongo():
+    sessions = MemoryCollection("grok_sessions", unique=("id",))
+    sessions.documents.append({"id": "session-1"})
+    known = KnownSessions(max_entries=10, ttl_seconds=60)
+
+    assert asyncio.run(known.ensure(sessions, "session-1")) is True
+    sessions.documents.clear()
+    assert asyncio.run(known.ensure(sessions, "session-1")) is True
+    assert known.get_stats()["hits"] == 1
+    assert known.get_stats()["lookups"] == 1
+
+
+def test_missing_session_without_create():
+    sessions = MemoryCollection("grok_sessions", unique=("id",))
+    known = KnownSessions(max_entries=10, ttl_seconds=60)
+
+    assert asyncio.run(known.ensure(sessions, "unknown")) is False
+    assert not known._known("grok_sessions", "unknown")
+
+
+def test_lru_is_bounded():
+    known = KnownSessions(max_entries=2, ttl_seconds=60)
+    for session_id in ("a", "b", "c"):
+        known.remember("kling_sessions", session_id)
+
+    assert not known._known("kling_sessions", "a")
+    assert known._known("kling_sessions", "c")
+    assert known.get_stats()["entries"] == 2
@@ -0,0 +1,131 @@
+"""
+Single-flight : clés de génération et partage des exécutions concurrentes
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from scheduler import set_requester  # noqa: E402
+from singleflight import SingleFlight, flight_key  # noqa: E402
+
+
+def test_key_ignores_whitespace_key_order_and_none_values():
+    assert flight_key("m", {"prompt": "un  chat\n", "seed": 1, "mask": None}) == flight_key("m", {"seed": 1, "prompt": "un chat"})
+
+
+def test_key_depends_on_model_and_inputs():
+    inputs = {"prompt": "un chat"}
+    assert flight_key("a/model", inputs) != flight_key("b/model", inputs)
+    assert flight_key("a/model", inputs) != flight_key("a/model", {"prompt": "un chien"})
+    assert flight_key("a/model", {"image": ["data:image/png;base64,AAAA"]}) != flight_key("a/model", {"image": ["data:image/png;base64,BBBB"]})
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "https://replicate.delivery/output.png"
+
+    async def scenario():
+        return await asyncio.gather(*(flights.do("key", generate) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["https://replicate.delivery/output.png"] * 5
+    assert len(calls) == 1
+    assert flights.get_stats() == {"in_flight": 0, "started": 1, "shared": 4}
+
+
+def test_different_keys_run_separately():
+    flights = SingleFlight()
+    calls = []
+
+    async def generate(name):
+        calls.append(name)
+        await asyncio.sleep(0.01)
+        return name
+
+    async def scenario():
+        return await asyncio.gather(flights.do("a", lambda: generate("a")), flights.do("b", lambda: generate("b")))
+
+    assert asyncio.run(scenario()) == ["a", "b"]
+    assert sorted(calls) == ["a", "b"]
+
+
+def test_finished_flight_is_not_reused():
+    flights = SingleFlight()
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        return len(calls)
+
+    async def scenario():
+        return [await flights.do("key", generate), await flights.do("key", generate)]
+
+    assert asyncio.run(scenario()) == [1, 2]
+
+
+def test_error_is_shared_by_all_waiters():
+    flights = SingleFlight()
+
+    async def generate():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("402 Insufficient credit")
+
+    async def scenario():
+        return await asyncio.gather(*(flights.do("key", generate) for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(scenario())
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert flights.get_stats()["started"] == 1
+
+
+def test_cancelled_caller_does_not_cancel_others():
+    flights = SingleFlight()
+
+    async def generate():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario():
+        first = asyncio.ensure_future(flights.do("key", generate))
+        second = asyncio.ensure_future(flights.do("key", generate))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "done"
+
+
+def test_identical_calls_are_only_shared_by_the_same_requester():
+    flights = SingleFlight()
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        output = f"https://replicate.delivery/{len(calls)}.png"
+        await asyncio.sleep(0.05)
+        return output
+
+    async def request_as(requester: str):
+        # Chaque requête HTTP a son propre contexte, comme sous FastAPI
+        set_requester(requester)
+        return await flights.do("key", generate)
+
+    async def scenario():
+        return await asyncio.gather(request_as("user:alice"), request_as("user:alice"), request_as("user:bob"))
+
+    alice, alice_again, bob = asyncio.run(scenario())
+    assert alice == alice_again
+    assert bob != alice
+    assert len(calls) == 2
+    assert flights.get_stats() == {"in_flight": 0, "started": 2, "shared": 1}
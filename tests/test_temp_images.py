@@ -0,0 +1,140 @@
+"""
+Fichiers temporaires adressés par contenu (data_url_to_public_url)
+"""
+
+import base64
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from PIL import Image  # noqa: E402
+
+import temp_images  # noqa: E402
+
+BACKEND_URL = "http://backend"
+
+
+def png_data_url(width: int, height: int, color=(200, 30, 30)) -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def use_temp_dirs(monkeypatch, tmp_path: Path) -> Path:
+    served = tmp_path / "served"
+    served.mkdir()
+    metadata = tmp_path / "metadata"
+    metadata.mkdir()
+    monkeypatch.setattr(temp_images, "TEMP_IMAGES_DIR", served)
+    monkeypatch.setattr(temp_images, "VEO_VARIANT_METADATA_DIR", metadata)
+    monkeypatch.setattr(temp_images, "veo_variant_stats", {"hits": 0, "misses": 0, "processing_ms_total": 0.0})
+    return served
+
+
+def test_same_image_is_stored_once_under_its_hash(monkeypatch, tmp_path):
+    served = use_temp_dirs(monkeypatch, tmp_path)
+    data_url = png_data_url(64, 48)
+
+    first = temp_images.data_url_to_public_url(data_url, BACKEND_URL)
+    stored = served / first.rsplit("/", 1)[1]
+    written_at = stored.stat().st_mtime_ns
+    second = temp_images.data_url_to_public_url(data_url, BACKEND_URL)
+
+    assert first == second
+    assert first.startswith(f"{BACKEND_URL}/api/temp-images/")
+    assert temp_images.CONTENT_ADDRESSED_FILENAME.match(stored.name)
+    assert [path.name for path in served.iterdir()] == [stored.name]
+    # Deuxième appel : fichier réutilisé sans nouvel encodage
+    assert stored.stat().st_mtime_ns == written_at
+    with Image.open(stored) as image:
+        assert image.format == "JPEG"
+        assert image.size == (64, 48)
+
+
+def test_different_images_get_different_urls(monkeypatch, tmp_path):
+    served = use_temp_dirs(monkeypatch, tmp_path)
+
+    red = temp_images.data_url_to_public_url(png_data_url(32, 32, (255, 0, 0)), BACKEND_URL)
+    blue = temp_images.data_url_to_public_url(png_data_url(32, 32, (0, 0, 255)), BACKEND_URL)
+
+    assert red != blue
+    assert len(list(served.iterdir())) == 2
+
+
+def test_transparent_png_is_flattened_to_rgb_jpeg(monkeypatch, tmp_path):
+    served = use_temp_dirs(monkeypatch, tmp_path)
+    buffer = io.BytesIO()
+    Image.new("RGBA", (16, 16), (0, 0, 0, 0)).save(buffer, format="PNG")
+    data_url = "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+    url = temp_images.data_url_to_public_url(data_url, BACKEND_URL)
+
+    with Image.open(served / url.rsplit("/", 1)[1]) as image:
+        assert image.mode == "RGB"
+        assert image.getpixel((0, 0)) == (255, 255, 255)
+
+
+def test_plain_urls_are_returned_unchanged(monkeypatch, tmp_path):
+    served = use_temp_dirs(monkeypatch, tmp_path)
+
+    assert temp_images.data_url_to_public_url("https://example.com/a.png", BACKEND_URL) == "https://example.com/a.png"
+    assert list(served.iterdir()) == []
+
+
+def test_veo_variant_is_cropped_once_per_geometry(monkeypatch, tmp_path):
+    served = use_temp_dirs(monkeypatch, tmp_path)
+    data_url = png_data_url(400, 300)
+
+    first = temp_images.data_url_to_public_url(data_url, BACKEND_URL, resize_for_veo=True)
+    second = temp_images.data_url_to_public_url(data_url, BACKEND_URL, resize_for_veo=True)
+
+    assert first == second
+    assert first.endswith("-veo-1280x720.jpg")
+    with Image.open(served / first.rsplit("/", 1)[1]) as image:
+        assert image.size == (1280, 720)
+    stats = temp_images.get_veo_variant_stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+
+    # Même source sans traitement Veo : fichier distinct
+    plain = temp_images.data_url_to_public_url(data_url, BACKEND_URL)
+    assert plain != first
+
+
+def test_vertical_source_gets_portrait_variant(monkeypatch, tmp_path):
+    served = use_temp_dirs(monkeypatch, tmp_path)
+
+    url = temp_images.data_url_to_public_url(png_data_url(300, 500), BACKEND_URL, resize_for_veo=True)
+
+    assert url.endswith("-veo-720x1280.jpg")
+    with Image.open(served / url.rsplit("/", 1)[1]) as image:
+        assert image.size == (720, 1280)
+
+
+def test_variant_metadata_is_not_in_served_directory(monkeypatch, tmp_path):
+    served = use_temp_dirs(monkeypatch, tmp_path)
+
+    url = temp_images.data_url_to_public_url(png_data_url(200, 200), BACKEND_URL, resize_for_veo=True)
+    filename = url.rsplit("/", 1)[1]
+
+    assert [path.name for path in served.iterdir()] == [filename]
+    sidecar = tmp_path / "metadata" / f"{filename}.json"
+    assert sidecar.is_file()
+    assert '"target_size": [1280, 720]' in sidecar.read_text()
+
+
+def test_variant_counters_are_consistent_across_threads(monkeypatch, tmp_path):
+    use_temp_dirs(monkeypatch, tmp_path)
+    data_url = png_data_url(120, 90)
+    temp_images.data_url_to_public_url(data_url, BACKEND_URL, resize_for_veo=True)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        urls = set(executor.map(
+            lambda _: temp_images.data_url_to_public_url(data_url, BACKEND_URL, resize_for_veo=True), range(200)
+        ))
+
+    assert len(urls) == 1
+    assert temp_images.get_veo_variant_stats()["hits"] == 200
@@ -0,0 +1,88 @@
+"""
+Route /api/temp-images : cache immuable, ETag fort, 304, HEAD et fichiers non servis
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import temp_images  # noqa: E402
+from http_cache import PUBLIC_IMMUTABLE  # noqa: E402
+
+HASHED_NAME = "0123456789abcdef0123456789abcdef.jpg"
+
+
+def get(monkeypatch, tmp_path, path: str, method: str = "GET", headers=None) -> httpx.Response:
+    monkeypatch.setattr(temp_images, "TEMP_IMAGES_DIR", tmp_path)
+    app = FastAPI()
+    app.include_router(temp_images.temp_images_router, prefix="/api")
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+            return await client.request(method, path, headers=headers or {})
+
+    return asyncio.run(scenario())
+
+
+def test_content_addressed_file_is_immutable(monkeypatch, tmp_path):
+    (tmp_path / HASHED_NAME).write_bytes(b"jpeg bytes")
+
+    response = get(monkeypatch, tmp_path, f"/api/temp-images/{HASHED_NAME}")
+
+    assert response.status_code == 200
+    assert response.content == b"jpeg bytes"
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["cache-control"] == PUBLIC_IMMUTABLE
+    assert not response.headers["etag"].startswith("W/")
+
+
+def test_matching_if_none_match_returns_304(monkeypatch, tmp_path):
+    (tmp_path / HASHED_NAME).write_bytes(b"jpeg bytes")
+    etag = get(monkeypatch, tmp_path, f"/api/temp-images/{HASHED_NAME}").headers["etag"]
+
+    response = get(monkeypatch, tmp_path, f"/api/temp-images/{HASHED_NAME}", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert response.headers["cache-control"] == PUBLIC_IMMUTABLE
+
+
+def test_head_returns_headers_without_body(monkeypatch, tmp_path):
+    (tmp_path / "0123456789abcdef0123456789abcdef.mp4").write_bytes(b"x" * 42)
+
+    response = get(monkeypatch, tmp_path, "/api/temp-images/0123456789abcdef0123456789abcdef.mp4", method="HEAD")
+
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["content-length"] == "42"
+    assert response.headers["content-type"] == "video/mp4"
+
+
+def test_legacy_name_gets_short_cache_and_changing_etag(monkeypatch, tmp_path):
+    legacy = tmp_path / "kling_upload.jpg"
+    legacy.write_bytes(b"old")
+    first = get(monkeypatch, tmp_path, "/api/temp-images/kling_upload.jpg")
+    legacy.write_bytes(b"newer")
+    os.utime(legacy, ns=(legacy.stat().st_atime_ns, legacy.stat().st_mtime_ns + 10**9))
+    second = get(monkeypatch, tmp_path, "/api/temp-images/kling_upload.jpg", headers={"If-None-Match": first.headers["etag"]})
+
+    assert first.headers["cache-control"] == "public, max-age=3600"
+    assert second.status_code == 200
+    assert second.content == b"newer"
+
+
+def test_in_progress_and_metadata_files_are_not_served(monkeypatch, tmp_path):
+    (tmp_path / f".{HASHED_NAME}.abc.tmp").write_bytes(b"partial")
+    (tmp_path / f"{HASHED_NAME}.json").write_text("{}")
+
+    assert get(monkeypatch, tmp_path, f"/api/temp-images/.{HASHED_NAME}.abc.tmp").status_code == 404
+    assert get(monkeypatch, tmp_path, f"/api/temp-images/{HASHED_NAME}.json").status_code == 404
+    assert get(monkeypatch, tmp_path, "/api/temp-images/missing.jpg").status_code == 404